@@ -0,0 +1,99 @@
+# Micro-benchmark do caminho de serialização JSON.
+# Compara o caminho padrão do FastAPI (jsonable_encoder + json.dumps) com
+# orjson direto e com bytes pré-serializados (snapshot do catálogo), para os
+# dois payloads mais pesados: 100 pedidos e o catálogo inteiro.
+# Execute com: python benchmarks/bench_json.py [--seconds 1] [--products 200]
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalog import CatalogSnapshot  # noqa: E402
+
+
+def make_orders(n: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "userId": str(uuid.uuid4()),
+            "items": [
+                {"productId": str(uuid.uuid4()), "name": f"Produto {j}", "price": 29.9, "quantity": 1}
+                for j in range(3)
+            ],
+            "subtotal": 89.7,
+            "discount": 8.97,
+            "total": 80.73,
+            "paymentMethod": "pix",
+            "status": "approved",
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        for _ in range(n)
+    ]
+
+
+def make_products(n: int) -> list:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Assinatura {i}",
+            "description": "Séries, filmes e música sem anúncios",
+            "platform": ["Netflix", "Spotify", "Disney+", "HBO Max"][i % 4],
+            "price": 19.9 + i,
+            "duration": "1 mês",
+            "image": "https://images.unsplash.com/photo-1637363990764-de84fd247b7d?w=800",
+            "features": ["4 telas", "Ultra HD", "Download", "Catálogo completo"],
+            "isAvailable": True,
+        }
+        for i in range(n)
+    ]
+
+
+def rate(fn, seconds: float) -> float:
+    """Execuções por segundo de fn() durante ~`seconds`."""
+    runs, start = 0, time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        runs += 1
+    return runs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=1.0)
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--products", type=int, default=200)
+    args = parser.parse_args()
+
+    orders = make_orders(args.orders)
+    products = make_products(args.products)
+    snapshot = CatalogSnapshot(products)
+
+    cases = {
+        "orders.fastapi_default": lambda: json.dumps(jsonable_encoder(orders)).encode(),
+        "orders.orjson": lambda: orjson.dumps(orders),
+        "products.fastapi_default": lambda: json.dumps(jsonable_encoder(products)).encode(),
+        "products.orjson": lambda: orjson.dumps(products),
+        "products.preencoded": lambda: snapshot.list_body,
+    }
+    results = {name: round(rate(fn, args.seconds), 1) for name, fn in cases.items()}
+    speedup = {
+        "orders.orjson": round(results["orders.orjson"] / results["orders.fastapi_default"], 1),
+        "products.orjson": round(results["products.orjson"] / results["products.fastapi_default"], 1),
+        "products.preencoded": round(results["products.preencoded"] / results["products.fastapi_default"], 1),
+    }
+    print(json.dumps({"opsPerSecond": results, "speedupVsDefault": speedup}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
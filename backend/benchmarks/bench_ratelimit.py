@@ -0,0 +1,99 @@
+# Custo do rate limiter e do descarte de carga.
+# Mede o token bucket em memória isolado (uma chave quente e muitas chaves) e
+# o custo por requisição numa app FastAPI mínima, sem limite, com a dependência
+# de rate limit por IP e com o LoadShedMiddleware. Com --mongo-url mede também
+# o bucket compartilhado no Mongo (uma ida ao banco por requisição).
+# Execute com: python benchmarks/bench_ratelimit.py [--requests 5000] [--mongo-url mongodb://127.0.0.1:27017]
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+from fastapi import Depends, FastAPI
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rate_limit import LoadShedMiddleware, MemoryBackend, MongoBackend, RateLimiter  # noqa: E402
+
+
+async def per_call_us(fn, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        await fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def make_app(limited: bool, shed: bool) -> FastAPI:
+    app = FastAPI()
+    # Orçamento alto: mede o custo do caminho "liberado", que é o caso comum
+    limiter = RateLimiter(MemoryBackend(), rules={"bench": "1000000000/1"})
+    deps = [Depends(limiter.by_ip("bench"))] if limited else []
+
+    @app.get("/ping", dependencies=deps)
+    async def ping():
+        return {"ok": True}
+
+    if shed:
+        app.add_middleware(LoadShedMiddleware, max_in_flight=1000)
+    return app
+
+
+async def http_us(app: FastAPI, n: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(200):
+            await client.get("/ping")
+        return await per_call_us(lambda _: client.get("/ping"), n)
+
+
+async def run(args) -> dict:
+    backend = MemoryBackend()
+    results = {
+        "memory.take.hotKeyUs": await per_call_us(lambda _: backend.take("hot", 1e9, 1e9), args.calls),
+        "memory.take.manyKeysUs": await per_call_us(
+            lambda i: backend.take(f"ip:{i % 100_000}", 1e9, 1e9), args.calls
+        ),
+    }
+    base = await http_us(make_app(False, False), args.requests)
+    limited = await http_us(make_app(True, False), args.requests)
+    shed = await http_us(make_app(True, True), args.requests)
+    results.update({
+        "http.baselineUs": base,
+        "http.rateLimitedUs": limited,
+        "http.rateLimitedAndShedUs": shed,
+        "http.overheadUs": shed - base,
+        "http.overheadPct": (shed - base) / base * 100,
+    })
+
+    if args.mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(args.mongo_url)
+        db = client[f"bench_ratelimit_{uuid.uuid4().hex[:8]}"]
+        try:
+            mongo = MongoBackend(db)
+            await mongo.ensure_indexes()
+            results["mongo.take.hotKeyUs"] = await per_call_us(lambda _: mongo.take("hot", 1e9, 1e9), args.requests)
+            results["mongo.take.manyKeysUs"] = await per_call_us(
+                lambda i: mongo.take(f"ip:{i}", 1e9, 1e9), args.requests
+            )
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+    return {k: round(v, 2) for k, v in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=5_000)
+    parser.add_argument("--mongo-url")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
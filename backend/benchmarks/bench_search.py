@@ -0,0 +1,93 @@
+# Latência da busca de produtos em memória.
+# Gera um catálogo sintético, monta o índice a partir do snapshot e mede
+# p50/p99 de consultas típicas (palavra inteira, prefixo de autocomplete, vários
+# termos, acentos, só filtros), com e sem o cache de resultados, e o custo de
+# reindexar depois de uma alteração.
+# Execute com: python benchmarks/bench_search.py [--products 10000] [--queries 2000]
+
+import argparse
+import json
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalog import CatalogSnapshot  # noqa: E402
+from search import SearchIndex  # noqa: E402
+
+PLATFORMS = ["Netflix", "Spotify", "Disney+", "HBO Max", "Prime Video", "Deezer", "Crunchyroll", "Globoplay"]
+WORDS = ["música", "sem anúncios", "família", "ultra hd", "séries", "filmes", "esportes", "ao vivo", "anime",
+         "clássicos", "lançamentos", "infantil", "documentários", "podcasts", "offline", "4 telas", "legendado"]
+QUERIES = ["netflix", "netf", "musica", "música sem", "ultra hd família", "dis", "anime legendado", "", "zzz"]
+
+
+def make_products(n: int) -> list:
+    rng = random.Random(42)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"{rng.choice(PLATFORMS)} {rng.choice(['Premium', 'Básico', 'Família', 'Anual'])} {i}",
+            "description": " ".join(rng.sample(WORDS, 4)),
+            "platform": rng.choice(PLATFORMS),
+            "price": round(rng.uniform(5, 80), 2),
+            "features": rng.sample(WORDS, 3),
+            "isAvailable": True,
+        }
+        for i in range(n)
+    ]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=2_000)
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    snap = CatalogSnapshot(products)
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.on_catalog_change(None, snap)
+    results = {"buildMs": round((time.perf_counter() - start) * 1000, 1), "terms": len(index._vocab)}
+
+    rng = random.Random(7)
+    cases = {
+        "q": lambda q: index.search(q),
+        "q+platform": lambda q: index.search(q, platform="netflix"),
+        "q+price": lambda q: index.search(q, min_price=10, max_price=30),
+    }
+    for name, run in cases.items():
+        # "cold": cache de resultados limpo antes de cada consulta; "cached": consultas repetidas
+        for mode in ("cold", "cached"):
+            latencies = []
+            for _ in range(args.queries):
+                q = rng.choice(QUERIES)
+                if mode == "cold":
+                    index._results.clear()
+                t = time.perf_counter()
+                run(q)
+                latencies.append((time.perf_counter() - t) * 1000)
+            results[f"{name}.{mode}"] = {
+                "p50Ms": round(percentile(latencies, 0.5), 3),
+                "p99Ms": round(percentile(latencies, 0.99), 3),
+            }
+
+    # Uma alteração de preço/nome: só o produto alterado é reindexado
+    changed = [dict(p) for p in products]
+    changed[0]["name"] = "Globoplay Premium alterado"
+    new_snap = CatalogSnapshot(changed)
+    start = time.perf_counter()
+    index.on_catalog_change(snap, new_snap)
+    results["incrementalUpdateMs"] = round((time.perf_counter() - start) * 1000, 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
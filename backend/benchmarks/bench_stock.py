@@ -0,0 +1,98 @@
+# Reservas de estoque concorrentes num único produto (flash sale).
+# Para cada quantidade de shards, N checkouts simultâneos disputam o mesmo
+# produto com estoque limitado; mede reservas/s e p50/p99 por reserva e confere
+# que nada foi vendido além do estoque (reservas aceitas + saldo = estoque).
+# Com 1 shard todos os $inc condicionais caem no mesmo documento; com mais
+# shards a disputa se espalha.
+# Execute com: python benchmarks/bench_stock.py [--mongo-url mongodb://127.0.0.1:27017] [--shards 1,4,16]
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalog import Catalog  # noqa: E402
+from dates import CODEC_OPTIONS  # noqa: E402
+from stock import OutOfStock, StockManager  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run_case(db, shards: int, args) -> dict:
+    product_id = str(uuid.uuid4())
+    await db.products.insert_one({"id": product_id, "name": "Flash Sale", "price": 9.9, "isAvailable": True})
+    catalog = Catalog(db)
+    await catalog.load()
+    manager = StockManager(db, catalog)
+    await manager.set_stock(product_id, args.stock, shards)
+
+    latencies, accepted, rejected = [], 0, 0
+    queue = iter(range(args.checkouts))
+
+    async def worker():
+        nonlocal accepted, rejected
+        for _ in queue:
+            start = time.perf_counter()
+            try:
+                await manager.reserve(str(uuid.uuid4()), [{"productId": product_id, "quantity": args.quantity}])
+                accepted += 1
+            except OutOfStock:
+                rejected += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    left = await manager.available(product_id)
+    return {
+        "shards": shards,
+        "accepted": accepted,
+        "rejected": rejected,
+        "reservationsPerSecond": round(args.checkouts / elapsed, 1),
+        "p50Ms": round(percentile(latencies, 0.50), 2),
+        "p99Ms": round(percentile(latencies, 0.99), 2),
+        "stockLeft": left,
+        "oversold": accepted * args.quantity + left != args.stock or left < 0,
+    }
+
+
+async def run(args) -> list:
+    client = AsyncIOMotorClient(args.mongo_url, **CODEC_OPTIONS)
+    db = client[f"bench_stock_{uuid.uuid4().hex[:8]}"]
+    try:
+        await StockManager(db, None).ensure_indexes()
+        return [await run_case(db, shards, args) for shards in args.shards]
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-url", default="mongodb://127.0.0.1:27017")
+    parser.add_argument("--shards", default=[1, 4, 16], type=lambda s: [int(n) for n in s.split(",")])
+    parser.add_argument("--stock", type=int, default=2_000)
+    parser.add_argument("--checkouts", type=int, default=3_000, help="mais que o estoque: testa o esgotamento")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--quantity", type=int, default=1)
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if any(r["oversold"] for r in results):
+        sys.exit("❌ estoque inconsistente")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+# Teste de carga reproduzível do backend.
+# Sobe o fake_mp.py (gateway falso com latência/erros configuráveis) e o
+# server:app com uvicorn apontando para um mongod local e um banco descartável,
+# roda cenários concorrentes (navegação, carrinho, login, checkout PIX e
+# tempestade de webhooks) e imprime p50/p95/p99 e req/s por endpoint em JSON.
+# Guarde o JSON de um commit e passe em --compare no próximo para ver a diferença.
+#
+# Execute com (de dentro de backend/):
+#   python benchmarks/loadtest.py --duration 20 --concurrency 50 --output bench.json
+#   python benchmarks/loadtest.py --spawn-mongod          # mongod temporário (binário no PATH)
+#   python benchmarks/loadtest.py --compare bench.json    # compara com uma execução anterior
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from pymongo import MongoClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ("browse", "cart", "login", "pix", "webhook")
+PASSWORD = "benchmark-123"
+
+
+# ---------- medição ----------
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client: httpx.AsyncClient, label: str, method: str, url: str, ok=(200, 201, 304), **kwargs):
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.latencies[label].append(time.perf_counter() - start)
+            self.errors[label] += 1
+            self.statuses[label][type(e).__name__] += 1
+            return None
+        self.latencies[label].append(time.perf_counter() - start)
+        self.statuses[label][str(resp.status_code)] += 1
+        if resp.status_code not in ok:
+            self.errors[label] += 1
+        return resp
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for label, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        endpoints[label] = {
+            "requests": len(values),
+            "errors": recorder.errors[label],
+            "rps": round(len(values) / elapsed, 1),
+            "p50Ms": round(percentile(values, 50) * 1000, 2),
+            "p95Ms": round(percentile(values, 95) * 1000, 2),
+            "p99Ms": round(percentile(values, 99) * 1000, 2),
+            "maxMs": round(values[-1] * 1000, 2),
+            "statuses": dict(recorder.statuses[label]),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "seconds": round(elapsed, 2),
+        "requests": total,
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "rps": round(total / elapsed, 1) if elapsed else 0,
+        "endpoints": endpoints,
+    }
+
+
+# ---------- cenários ----------
+class Context:
+    def __init__(self, products: list, users: list):
+        self.products = products
+        self.users = users
+        self.payment_ids: list = []
+
+
+def customer(email: str) -> dict:
+    return {
+        "email": email,
+        "firstName": "Carga",
+        "lastName": "Teste",
+        "phone": "11999999999",
+        "address": "Av. Paulista, 1000",
+        "city": "São Paulo",
+        "postalCode": "01310100",
+        "country": "BR",
+        "identification": {"type": "CPF", "number": "19119119100"},
+    }
+
+
+async def browse(client, rec: Recorder, ctx: Context):
+    await rec.call(client, "GET /api/products", "GET", "/api/products")
+    product = random.choice(ctx.products)
+    await rec.call(client, "GET /api/products/{id}", "GET", f"/api/products/{product['id']}")
+    await rec.call(
+        client, "GET /api/products?platform", "GET", "/api/products",
+        params={"platform": product["platform"], "limit": 20},
+    )
+
+
+async def cart(client, rec: Recorder, ctx: Context):
+    session_id = f"bench-{uuid.uuid4().hex}"
+    first, second = random.sample(ctx.products, 2)
+    await rec.call(client, "POST /api/cart/{sid}/add", "POST", f"/api/cart/{session_id}/add",
+                   json={"productId": first["id"], "quantity": 1})
+    await rec.call(client, "POST /api/cart/{sid}/add", "POST", f"/api/cart/{session_id}/add",
+                   json={"productId": second["id"], "quantity": 1})
+    await rec.call(client, "PATCH /api/cart/{sid}/item/{pid}", "PATCH", f"/api/cart/{session_id}/item/{first['id']}",
+                   json={"quantity": 2})
+    await rec.call(client, "GET /api/cart/{sid}/quote", "GET", f"/api/cart/{session_id}/quote",
+                   params={"couponCode": "BEMVINDO10"})
+    await rec.call(client, "GET /api/cart/{sid}", "GET", f"/api/cart/{session_id}")
+
+
+async def login(client, rec: Recorder, ctx: Context):
+    email = random.choice(ctx.users)
+    await rec.call(client, "POST /api/auth/login", "POST", "/api/auth/login",
+                   json={"email": email, "password": PASSWORD})
+
+
+async def pix_checkout(client, rec: Recorder, ctx: Context):
+    product = random.choice(ctx.products)
+    price = product["price"]
+    body = {
+        "paymentData": {"paymentMethodId": "pix", "transactionAmount": price},
+        "customerInfo": customer(f"pix-{uuid.uuid4().hex[:8]}@loadtest.com.br"),
+        "items": [{"productId": product["id"], "name": product["name"], "price": price, "quantity": 1}],
+        "subtotal": price,
+        "discount": 0,
+        "total": price,
+        "sessionId": f"bench-{uuid.uuid4().hex}",
+        "paymentMethod": "pix",
+    }
+    resp = await rec.call(client, "POST /api/payments/process", "POST", "/api/payments/process",
+                          json=body, headers={"Idempotency-Key": uuid.uuid4().hex})
+    if resp is None or resp.status_code != 200:
+        return
+    data = resp.json()
+    if data.get("paymentId"):
+        ctx.payment_ids.append(data["paymentId"])
+        await rec.call(client, "GET /api/payments/status/{id}", "GET", f"/api/payments/status/{data['paymentId']}")
+    await rec.call(client, "GET /api/payments/order/{id}", "GET", f"/api/payments/order/{data['orderId']}")
+
+
+async def webhook_storm(client, rec: Recorder, ctx: Context):
+    # O MercadoPago reenvia a mesma notificação várias vezes: poucos ids, muitas entregas
+    payment_id = random.choice(ctx.payment_ids[:50])
+    payload = {"type": "payment", "action": "payment.updated", "data": {"id": payment_id}}
+    await rec.call(client, "POST /api/webhooks/mercadopago", "POST", "/api/webhooks/mercadopago", json=payload)
+
+
+SCENARIO_FNS = {
+    "browse": browse,
+    "cart": cart,
+    "login": login,
+    "pix": pix_checkout,
+    "webhook": webhook_storm,
+}
+
+
+async def run_scenario(base_url: str, name: str, ctx: Context, duration: float, concurrency: int) -> dict:
+    rec = Recorder()
+    fn = SCENARIO_FNS[name]
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                await fn(client, rec, ctx)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return summarize(rec, elapsed)
+
+
+# ---------- preparação ----------
+async def prepare(base_url: str, users: int) -> Context:
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        (await client.post("/api/seed")).raise_for_status()
+        products = (await client.get("/api/products")).json()
+        emails = [f"bench-{i}@loadtest.com.br" for i in range(users)]
+        sem = asyncio.Semaphore(8)
+
+        async def register(email):
+            async with sem:
+                resp = await client.post("/api/auth/register", json={
+                    "email": email, "password": PASSWORD, "firstName": "Carga", "lastName": "Teste",
+                })
+                # 400 = já cadastrado numa execução anterior (--keep-db / --base-url)
+                if resp.status_code not in (200, 400):
+                    resp.raise_for_status()
+
+        await asyncio.gather(*(register(e) for e in emails))
+    ctx = Context(products, emails)
+    if len(products) < 2:
+        raise SystemExit("Catálogo precisa de pelo menos 2 produtos")
+    return ctx
+
+
+async def flip_payments(mp_url: str, payment_ids: list):
+    # Aprova os pagamentos no gateway falso para os webhooks terem o que aplicar
+    async with httpx.AsyncClient(base_url=mp_url, timeout=10) as client:
+        for pid in payment_ids[:50]:
+            await client.post(f"/__fake/payments/{pid}/status/approved")
+
+
+async def run_all(args, base_url: str, mp_url: str) -> dict:
+    ctx = await prepare(base_url, args.users)
+    results = {}
+    for name in args.scenarios:
+        if name == "webhook":
+            if not ctx.payment_ids:
+                # Sem checkout anterior: gera alguns pagamentos só para ter ids válidos
+                await run_scenario(base_url, "pix", ctx, 2, min(args.concurrency, 10))
+            if not ctx.payment_ids:
+                raise SystemExit("Nenhum checkout PIX concluído; não há pagamentos para os webhooks")
+            await flip_payments(mp_url, ctx.payment_ids)
+        print(f"▶ {name} ({args.duration:.0f}s, {args.concurrency} conexões)", file=sys.stderr)
+        results[name] = await run_scenario(base_url, name, ctx, args.duration, args.concurrency)
+    return results
+
+
+# ---------- processos ----------
+def wait_http(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Timeout esperando {url}")
+
+
+def start_process(cmd: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_process(proc: subprocess.Popen):
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def spawn_mongod(port: int):
+    binary = shutil.which("mongod")
+    if not binary:
+        raise SystemExit("mongod não encontrado no PATH")
+    dbpath = tempfile.mkdtemp(prefix="loadtest-mongo-")
+    proc = subprocess.Popen(
+        [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    client = MongoClient(f"mongodb://127.0.0.1:{port}", serverSelectionTimeoutMS=20000)
+    client.admin.command("ping")
+    client.close()
+    return proc, dbpath
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """Diferença percentual de p95 e req/s por endpoint em relação a uma execução anterior."""
+    diff = {}
+    for scenario, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base:
+            continue
+        for label, stats in result["endpoints"].items():
+            old = base["endpoints"].get(label)
+            if not old:
+                continue
+            diff[f"{scenario}: {label}"] = {
+                "p95Ms": [old["p95Ms"], stats["p95Ms"], _pct(old["p95Ms"], stats["p95Ms"])],
+                "rps": [old["rps"], stats["rps"], _pct(old["rps"], stats["rps"])],
+            }
+    return diff
+
+
+def _pct(old: float, new: float) -> str:
+    return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), type=lambda s: [x for x in s.split(",") if x])
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20, help="usuários pré-cadastrados para o cenário de login")
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://127.0.0.1:27017"))
+    parser.add_argument("--spawn-mongod", action="store_true", help="sobe um mongod temporário na porta 27117")
+    parser.add_argument("--keep-db", action="store_true")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--mp-port", type=int, default=9001)
+    parser.add_argument("--mp-latency-ms", type=float, default=100)
+    parser.add_argument("--mp-jitter-ms", type=float, default=50)
+    parser.add_argument("--mp-error-rate", type=float, default=0)
+    parser.add_argument("--rate-limits", action="store_true", help="mantém os limites por IP/sessão ligados")
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn para o server:app")
+    parser.add_argument("--base-url", help="não sobe nada; usa um servidor (e --mp-url) já rodando")
+    parser.add_argument("--mp-url")
+    parser.add_argument("--output", help="grava o JSON também neste arquivo")
+    parser.add_argument("--compare", help="JSON de uma execução anterior")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(unknown))}")
+
+    procs, mongod, dbpath = [], None, None
+    db_name = f"loadtest_{uuid.uuid4().hex[:8]}"
+    mongo_url = args.mongo_url
+    try:
+        if args.base_url:
+            base_url, mp_url = args.base_url.rstrip("/"), (args.mp_url or f"http://127.0.0.1:{args.mp_port}")
+        else:
+            if args.spawn_mongod:
+                mongod, dbpath = spawn_mongod(27117)
+                mongo_url = "mongodb://127.0.0.1:27117"
+            env = {
+                **os.environ,
+                "FAKE_MP_LATENCY_MS": str(args.mp_latency_ms),
+                "FAKE_MP_JITTER_MS": str(args.mp_jitter_ms),
+                "FAKE_MP_ERROR_RATE": str(args.mp_error_rate),
+                "MONGO_URL": mongo_url,
+                "DB_NAME": db_name,
+                "MERCADOPAGO_API_URL": f"http://127.0.0.1:{args.mp_port}",
+                "MERCADOPAGO_ACCESS_TOKEN": os.getenv("MERCADOPAGO_ACCESS_TOKEN", "TEST-loadtest"),
+                "JWT_SECRET": os.getenv("JWT_SECRET", "loadtest"),
+                "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+                # Todo o tráfego sai de um IP só; sem isso login e checkout medem só 429
+                "RATE_LIMIT_ENABLED": "true" if args.rate_limits else "false",
+            }
+            uvicorn = [sys.executable, "-m", "uvicorn", "--no-access-log"]
+            procs.append(start_process([*uvicorn, "fake_mp:app", "--port", str(args.mp_port)], env))
+            procs.append(start_process(
+                [*uvicorn, "server:app", "--port", str(args.port), "--workers", str(args.workers)], env,
+            ))
+            base_url, mp_url = f"http://127.0.0.1:{args.port}", f"http://127.0.0.1:{args.mp_port}"
+            wait_http(f"{mp_url}/v1/payments/0")
+            wait_http(f"{base_url}/api/health")
+
+        scenarios = asyncio.run(run_all(args, base_url, mp_url))
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "config": {
+                "duration": args.duration,
+                "concurrency": args.concurrency,
+                "workers": args.workers,
+                "rateLimits": args.rate_limits,
+                "mpLatencyMs": args.mp_latency_ms,
+                "mpJitterMs": args.mp_jitter_ms,
+                "mpErrorRate": args.mp_error_rate,
+            },
+            "scenarios": scenarios,
+        }
+        if args.compare:
+            report["compare"] = compare(report, json.loads(Path(args.compare).read_text()))
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        print(output)
+        if args.output:
+            Path(args.output).write_text(output)
+    finally:
+        for proc in reversed(procs):
+            stop_process(proc)
+        if not args.base_url and not args.keep_db:
+            try:
+                client = MongoClient(mongo_url, serverSelectionTimeoutMS=2000)
+                client.drop_database(db_name)
+                client.close()
+            except Exception:
+                pass
+        if mongod:
+            stop_process(mongod)
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Armazenamento de carrinhos.
+# Um documento por sessão: {sessionId, userId?, items: [{productId, quantity}], updatedAt}.
+# Alterações por item usam operações atômicas ($inc/$set posicional/$push/$pull)
+# em vez de regravar a lista inteira, e updatedAt é um datetime BSON de verdade
+# para o índice TTL expirar carrinhos abandonados.
+# Carrinho de visitante (sem userId) pode ser alterado por quem tem o sessionId;
+# depois de associado a um usuário, só por ele (CartNotOwned).
+
+import os
+from typing import List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from dates import utcnow
+
+CART_TTL_DAYS = int(os.getenv("CART_TTL_DAYS", 30))
+
+
+class CartNotOwned(Exception):
+    pass
+
+
+class CartStore:
+    def __init__(self, db):
+        self.carts = db.carts
+
+    async def ensure_indexes(self):
+        await self.carts.create_index("sessionId", unique=True)
+        await self.carts.create_index([("userId", 1), ("updatedAt", -1)], sparse=True)
+        await self.carts.create_index("updatedAt", expireAfterSeconds=CART_TTL_DAYS * 86400)
+
+    @staticmethod
+    def _mine(session_id: str, user_id: Optional[str], **extra) -> dict:
+        """Filtro do carrinho da sessão que `user_id` pode alterar: de visitante ou dele mesmo."""
+        return {"sessionId": session_id, "userId": {"$in": [None, user_id]}, **extra}
+
+    async def _check_owner(self, session_id: str, user_id: Optional[str]):
+        cart = await self.carts.find_one({"sessionId": session_id}, {"_id": 0, "userId": 1})
+        if cart and cart.get("userId") not in (None, user_id):
+            raise CartNotOwned(session_id)
+
+    def _touch(self, user_id: Optional[str]) -> dict:
+        fields = {"updatedAt": utcnow()}
+        if user_id:
+            fields["userId"] = user_id
+        return fields
+
+    async def get(self, session_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        # Duas buscas indexadas no lugar de um $or sobre sessionId/userId
+        if user_id:
+            cart = await self.carts.find_one({"userId": user_id}, {"_id": 0}, sort=[("updatedAt", -1)])
+            if cart:
+                return cart
+        return await self.carts.find_one({"sessionId": session_id}, {"_id": 0})
+
+    async def replace(self, session_id: str, items: List[dict], user_id: Optional[str] = None):
+        try:
+            await self.carts.update_one(
+                self._mine(session_id, user_id),
+                {"$set": {"items": items, **self._touch(user_id)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # O filtro não casou porque o carrinho da sessão é de outro usuário
+            raise CartNotOwned(session_id)
+
+    async def add_item(self, session_id: str, product_id: str, quantity: int, user_id: Optional[str] = None):
+        """Soma `quantity` (pode ser negativo) ao item; itens zerados saem do carrinho."""
+        touch = self._touch(user_id)
+        res = await self.carts.update_one(
+            self._mine(session_id, user_id, **{"items.productId": product_id}),
+            {"$inc": {"items.$.quantity": quantity}, "$set": touch},
+        )
+        if res.matched_count == 0:
+            if quantity <= 0:
+                return await self._check_owner(session_id, user_id)
+            if not await self._push(session_id, product_id, quantity, user_id, touch):
+                # Outra requisição inseriu o item entre as duas operações
+                return await self.add_item(session_id, product_id, quantity, user_id)
+        elif quantity < 0:
+            await self.carts.update_one(
+                self._mine(session_id, user_id),
+                {"$pull": {"items": {"productId": product_id, "quantity": {"$lte": 0}}}},
+            )
+
+    async def set_quantity(self, session_id: str, product_id: str, quantity: int, user_id: Optional[str] = None):
+        if quantity <= 0:
+            return await self.remove_item(session_id, product_id, user_id)
+        touch = self._touch(user_id)
+        res = await self.carts.update_one(
+            self._mine(session_id, user_id, **{"items.productId": product_id}),
+            {"$set": {"items.$.quantity": quantity, **touch}},
+        )
+        if res.matched_count == 0 and not await self._push(session_id, product_id, quantity, user_id, touch):
+            await self.set_quantity(session_id, product_id, quantity, user_id)
+
+    async def _push(self, session_id: str, product_id: str, quantity: int, user_id: Optional[str], touch: dict) -> bool:
+        try:
+            await self.carts.update_one(
+                self._mine(session_id, user_id, **{"items.productId": {"$ne": product_id}}),
+                {"$push": {"items": {"productId": product_id, "quantity": quantity}}, "$set": touch},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # O carrinho existe e já tem o item (o upsert tentou criar outro documento),
+            # ou é de outro usuário
+            await self._check_owner(session_id, user_id)
+            return False
+
+    async def remove_item(self, session_id: str, product_id: str, user_id: Optional[str] = None):
+        res = await self.carts.update_one(
+            self._mine(session_id, user_id),
+            {"$pull": {"items": {"productId": product_id}}, "$set": self._touch(user_id)},
+        )
+        if res.matched_count == 0:
+            await self._check_owner(session_id, user_id)
+
+    async def clear(self, session_id: str, user_id: Optional[str] = None):
+        """Apaga o carrinho da sessão; carrinho associado a um usuário só pelo próprio usuário."""
+        res = await self.carts.delete_one(self._mine(session_id, user_id))
+        if res.deleted_count == 0:
+            await self._check_owner(session_id, user_id)
+
+    async def merge(self, session_id: str, user_id: str) -> Optional[dict]:
+        """
+        Junta o carrinho de visitante (sessionId) com os carrinhos salvos do usuário.
+        Determinístico e idempotente: para cada produto fica a maior quantidade
+        (repetir o login não dobra itens), na ordem em que apareceram primeiro
+        no carrinho do usuário e depois no da sessão.
+        """
+        # Carrinho da sessão já associado a outro usuário não é absorvido
+        guest = await self.carts.find_one(self._mine(session_id, user_id))
+        if not guest or not guest.get("items"):
+            return None
+        others = await self.carts.find(
+            {"userId": user_id, "sessionId": {"$ne": session_id}}
+        ).sort("updatedAt", -1).to_list(None)
+
+        merged: dict = {}
+        for cart in [*others, guest]:
+            for item in cart.get("items", []):
+                pid = item["productId"]
+                merged[pid] = max(merged.get(pid, 0), item["quantity"])
+        items = [{"productId": pid, "quantity": qty} for pid, qty in merged.items() if qty > 0]
+
+        cart = await self.carts.find_one_and_update(
+            self._mine(session_id, user_id),
+            {"$set": {"items": items, **self._touch(user_id)}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        if others:
+            await self.carts.delete_many({"_id": {"$in": [c["_id"] for c in others]}})
+        return cart
@@ -0,0 +1,130 @@
+# Snapshot do catálogo de produtos em memória.
+# O catálogo muda poucas vezes por dia, então GET /products e /products/{id}
+# servem bytes JSON já serializados, com ETag, a partir de um snapshot
+# versionado. A atualização roda em background: change stream do Mongo quando
+# disponível (replica set / Atlas) ou polling do hash do conteúdo como fallback.
+# Se o Mongo cair, o último snapshot continua sendo servido.
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+import orjson
+from pymongo.errors import OperationFailure, PyMongoError
+
+from dates import utcnow
+
+logger = logging.getLogger(__name__)
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value, default=str)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+class CatalogSnapshot:
+    def __init__(self, products: List[dict]):
+        self.products = products
+        self.by_id: Dict[str, dict] = {p["id"]: p for p in products}
+        self.list_body = dumps(products)
+        self.etag = make_etag(self.list_body)
+        self.version = self.etag.strip('"')
+        self.item_bodies: Dict[str, bytes] = {p["id"]: dumps(p) for p in products}
+        self.item_etags: Dict[str, str] = {pid: make_etag(body) for pid, body in self.item_bodies.items()}
+        self.loaded_at = utcnow()
+
+
+class Catalog:
+    def __init__(self, db, poll_interval: Optional[float] = None):
+        self.db = db
+        self.poll_interval = poll_interval or float(os.getenv("CATALOG_POLL_INTERVAL", 30))
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self.mode = "stopped"
+        # Chamados com (snapshot_antigo, snapshot_novo) a cada troca de versão
+        self.listeners: List[Callable[[Optional[CatalogSnapshot], CatalogSnapshot], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> bool:
+        """Relê a coleção; troca o snapshot só se o conteúdo mudou."""
+        async with self._lock:
+            products = await self.db.products.find({}, {"_id": 0}).sort("id", 1).to_list(None)
+            new = CatalogSnapshot(products)
+            old = self.snapshot
+            if old and old.version == new.version:
+                return False
+            self.snapshot = new
+        logger.info(f"📦 Catálogo carregado: {len(products)} produtos (versão {new.version[:8]})")
+        for listener in self.listeners:
+            try:
+                listener(old, new)
+            except Exception as e:
+                logger.error(f"Erro em listener do catálogo: {e}", exc_info=True)
+        return True
+
+    async def get(self) -> CatalogSnapshot:
+        if self.snapshot is None:
+            await self.load()
+        return self.snapshot
+
+    async def start(self):
+        try:
+            await self.load()
+        except PyMongoError as e:
+            logger.error(f"Falha ao carregar catálogo na inicialização: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.mode = "stopped"
+
+    async def _run(self):
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                # Mongo standalone não suporta change streams
+                logger.info(f"Change stream indisponível ({e.code}); usando polling a cada {self.poll_interval:.0f}s")
+                await self._poll()
+            except PyMongoError as e:
+                logger.warning(f"Change stream do catálogo caiu: {e}; reconectando")
+                self.mode = "reconnecting"
+                await asyncio.sleep(self.poll_interval)
+                await self._safe_load()
+            except Exception:
+                # Erro inesperado (driver sem watch, bug): o snapshot continua sendo atualizado por polling
+                logger.exception("Erro no change stream do catálogo; usando polling")
+                await self._poll()
+
+    async def _watch(self):
+        async with self.db.products.watch() as stream:
+            self.mode = "change_stream"
+            # Pode ter mudado algo entre o load inicial e a abertura do stream
+            await self._safe_load()
+            async for _ in stream:
+                await self._safe_load()
+
+    async def _poll(self):
+        self.mode = "polling"
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self._safe_load()
+
+    async def _safe_load(self):
+        try:
+            await self.load()
+        except PyMongoError as e:
+            logger.warning(f"Falha ao atualizar catálogo, mantendo versão atual: {e}")
+        except Exception:
+            logger.exception("Erro ao atualizar catálogo, mantendo versão atual")
@@ -0,0 +1,154 @@
+# Cupons: validade, limite total de usos e limite por cliente.
+# Consultas passam por um cache em memória por código, positivo (cupom ativo)
+# e negativo (código inexistente/inativo), então tentativas repetidas de
+# códigos inválidos não chegam ao Mongo. A janela de validade (startsAt/endsAt)
+# é conferida a cada uso, mesmo com o cupom em cache.
+# O uso é contado no pagamento: $inc condicional em coupons.uses (só se
+# uses < maxUses) e em coupon_usage por cliente (só se count < perUserLimit;
+# o cliente é o usuário autenticado ou o documento, nunca e-mail/userId do corpo),
+# com o registro em coupon_redemptions. Pedido que falha ou expira devolve o uso.
+
+import logging
+import os
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from cache import TTLCache
+from dates import to_utc, utcnow
+
+logger = logging.getLogger(__name__)
+
+COUPON_CACHE_TTL = float(os.getenv("COUPON_CACHE_TTL", 30))
+COUPON_NEGATIVE_TTL = float(os.getenv("COUPON_NEGATIVE_TTL", 60))
+COUPON_CACHE_SIZE = int(os.getenv("COUPON_CACHE_SIZE", 50_000))
+
+_INVALID = {}
+
+
+class CouponError(Exception):
+    pass
+
+
+class CouponStore:
+    def __init__(self, db):
+        self.coupons = db.coupons
+        self.usage = db.coupon_usage
+        self.redemptions = db.coupon_redemptions
+        self.cache = TTLCache(maxsize=COUPON_CACHE_SIZE, ttl=COUPON_CACHE_TTL)
+
+    async def ensure_indexes(self):
+        await self.coupons.create_index("code", unique=True)
+        await self.redemptions.create_index("orderId", unique=True)
+
+    async def _load(self, code: str) -> Optional[dict]:
+        coupon = self.cache.get(code)
+        if coupon is None:
+            coupon = await self.coupons.find_one({"code": code, "isActive": True}, {"_id": 0}) or _INVALID
+            self.cache.set(code, coupon, None if coupon else COUPON_NEGATIVE_TTL)
+        return coupon or None
+
+    async def find(self, code: str) -> Optional[dict]:
+        """Cupom ativo, dentro da validade e com usos disponíveis; None caso contrário."""
+        coupon = await self._load(code.strip().upper())
+        if not coupon:
+            return None
+        now = utcnow()
+        starts, ends = to_utc(coupon.get("startsAt")), to_utc(coupon.get("endsAt"))
+        if (starts and now < starts) or (ends and now >= ends):
+            return None
+        if coupon.get("maxUses") is not None and coupon.get("uses", 0) >= coupon["maxUses"]:
+            return None
+        return coupon
+
+    async def save(self, code: str, fields: dict) -> dict:
+        code = code.strip().upper()
+        coupon = await self.coupons.find_one_and_update(
+            {"code": code},
+            {"$set": fields, "$setOnInsert": {"uses": 0}},
+            upsert=True,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+        self.cache.pop(code)
+        return coupon
+
+    async def redeem(self, code: str, order_id: str, customer: Optional[str]):
+        """Conta um uso do cupom para o pedido; CouponError se inválido, esgotado ou no limite do cliente."""
+        coupon = await self.find(code)
+        if not coupon:
+            raise CouponError("Cupom inválido")
+        code = coupon["code"]
+        usage_id = None
+        limit = coupon.get("perUserLimit")
+        if limit:
+            # Sem login nem documento não há como contar o limite por cliente
+            if not customer:
+                raise CouponError("Entre na sua conta ou informe o CPF para usar este cupom")
+            usage_id = f"{code}:{customer}"
+            try:
+                # Com o limite atingido o filtro não casa e o upsert colide com o _id existente
+                await self.usage.update_one(
+                    {"_id": usage_id, "count": {"$lt": limit}}, {"$inc": {"count": 1}}, upsert=True
+                )
+            except DuplicateKeyError:
+                raise CouponError("Você já atingiu o limite de uso deste cupom")
+
+        now = utcnow()
+        query = {
+            "code": code,
+            "isActive": True,
+            "$and": [
+                {"$or": [{"startsAt": None}, {"startsAt": {"$lte": now}}]},
+                {"$or": [{"endsAt": None}, {"endsAt": {"$gt": now}}]},
+                # Sempre no filtro, mesmo que o cupom em cache não tenha limite (admin pode ter
+                # definido maxUses em outro worker depois que este leu o cupom)
+                {"$or": [{"maxUses": None}, {"$expr": {"$lt": [{"$ifNull": ["$uses", 0]}, "$maxUses"]}}]},
+            ],
+        }
+        counted = False
+        try:
+            result = await self.coupons.update_one(query, {"$inc": {"uses": 1}})
+            if not result.modified_count:
+                self.cache.pop(code)
+                raise CouponError("Cupom esgotado ou expirado")
+            counted = True
+            await self.redemptions.insert_one({
+                "orderId": order_id,
+                "code": code,
+                "usageId": usage_id,
+                "status": "active",
+                "createdAt": now,
+            })
+        except BaseException:
+            await self._give_back(code if counted else None, usage_id)
+            raise
+
+    async def _give_back(self, code: Optional[str], usage_id: Optional[str]):
+        if code:
+            await self.coupons.update_one({"code": code}, {"$inc": {"uses": -1}})
+        if usage_id:
+            await self.usage.update_one({"_id": usage_id}, {"$inc": {"count": -1}})
+
+    async def release(self, order_id: str) -> bool:
+        """Devolve o uso do cupom de um pedido que não foi pago."""
+        try:
+            redemption = await self.redemptions.find_one_and_update(
+                {"orderId": order_id, "status": "active"},
+                {"$set": {"status": "released", "releasedAt": utcnow()}},
+            )
+            if not redemption:
+                return False
+            await self._give_back(redemption["code"], redemption.get("usageId"))
+        except PyMongoError as e:
+            logger.error(f"Falha ao devolver uso de cupom do pedido {order_id}: {e}")
+            return False
+        logger.info(f"🎟️ Uso do cupom {redemption['code']} devolvido (pedido {order_id})")
+        return True
+
+    async def on_status_changes(self, changes: list):
+        """Listener do OrderStatusUpdater."""
+        for change in changes:
+            if change["status"] in ("failed", "expired"):
+                await self.release(change["orderId"])
@@ -0,0 +1,30 @@
+# Datas no banco são sempre BSON Date em UTC, nunca strings ISO.
+# O cliente do Mongo é criado com tz_aware=True/tzinfo=UTC (server.py), então
+# leituras também voltam como datetime com fuso. to_utc() normaliza o que vem
+# de fora (ISO do MercadoPago, query string, documentos antigos com string).
+
+from datetime import datetime, timezone
+from typing import Optional
+
+CODEC_OPTIONS = {"tz_aware": True, "tzinfo": timezone.utc}
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def to_utc(value) -> Optional[datetime]:
+    """datetime (sem fuso = UTC) ou string ISO 8601 -> datetime em UTC; None se não der."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            # Python 3.11 aceita o sufixo Z; offsets como -04:00 (MercadoPago) também
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
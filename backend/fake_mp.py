@@ -0,0 +1,102 @@
+# Gateway MercadoPago falso para testes de carga locais.
+# Execute com: FAKE_MP_LATENCY_MS=150 FAKE_MP_ERROR_RATE=0.01 uvicorn fake_mp:app --port 9001
+# e suba o server.py com MERCADOPAGO_API_URL=http://127.0.0.1:9001
+
+import asyncio
+import base64
+import os
+import random
+from datetime import datetime, timezone, timedelta
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LATENCY_MS = float(os.getenv("FAKE_MP_LATENCY_MS", 100))
+JITTER_MS = float(os.getenv("FAKE_MP_JITTER_MS", 50))
+ERROR_RATE = float(os.getenv("FAKE_MP_ERROR_RATE", 0))
+
+app = FastAPI(title="Fake MercadoPago")
+payments: dict = {}
+by_idempotency_key: dict = {}
+_next_id = 1_000_000_000
+
+# PNG 1x1 repetido só para simular o tamanho de um QR code real (~10 KB)
+_QR_PNG = base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"\x00" * 10_000).decode()
+
+
+async def _simulate():
+    delay = LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)
+    await asyncio.sleep(max(delay, 0) / 1000)
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        return JSONResponse({"message": "internal_error", "status": 500, "cause": []}, status_code=500)
+    return None
+
+
+@app.post("/v1/payments")
+async def create_payment(request: Request):
+    global _next_id
+    if (err := await _simulate()) is not None:
+        return err
+    key = request.headers.get("X-Idempotency-Key")
+    if key and key in by_idempotency_key:
+        return JSONResponse(payments[by_idempotency_key[key]], status_code=201)
+
+    body = await request.json()
+    _next_id += 1
+    method = body.get("payment_method_id")
+    now = datetime.now(timezone.utc)
+    pay = {
+        "id": _next_id,
+        "status": "approved" if body.get("token") else "pending",
+        "status_detail": "accredited" if body.get("token") else "pending_waiting_transfer",
+        "payment_method_id": method,
+        "transaction_amount": body.get("transaction_amount"),
+        "external_reference": body.get("external_reference"),
+        "date_created": now.isoformat(),
+        "date_of_expiration": None,
+    }
+    if method == "pix":
+        pay["date_of_expiration"] = (now + timedelta(minutes=30)).isoformat()
+        pay["point_of_interaction"] = {
+            "transaction_data": {"qr_code": f"00020126FAKEPIX{_next_id}", "qr_code_base64": _QR_PNG},
+        }
+    elif method == "bolbradesco":
+        pay["date_of_expiration"] = (now + timedelta(days=3)).isoformat()
+        pay["transaction_details"] = {
+            "external_resource_url": f"https://fake-mp.local/boleto/{_next_id}",
+            "digitable_line": f"23790.00000 00000.000000 00000.000000 0 {_next_id}",
+        }
+
+    payments[_next_id] = pay
+    if key:
+        by_idempotency_key[key] = _next_id
+    return JSONResponse(pay, status_code=201)
+
+
+@app.get("/v1/payments/search")
+async def search_payments(request: Request):
+    if (err := await _simulate()) is not None:
+        return err
+    ref = request.query_params.get("external_reference")
+    results = [p for p in payments.values() if ref is None or p["external_reference"] == ref]
+    return {"paging": {"total": len(results), "limit": 30, "offset": 0}, "results": results[:30]}
+
+
+@app.get("/v1/payments/{payment_id}")
+async def get_payment(payment_id: int):
+    if (err := await _simulate()) is not None:
+        return err
+    pay = payments.get(payment_id)
+    if not pay:
+        return JSONResponse({"message": "Payment not found", "status": 404}, status_code=404)
+    return pay
+
+
+# Controle do teste: muda o status de um pagamento (ex.: simular PIX pago)
+@app.post("/__fake/payments/{payment_id}/status/{status}")
+async def set_status(payment_id: int, status: str):
+    pay = payments.get(payment_id)
+    if not pay:
+        return JSONResponse({"message": "Payment not found"}, status_code=404)
+    pay["status"] = status
+    return pay
@@ -0,0 +1,68 @@
+# Hash/verificação de senha (bcrypt) fora do event loop.
+# Cada chamada custa dezenas a centenas de ms de CPU, então roda num
+# ProcessPoolExecutor limitado; quando a fila enche, recusamos com 503
+# em vez de deixar a latência do login (e do worker inteiro) explodir.
+# HASH_WORKERS processos por worker do uvicorn (padrão: núcleos / WEB_CONCURRENCY).
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    if not hashed or not pwd_context.verify(password, hashed):
+        return False, None
+    # Custo mudou (ou esquema deprecado): devolve o novo hash para ser salvo
+    if pwd_context.needs_update(hashed):
+        return True, pwd_context.hash(password)
+    return True, None
+
+
+def default_workers() -> int:
+    # Cada worker do uvicorn tem o próprio pool: divide os núcleos entre eles
+    # (WEB_CONCURRENCY é exportado pelo run.py) em vez de N workers x N processos
+    return max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY") or 1))
+
+
+class PasswordHasher:
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.workers = workers or int(os.getenv("HASH_WORKERS") or default_workers())
+        self.max_pending = max_pending or int(os.getenv("HASH_MAX_PENDING", self.workers * 8))
+        self.pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(503, "Servidor ocupado, tente novamente em instantes", headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Retorna (senha_ok, novo_hash); novo_hash só vem preenchido quando precisa rehash."""
+        return await self._run(_verify, password, hashed)
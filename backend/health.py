@@ -0,0 +1,114 @@
+# Liveness e readiness.
+# Liveness só diz que o processo responde (o orquestrador reinicia se parar).
+# Readiness diz se vale mandar tráfego: Mongo responde ao ping, os índices
+# criados na inicialização continuam lá e o catálogo já está em memória.
+# O resultado fica em cache por READINESS_CACHE_TTL segundos e probes
+# simultâneos compartilham a mesma verificação, para não virar carga no banco.
+
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional, Set
+
+from pymongo.errors import PyMongoError
+
+from dates import utcnow
+
+logger = logging.getLogger(__name__)
+
+READINESS_CACHE_TTL = float(os.getenv("READINESS_CACHE_TTL", 2))
+READINESS_INDEX_TTL = float(os.getenv("READINESS_INDEX_TTL", 60))
+READINESS_PING_TIMEOUT = float(os.getenv("READINESS_PING_TIMEOUT", 2))
+# Com o circuito do gateway aberto em todos os pods, tirar todos do balanceador
+# derruba também catálogo e carrinho; por padrão o breaker só é reportado
+READINESS_REQUIRE_GATEWAY = os.getenv("READINESS_REQUIRE_GATEWAY", "false").lower() in ("1", "true", "yes")
+
+
+class Readiness:
+    def __init__(self, db, catalog, breaker_getter: Callable[[], Optional[object]]):
+        self.db = db
+        self.catalog = catalog
+        self.breaker_getter = breaker_getter
+        self.indexes_created = False
+        self.expected_indexes: Dict[str, Set[str]] = {}
+        self._result: Optional[dict] = None
+        self._checked_at = 0.0
+        self._indexes_checked_at = 0.0
+        self._missing_indexes: Dict[str, list] = {}
+        self._lock = asyncio.Lock()
+
+    async def record_indexes(self, collections):
+        """Guarda os índices existentes logo depois de criá-los; a readiness confere se continuam lá."""
+        self.expected_indexes = {
+            name: set((await self.db[name].index_information()).keys()) for name in collections
+        }
+        self.indexes_created = True
+
+    def invalidate(self):
+        self._result = None
+
+    async def check(self) -> dict:
+        if self._result is not None and time.monotonic() - self._checked_at < READINESS_CACHE_TTL:
+            return self._result
+        async with self._lock:
+            if self._result is None or time.monotonic() - self._checked_at >= READINESS_CACHE_TTL:
+                self._result = await self._run_checks()
+                self._checked_at = time.monotonic()
+        return self._result
+
+    async def _run_checks(self) -> dict:
+        checks = {
+            "mongo": await self._check_mongo(),
+            "catalog": self._check_catalog(),
+            "gateway": self._check_gateway(),
+        }
+        checks["indexes"] = await self._check_indexes() if checks["mongo"]["ok"] else {"ok": False}
+        required = ("mongo", "catalog", "indexes", "gateway") if READINESS_REQUIRE_GATEWAY \
+            else ("mongo", "catalog", "indexes")
+        return {
+            "ready": all(checks[name]["ok"] for name in required),
+            "checks": checks,
+            "checkedAt": utcnow().isoformat(),
+        }
+
+    async def _check_mongo(self) -> dict:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.db.command("ping"), READINESS_PING_TIMEOUT)
+        except (PyMongoError, asyncio.TimeoutError) as e:
+            logger.warning(f"Readiness: Mongo não respondeu ao ping: {e!r}")
+            return {"ok": False, "error": type(e).__name__}
+        return {"ok": True, "latencyMs": round((time.perf_counter() - start) * 1000, 2)}
+
+    def _check_catalog(self) -> dict:
+        snap = self.catalog.snapshot
+        if snap is None:
+            return {"ok": False}
+        return {"ok": True, "products": len(snap.products), "version": snap.version[:8], "mode": self.catalog.mode}
+
+    def _check_gateway(self) -> dict:
+        breaker = self.breaker_getter()
+        if breaker is None:
+            return {"ok": False, "state": "starting"}
+        state = breaker.state
+        return {"ok": state != "open", "state": state}
+
+    async def _check_indexes(self) -> dict:
+        if not self.indexes_created:
+            return {"ok": False, "error": "indexes not created"}
+        # Listar índices é barato, mas não precisa acontecer a cada probe
+        if time.monotonic() - self._indexes_checked_at >= READINESS_INDEX_TTL:
+            missing = {}
+            try:
+                for name, expected in self.expected_indexes.items():
+                    existing = set((await self.db[name].index_information()).keys())
+                    if expected - existing:
+                        missing[name] = sorted(expected - existing)
+            except PyMongoError as e:
+                return {"ok": False, "error": type(e).__name__}
+            self._missing_indexes = missing
+            self._indexes_checked_at = time.monotonic()
+        if self._missing_indexes:
+            return {"ok": False, "missing": self._missing_indexes}
+        return {"ok": True}
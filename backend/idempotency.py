@@ -0,0 +1,163 @@
+# Chaves de idempotência para POST /payments/process.
+# A primeira requisição com uma chave "reserva" o documento (índice único) e
+# executa; retries com a mesma chave esperam a primeira terminar e recebem a
+# mesma resposta, sem tocar no gateway nem criar outro pedido. Se a primeira
+# falhar antes da cobrança, a chave é liberada para que um retry possa tentar de
+# novo; depois que o gateway respondeu (mark_charged), a chave nunca é liberada:
+# uma falha fica gravada (status "failed", com o id do pagamento) e os retries
+# recebem o mesmo erro em vez de criar outro pedido e outra cobrança.
+# A reserva tem um lease (inProgressUntil): se o worker cair no meio, um retry
+# depois do vencimento assume a chave com um update condicional, a menos que a
+# cobrança já tenha sido feita.
+
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from dates import to_utc, utcnow
+
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 24))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", 30))
+# Tempo máximo de uma execução antes que um retry possa assumir a chave
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", 60))
+
+
+# fn(mark_charged): chama `await mark_charged(paymentId=...)` assim que o gateway responder
+MarkCharged = Callable[..., Awaitable[None]]
+Operation = Callable[[MarkCharged], Awaitable[dict]]
+
+
+def fingerprint(raw: str) -> str:
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _error(exc: BaseException) -> dict:
+    if isinstance(exc, HTTPException):
+        return {"statusCode": exc.status_code, "detail": exc.detail}
+    return {"statusCode": 500, "detail": "Erro interno ao processar pagamento"}
+
+
+class IdempotencyStore:
+    def __init__(self, db):
+        self.col = db.idempotency_keys
+        # Requisições em andamento neste processo: duplicatas locais esperam no Future
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def ensure_indexes(self):
+        await self.col.create_index("key", unique=True)
+        await self.col.create_index("createdAt", expireAfterSeconds=IDEMPOTENCY_TTL_HOURS * 3600)
+
+    async def run(self, key: str, request_hash: str, fn: Operation) -> dict:
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            local = self._inflight.get(key)
+            if local is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(local), max(deadline - asyncio.get_running_loop().time(), 0))
+                except asyncio.TimeoutError:
+                    raise self._busy()
+                continue
+            owner = uuid.uuid4().hex
+            now = utcnow()
+            try:
+                await self.col.insert_one({
+                    "key": key,
+                    "requestHash": request_hash,
+                    "status": "in_progress",
+                    "owner": owner,
+                    "inProgressUntil": now + timedelta(seconds=IDEMPOTENCY_LEASE),
+                    "createdAt": now,
+                })
+            except DuplicateKeyError:
+                doc = await self._wait_completed(key, request_hash, owner, deadline)
+                if doc is None:
+                    # A tentativa original falhou e liberou a chave: tenta de novo
+                    continue
+                if doc["requestHash"] != request_hash:
+                    raise HTTPException(422, "Idempotency-Key já usada com outro pedido")
+                if doc["status"] == "failed":
+                    raise HTTPException(doc["error"]["statusCode"], doc["error"]["detail"])
+                if doc["status"] == "in_progress" and doc.get("charged") is not None:
+                    # O processo caiu depois da cobrança: não dá para refazer sem cobrar de novo
+                    raise HTTPException(500, f"Pagamento {doc['charged'].get('paymentId')} criado, mas o pedido não "
+                                             "foi concluído; não repita a compra e entre em contato com o suporte")
+                if doc["status"] == "in_progress":
+                    # Lease vencido assumido por esta requisição
+                    return await self._execute(key, owner, fn)
+                return doc["response"]
+            return await self._execute(key, owner, fn)
+
+    async def _execute(self, key: str, owner: str, fn: Operation) -> dict:
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        charged: Optional[Dict[str, Any]] = None
+
+        async def mark_charged(**info):
+            nonlocal charged
+            charged = info
+            await self.col.update_one({"key": key, "owner": owner}, {"$set": {"charged": info}})
+
+        try:
+            response = await fn(mark_charged)
+            await self.col.update_one(
+                {"key": key, "owner": owner},
+                {"$set": {"status": "completed", "response": response, "completedAt": utcnow()},
+                 "$unset": {"inProgressUntil": ""}},
+            )
+            return response
+        except BaseException as e:
+            if charged is None:
+                await self.col.delete_one({"key": key, "owner": owner, "status": "in_progress"})
+            else:
+                # Já cobrado: a chave guarda o erro para os retries em vez de ser liberada
+                await self.col.update_one(
+                    {"key": key, "owner": owner},
+                    {"$set": {"status": "failed", "error": _error(e), "charged": charged, "completedAt": utcnow()},
+                     "$unset": {"inProgressUntil": ""}},
+                )
+            raise
+        finally:
+            del self._inflight[key]
+            # Quem espera no Future só precisa saber que terminou; a resposta vem do banco
+            fut.set_result(None)
+
+    def _busy(self) -> HTTPException:
+        return HTTPException(409, "Pagamento com esta Idempotency-Key ainda em processamento",
+                             headers={"Retry-After": "2"})
+
+    async def _take_over(self, key: str, request_hash: str, owner: str) -> Optional[dict]:
+        now = utcnow()
+        # Sem inProgressUntil (reservas antigas) também conta como vencido; com cobrança feita, nunca
+        return await self.col.find_one_and_update(
+            {"key": key, "requestHash": request_hash, "status": "in_progress", "charged": None,
+             "inProgressUntil": {"$not": {"$gte": now}}},
+            {"$set": {"owner": owner, "inProgressUntil": now + timedelta(seconds=IDEMPOTENCY_LEASE)}},
+            projection={"_id": 0},
+        )
+
+    async def _wait_completed(self, key: str, request_hash: str, owner: str, deadline: float) -> Optional[dict]:
+        """Documento concluído ou com falha, None se a chave foi liberada, ou a reserva assumida (lease vencido)."""
+        delay = 0.05
+        loop = asyncio.get_running_loop()
+        while True:
+            doc = await self.col.find_one({"key": key}, {"_id": 0})
+            if doc is None or doc["status"] != "in_progress" or doc["requestHash"] != request_hash:
+                return doc
+            lease = to_utc(doc.get("inProgressUntil"))
+            if lease is None or lease < utcnow():
+                if doc.get("charged") is not None:
+                    return doc
+                taken = await self._take_over(key, request_hash, owner)
+                if taken:
+                    return taken
+                continue
+            if loop.time() + delay > deadline:
+                raise self._busy()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
@@ -0,0 +1,142 @@
+# Logging estruturado e assíncrono.
+# O event loop só enfileira o LogRecord (QueueHandler); formatação em JSON e
+# escrita no stderr acontecem na thread do QueueListener. Cada linha é um JSON
+# compacto com o request id da requisição corrente.
+# Payloads completos do gateway só são logados em DEBUG, em falhas ou numa
+# amostra (LOG_PAYLOAD_SAMPLE_RATE), sempre com dados pessoais mascarados.
+
+import atexit
+import contextvars
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0.01))
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+# Campos com dado pessoal ou de cartão nos payloads do MercadoPago e do checkout
+_SECRET_KEYS = {"token", "card_token", "security_code", "qr_code_base64", "qrCodeBase64"}
+_PII_KEYS = {
+    "number", "documentNumber", "first_name", "last_name", "firstName", "lastName", "phone", "area_code",
+    "address", "street_name", "street_number", "zip_code", "postalCode", "city", "federal_unit",
+}
+_EMAIL_KEYS = {"email"}
+
+# color_message: versão com ANSI que o uvicorn anexa aos próprios logs
+_RESERVED = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id", "color_message"}
+_listener = None
+
+
+def mask_email(email) -> str:
+    if not isinstance(email, str) or "@" not in email:
+        return "***"
+    user, domain = email.split("@", 1)
+    return f"{user[:2]}***@{domain}"
+
+
+def redact(value):
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            if k in _SECRET_KEYS:
+                out[k] = "[REDACTED]"
+            elif k in _EMAIL_KEYS:
+                out[k] = mask_email(v)
+            elif k in _PII_KEYS and not isinstance(v, (dict, list)):
+                out[k] = "***"
+            else:
+                out[k] = redact(v)
+        return out
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def log_payload(logger: logging.Logger, message: str, payload, failed: bool = False):
+    """Loga um payload do gateway só em DEBUG, em falha ou na amostragem."""
+    if failed:
+        logger.warning(message, extra={"payload": redact(payload)})
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, extra={"payload": redact(payload)})
+    elif random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        logger.info(message, extra={"payload": redact(payload), "sampled": True})
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["requestId"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class _LoopQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Não formata aqui (isso rodaria no event loop); só captura o request id
+        record.request_id = request_id_var.get()
+        return record
+
+
+def setup_logging():
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers[:] = [_LoopQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    # O httpx loga cada requisição em INFO; no caminho do pagamento isso é ruído
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class RequestIdMiddleware:
+    """Define o request id (X-Request-ID recebido ou um novo) e devolve no header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"x-request-id", request_id.encode("latin-1")))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
@@ -0,0 +1,200 @@
+# Métricas no formato de texto do Prometheus, sem dependência externa.
+# Tudo aqui é barato o bastante para ficar ligado com tráfego cheio: contadores
+# e histogramas são listas em memória (bisect + soma) protegidas por um lock,
+# porque o listener de comandos do pymongo roda nas threads do Motor.
+#   - latência por rota (template, não a URL crua) e status;
+#   - latência/erros das chamadas ao gateway;
+#   - tempo de cada comando do Mongo por comando e coleção;
+#   - lag do event loop e profundidade das filas (gauges).
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = list(self._values.items())
+        for labels, value in sorted(snapshot):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [contagem por bucket (+Inf no fim), soma, total]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(names, (*labels, bound))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """Valor lido na hora da coleta (fn) ou definido com set()."""
+
+    def __init__(self, name: str, help: str, fn: Optional[Callable[[], float]] = None):
+        self.name, self.help, self.fn = name, help, fn
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self) -> List[str]:
+        value = self.value
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception:
+                value = float("nan")
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "Requisições HTTP", ("method", "route", "status"))
+http_latency = registry.histogram("http_request_duration_seconds", "Latência das requisições HTTP", ("method", "route"))
+gateway_latency = registry.histogram("gateway_call_duration_seconds", "Latência das chamadas ao MercadoPago", ("op",))
+gateway_calls = registry.counter("gateway_calls_total", "Chamadas ao MercadoPago por resultado", ("op", "outcome"))
+mongo_latency = registry.histogram("mongo_command_duration_seconds", "Latência dos comandos do Mongo", ("command", "collection"))
+mongo_failures = registry.counter("mongo_command_failures_total", "Comandos do Mongo com erro", ("command", "collection"))
+loop_lag = registry.histogram(
+    "event_loop_lag_seconds", "Atraso do event loop", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+
+def observe_gateway(op: str, seconds: float, outcome: str):
+    gateway_latency.observe(seconds, op)
+    gateway_calls.inc(op, outcome)
+
+
+class MetricsMiddleware:
+    """Conta e cronometra requisições pelo template da rota (ex.: /api/orders/{order_id})."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path_format", None) or "unmatched"
+            http_latency.observe(time.perf_counter() - start, scope["method"], path)
+            http_requests.inc(scope["method"], path, str(status))
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._collections: Dict[tuple, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else ""
+        )
+
+    def _finish(self, event) -> Tuple[str, str]:
+        return event.command_name, self._collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, *self._finish(event))
+
+    def failed(self, event):
+        labels = self._finish(event)
+        mongo_latency.observe(event.duration_micros / 1e6, *labels)
+        mongo_failures.inc(*labels)
+
+
+async def monitor_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(loop.time() - expected, 0))
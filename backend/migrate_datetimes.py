@@ -0,0 +1,153 @@
+# Migração: createdAt/updatedAt (e afins) gravados como string ISO -> BSON Date.
+# Percorre users, orders e carts em ordem de _id, em lotes, e converte com um
+# bulk_write (ordered=False) por lote. O filtro de cada UpdateOne inclui o valor
+# antigo, então um documento atualizado pela aplicação durante a migração não
+# é sobrescrito. O progresso (último _id) fica em db.migrations: se o processo
+# cair, rodar de novo continua de onde parou (--restart recomeça do zero).
+# Execute com: python migrate_datetimes.py [--batch-size 1000] [--collections users,orders] [--dry-run]
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from dates import CODEC_OPTIONS, to_utc, utcnow
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("migrate_datetimes")
+
+MIGRATION = "datetimes-v1"
+FIELDS = {
+    "users": ("createdAt", "updatedAt"),
+    "orders": ("createdAt", "updatedAt", "reconciledAt", "paymentExpiresAt"),
+    "carts": ("createdAt", "updatedAt"),
+}
+
+
+def string_fields_query(fields) -> dict:
+    return {"$or": [{f: {"$type": "string"}} for f in fields]}
+
+
+async def migrate_collection(db, name: str, batch_size: int, dry_run: bool, restart: bool, pause: float) -> dict:
+    col = db[name]
+    fields = FIELDS[name]
+    state_id = f"{MIGRATION}:{name}"
+    state = None if restart else await db.migrations.find_one({"_id": state_id})
+    if state and state.get("done"):
+        logger.info(f"{name}: já migrada em {state.get('finishedAt')}")
+        return {"collection": name, "skipped": True}
+
+    query = string_fields_query(fields)
+    last_id = state.get("lastId") if state else None
+    scanned = state.get("scanned", 0) if state else 0
+    converted = state.get("converted", 0) if state else 0
+    invalid = state.get("invalid", 0) if state else 0
+    remaining = await col.count_documents({**query, "_id": {"$gt": last_id}} if last_id is not None else query)
+    logger.info(f"{name}: {remaining} documentos com datas em string" + (f" (retomando após {last_id})" if last_id else ""))
+
+    started = time.monotonic()
+    done_now = 0
+    projection = {f: 1 for f in fields}
+    while True:
+        batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+        docs = await col.find(batch_query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+
+        ops = []
+        for doc in docs:
+            expected, update = {}, {}
+            for field in fields:
+                value = doc.get(field)
+                if not isinstance(value, str):
+                    continue
+                parsed = to_utc(value)
+                if parsed is None:
+                    invalid += 1
+                    logger.warning(f"{name} {doc['_id']}: {field}={value!r} não é uma data ISO; mantido")
+                    continue
+                expected[field] = value
+                update[field] = parsed
+            if update:
+                ops.append(UpdateOne({"_id": doc["_id"], **expected}, {"$set": update}))
+
+        if ops and not dry_run:
+            result = await col.bulk_write(ops, ordered=False)
+            converted += result.modified_count
+        elif ops:
+            converted += len(ops)
+
+        last_id = docs[-1]["_id"]
+        scanned += len(docs)
+        done_now += len(docs)
+        if not dry_run:
+            await db.migrations.update_one(
+                {"_id": state_id},
+                {"$set": {"lastId": last_id, "scanned": scanned, "converted": converted, "invalid": invalid,
+                          "updatedAt": utcnow(), "done": False}},
+                upsert=True,
+            )
+
+        elapsed = time.monotonic() - started
+        rate = done_now / elapsed if elapsed else 0
+        eta = (remaining - done_now) / rate if rate else 0
+        logger.info(
+            f"{name}: {done_now}/{remaining} ({done_now / remaining:.0%}) | {rate:.0f} docs/s | "
+            f"convertidos {converted} | ETA {eta:.0f}s" if remaining else f"{name}: {done_now} docs"
+        )
+        if pause:
+            # Alivia o primário em produção: --pause-ms entre lotes
+            await asyncio.sleep(pause)
+
+    elapsed = time.monotonic() - started
+    if not dry_run:
+        await db.migrations.update_one(
+            {"_id": state_id},
+            {"$set": {"done": True, "finishedAt": utcnow(), "scanned": scanned, "converted": converted,
+                      "invalid": invalid}},
+            upsert=True,
+        )
+    return {
+        "collection": name,
+        "scanned": scanned,
+        "converted": converted,
+        "invalid": invalid,
+        "seconds": round(elapsed, 2),
+        "docsPerSecond": round(done_now / elapsed, 1) if elapsed else 0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collections", default=",".join(FIELDS), type=lambda s: [c for c in s.split(",") if c])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause-ms", type=float, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="só conta o que seria convertido")
+    parser.add_argument("--restart", action="store_true", help="ignora o progresso salvo")
+    args = parser.parse_args()
+
+    unknown = set(args.collections) - set(FIELDS)
+    if unknown:
+        parser.error(f"coleções sem migração: {', '.join(sorted(unknown))}")
+
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"], **CODEC_OPTIONS)
+    db = client[os.environ["DB_NAME"]]
+    try:
+        for name in args.collections:
+            summary = await migrate_collection(db, name, args.batch_size, args.dry_run, args.restart, args.pause_ms / 1000)
+            logger.info(f"✅ {summary}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
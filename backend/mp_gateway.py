@@ -0,0 +1,213 @@
+# Cliente assíncrono do MercadoPago.
+# Substitui o mercadopago.SDK (síncrono, baseado em requests) dentro dos handlers
+# async: usa um httpx.AsyncClient com pool keep-alive, timeout por operação e
+# um limite de chamadas simultâneas ao gateway.
+# Com o gateway degradado, um circuit breaker corta as chamadas (CircuitOpen)
+# em vez de deixar requisições empilhando até o deadline; consultas de pagamento
+# (idempotentes) podem ser duplicadas depois de MP_HEDGE_DELAY_MS (hedging).
+# Para testes de carga, aponte MERCADOPAGO_API_URL para o fake_mp.py.
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Callable, Optional
+
+import httpx
+
+MP_API_URL = "https://api.mercadopago.com"
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayTimeout(GatewayError):
+    pass
+
+
+class CircuitOpen(GatewayError):
+    def __init__(self, retry_after: float):
+        super().__init__(f"MercadoPago indisponível, circuito aberto por mais {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Abre após `failure_threshold` falhas seguidas; depois de `reset_timeout`
+    deixa uma chamada de teste passar (half-open) e fecha se ela der certo."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0
+        return max(self.reset_timeout - (time.monotonic() - self.opened_at), 1)
+
+    def before_call(self):
+        state = self.state
+        if state == "open":
+            raise CircuitOpen(self.retry_after())
+        if state == "half_open":
+            now = time.monotonic()
+            # Uma chamada de teste por vez; se ela travar, outra pode tentar após reset_timeout
+            if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                raise CircuitOpen(1)
+            self._probe_started = now
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_started = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # Falha no half-open reabre o circuito por mais um período
+            if self.state != "open":
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        state = self.state
+        return {
+            "state": state,
+            "consecutiveFailures": self.failures,
+            "retryAfterSeconds": round(self.retry_after(), 1) if state == "open" else 0,
+            "timesOpened": self.times_opened,
+        }
+
+
+class MercadoPagoGateway:
+    def __init__(
+        self,
+        access_token: str,
+        base_url: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        max_connections: Optional[int] = None,
+    ):
+        self.base_url = base_url or os.getenv("MERCADOPAGO_API_URL", MP_API_URL)
+        self.max_concurrency = max_concurrency or int(os.getenv("MP_MAX_CONCURRENCY", 50))
+        max_connections = max_connections or int(os.getenv("MP_MAX_CONNECTIONS", self.max_concurrency))
+        # Deadline de cada operação (inclui a espera na fila do semáforo)
+        self.timeouts = {
+            "create": float(os.getenv("MP_CREATE_TIMEOUT", 20)),
+            "get": float(os.getenv("MP_GET_TIMEOUT", 8)),
+            "search": float(os.getenv("MP_SEARCH_TIMEOUT", 10)),
+        }
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("MP_BREAKER_FAILURES", 5)),
+            reset_timeout=float(os.getenv("MP_BREAKER_RESET", 30)),
+        )
+        # 0 desliga o hedging das consultas de pagamento
+        self.hedge_delay = float(os.getenv("MP_HEDGE_DELAY_MS", 0)) / 1000
+        self.hedged = 0
+        # Hook de observabilidade: on_call(op, segundos, resultado)
+        self.on_call: Optional[Callable[[str, float, str], None]] = None
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=30,
+            ),
+            timeout=httpx.Timeout(max(self.timeouts.values()), connect=5),
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return self.max_concurrency - self._sem._value
+
+    async def _send(self, method: str, path: str, **kwargs) -> dict:
+        async with self._sem:
+            resp = await self._client.request(method, path, **kwargs)
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+        # Mesmo formato de retorno do SDK: {"status": http_status, "response": json}
+        return {"status": resp.status_code, "response": body}
+
+    async def _hedged_send(self, method: str, path: str, **kwargs) -> dict:
+        # Só para leituras idempotentes: se a primeira tentativa demorar mais que
+        # hedge_delay, dispara uma segunda e fica com a que responder primeiro
+        pending = {asyncio.ensure_future(self._send(method, path, **kwargs))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self.hedge_delay)
+            if not done:
+                self.hedged += 1
+                pending.add(asyncio.ensure_future(self._send(method, path, **kwargs)))
+            error: Optional[BaseException] = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _request(self, op: str, method: str, path: str, hedge: bool = False, **kwargs) -> dict:
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            try:
+                self.breaker.before_call()
+            except CircuitOpen:
+                outcome = "circuit_open"
+                raise
+            send = self._hedged_send if hedge and self.hedge_delay > 0 else self._send
+            res = await asyncio.wait_for(send(method, path, **kwargs), self.timeouts[op])
+            outcome = "ok" if res["status"] < 400 else f"http_{res['status'] // 100}xx"
+            # 4xx é erro do pedido, não do gateway; só 5xx e 429 contam para o breaker
+            if res["status"] >= 500 or res["status"] == 429:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return res
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            outcome = "timeout"
+            self.breaker.record_failure()
+            raise GatewayTimeout(f"MercadoPago não respondeu em {self.timeouts[op]:.0f}s ({op})") from e
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise GatewayError(f"Falha de comunicação com o MercadoPago ({op}): {e}") from e
+        finally:
+            if self.on_call:
+                self.on_call(op, time.perf_counter() - start, outcome)
+
+    async def create_payment(self, body: dict, idempotency_key: Optional[str] = None) -> dict:
+        headers = {"X-Idempotency-Key": idempotency_key or str(uuid.uuid4())}
+        return await self._request("create", "POST", "/v1/payments", json=body, headers=headers)
+
+    async def get_payment(self, payment_id) -> dict:
+        return await self._request("get", "GET", f"/v1/payments/{payment_id}", hedge=True)
+
+    async def search_payments(self, **filters) -> dict:
+        return await self._request("search", "GET", "/v1/payments/search", params=filters)
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -0,0 +1,107 @@
+# Pub/sub de mudanças de status de pedidos.
+# Alimenta GET /orders/{id}/events (SSE) e /orders/{id}/wait (long-poll), para
+# que o checkout não precise ficar consultando o gateway.
+#   - no mesmo processo: OrderStatusUpdater chama on_status_changes;
+#   - entre workers: change stream em orders (replica set / Atlas). Sem change
+#     stream, os assinantes relêem o pedido a cada heartbeat.
+
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("approved", "failed", "expired")
+ORDER_EVENT_FIELDS = {"_id": 0, "id": 1, "status": 1, "mercadopagoStatus": 1}
+# Espera máxima entre tentativas de reabrir o change stream depois de erros inesperados
+ORDER_EVENTS_MAX_BACKOFF = 300
+
+
+class OrderEvents:
+    def __init__(self, db):
+        self.orders = db.orders
+        self._subs: Dict[str, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.mode = "local"
+
+    @property
+    def cross_worker(self) -> bool:
+        return self.mode == "change_stream"
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(qs) for qs in self._subs.values())
+
+    def subscribe(self, order_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+        self._subs.setdefault(order_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, order_id: str, queue: asyncio.Queue):
+        queues = self._subs.get(order_id)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subs[order_id]
+
+    def publish(self, order_id: str, event: dict):
+        for queue in self._subs.get(order_id, ()):
+            if queue.full():
+                # Assinante lento: só o estado mais recente importa
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def on_status_changes(self, changes: list):
+        for change in changes:
+            self.publish(change["orderId"], {
+                "id": change["orderId"],
+                "status": change["status"],
+                "mercadopagoStatus": change["mercadopagoStatus"],
+            })
+
+    async def current(self, order_id: str) -> Optional[dict]:
+        return await self.orders.find_one({"id": order_id}, ORDER_EVENT_FIELDS)
+
+    def start(self):
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        pipeline = [
+            {"$match": {"operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}}},
+            {"$project": {"fullDocument.id": 1, "fullDocument.status": 1, "fullDocument.mercadopagoStatus": 1}},
+        ]
+        delay = 5
+        while True:
+            try:
+                async with self.orders.watch(pipeline, full_document="updateLookup") as stream:
+                    self.mode = "change_stream"
+                    delay = 5
+                    async for change in stream:
+                        doc = change.get("fullDocument") or {}
+                        if doc.get("id") in self._subs:
+                            self.publish(doc["id"], doc)
+            except OperationFailure as e:
+                logger.info(f"Change stream de pedidos indisponível ({e.code}); eventos só dentro do processo")
+                self.mode = "local"
+                return
+            except PyMongoError as e:
+                logger.warning(f"Change stream de pedidos caiu: {e}; reconectando")
+                self.mode = "local"
+                await asyncio.sleep(5)
+            except Exception:
+                # Erro inesperado: assinantes seguem relendo o pedido a cada heartbeat enquanto tenta de novo
+                logger.exception(f"Erro no change stream de pedidos; nova tentativa em {delay}s")
+                self.mode = "local"
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, ORDER_EVENTS_MAX_BACKOFF)
@@ -0,0 +1,78 @@
+# Aplicação do status dos pagamentos do MercadoPago nos pedidos.
+# Usado pelo worker de webhooks (e por quem mais atualizar pedidos em lote):
+# um find para saber o status anterior e um único bulk_write por lote.
+# Pedidos cujo status não mudou não são regravados.
+
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from dates import utcnow
+
+logger = logging.getLogger(__name__)
+
+
+def order_status(mp_status: str) -> str:
+    if mp_status == "approved":
+        return "approved"
+    if mp_status in ["pending", "in_process"]:
+        return "pending"
+    return "failed"
+
+
+class OrderStatusUpdater:
+    def __init__(self, db):
+        self.orders = db.orders
+        # Callbacks async chamados com a lista de mudanças efetivamente aplicadas:
+        # [{"orderId", "status", "previousStatus", "mercadopagoStatus", "payment"}]
+        self.listeners: List[Callable[[List[dict]], Awaitable[None]]] = []
+
+    async def apply(self, payments: Iterable[dict], overrides: Optional[Dict[str, str]] = None) -> List[dict]:
+        """`overrides` força o status de pedidos específicos (ex.: {"<order_id>": "expired"})."""
+        # Último estado conhecido de cada pedido (o mesmo pagamento pode vir repetido)
+        latest = {p["external_reference"]: p for p in payments if p.get("external_reference")}
+        if not latest:
+            return []
+        current = {
+            o["id"]: o
+            async for o in self.orders.find(
+                {"id": {"$in": list(latest)}}, {"_id": 0, "id": 1, "status": 1, "mercadopagoStatus": 1}
+            )
+        }
+
+        now = utcnow()
+        ops, changes = [], []
+        for order_id, p in latest.items():
+            order = current.get(order_id)
+            if not order:
+                continue
+            new_status = (overrides or {}).get(order_id) or order_status(p.get("status"))
+            if order.get("mercadopagoStatus") == p.get("status") and order.get("status") == new_status:
+                continue
+            # Pedido já expirado localmente não volta para pendente (só um pagamento aprovado muda)
+            if order.get("status") == "expired" and new_status == "pending":
+                continue
+            ops.append(UpdateOne(
+                {"id": order_id},
+                {"$set": {"mercadopagoStatus": p.get("status"), "status": new_status, "updatedAt": now}},
+            ))
+            changes.append({
+                "orderId": order_id,
+                "status": new_status,
+                "previousStatus": order.get("status"),
+                "mercadopagoStatus": p.get("status"),
+                "payment": p,
+            })
+        if not ops:
+            return []
+
+        await self.orders.bulk_write(ops, ordered=False)
+        for change in changes:
+            logger.info(f"Pedido {change['orderId']} atualizado para {change['status']}")
+        for listener in self.listeners:
+            try:
+                await listener(changes)
+            except Exception as e:
+                logger.error(f"Erro em listener de status de pedido: {e}", exc_info=True)
+        return changes
@@ -0,0 +1,65 @@
+# Paginação por cursor (keyset).
+# O cursor é opaco para o cliente: base64url de um JSON com os valores das
+# chaves de ordenação do último documento da página. A próxima página vira um
+# filtro "depois de (v1, v2, ...)" que usa o índice composto da ordenação, então
+# a página 500 custa o mesmo que a página 1 (sem skip).
+
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+Sort = List[Tuple[str, int]]
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(sort: Sort, doc: dict) -> str:
+    payload = {"s": [[f, d] for f, d in sort], "v": [_encode_value(doc.get(f)) for f, _ in sort]}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(sort: Sort, cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        fields, values = payload["s"], payload["v"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    if fields != [[f, d] for f, d in sort] or len(values) != len(sort):
+        raise HTTPException(400, "Cursor does not match the requested sort")
+    return [_decode_value(v) for v in values]
+
+
+def keyset_filter(sort: Sort, values: list) -> dict:
+    """(a, b) depois de (va, vb) => a > va OR (a == va AND b > vb), respeitando a direção."""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: values[j] for j, (f, _) in enumerate(sort[:i])}
+        clause[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+async def paginate(collection, query: dict, sort: Sort, limit: int,
+                   cursor: Optional[str] = None, projection: Optional[dict] = None) -> Tuple[list, Optional[str]]:
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(sort, cursor))]}
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(sort, docs[-1])
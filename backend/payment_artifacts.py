@@ -0,0 +1,74 @@
+# Artefatos de pagamento (QR code do PIX, dados do boleto) fora do documento
+# do pedido. O PNG do QR code tem dezenas de KB; guardado inline ele voltava em
+# toda listagem de pedidos. Aqui fica em payment_artifacts, uma vez por pedido,
+# e é servido por um endpoint próprio com cache longo (o conteúdo nunca muda).
+
+import base64
+import binascii
+import json
+from typing import Optional, Tuple
+
+from bson import Binary
+
+from dates import utcnow
+
+PIX_QR = "pix_qr"
+BOLETO = "boleto"
+
+CONTENT_TYPES = {
+    PIX_QR: "image/png",
+    BOLETO: "application/json",
+}
+
+
+class PaymentArtifacts:
+    def __init__(self, db):
+        self.col = db.payment_artifacts
+        self.orders = db.orders
+
+    async def ensure_indexes(self):
+        await self.col.create_index([("orderId", 1), ("kind", 1)], unique=True)
+
+    async def save(self, order_id: str, kind: str, data: bytes):
+        await self.col.update_one(
+            {"orderId": order_id, "kind": kind},
+            {"$setOnInsert": {
+                "contentType": CONTENT_TYPES[kind],
+                "data": Binary(data),
+                "size": len(data),
+                "createdAt": utcnow(),
+            }},
+            upsert=True,
+        )
+
+    async def save_pix_qr(self, order_id: str, qr_code_base64: str):
+        try:
+            data = base64.b64decode(qr_code_base64)
+        except (binascii.Error, ValueError):
+            return
+        if data:
+            await self.save(order_id, PIX_QR, data)
+
+    async def save_boleto(self, order_id: str, boleto_url: str, barcode: str):
+        payload = {"boletoUrl": boleto_url, "barcode": barcode}
+        await self.save(order_id, BOLETO, json.dumps(payload).encode())
+
+    async def load(self, order_id: str, kind: str) -> Optional[Tuple[bytes, str]]:
+        doc = await self.col.find_one({"orderId": order_id, "kind": kind}, {"_id": 0, "data": 1, "contentType": 1})
+        if doc:
+            return bytes(doc["data"]), doc["contentType"]
+        return await self._load_legacy(order_id, kind)
+
+    async def _load_legacy(self, order_id: str, kind: str) -> Optional[Tuple[bytes, str]]:
+        # Pedidos antigos ainda têm os dados inline no documento
+        order = await self.orders.find_one(
+            {"id": order_id}, {"_id": 0, "pixQrCodeBase64": 1, "boletoUrl": 1, "boletoBarcode": 1}
+        )
+        if not order:
+            return None
+        if kind == PIX_QR and order.get("pixQrCodeBase64"):
+            return base64.b64decode(order["pixQrCodeBase64"]), CONTENT_TYPES[PIX_QR]
+        if kind == BOLETO and order.get("boletoUrl"):
+            payload = {"boletoUrl": order["boletoUrl"], "barcode": order.get("boletoBarcode", "")}
+            return json.dumps(payload).encode(), CONTENT_TYPES[BOLETO]
+        return None
@@ -0,0 +1,115 @@
+# Precificação do carrinho no servidor.
+# Os preços vêm do catálogo em memória (um único $in no Mongo só para ids que
+# não estão no snapshot), o cupom do CouponStore (em cache), e todas as contas são feitas
+# em centavos inteiros via Decimal. O checkout compara o que o cliente enviou
+# com o valor calculado aqui e recusa divergências antes de chamar o gateway.
+
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Diferença aceita entre o valor do cliente e o nosso (arredondamento em JS)
+TOLERANCE_CENTS = 1
+
+
+class PricingError(Exception):
+    pass
+
+
+def to_cents(value) -> int:
+    return int((Decimal(str(value)) * 100).quantize(Decimal(1), ROUND_HALF_UP))
+
+
+def from_cents(cents: int) -> float:
+    return float(Decimal(cents) / 100)
+
+
+class Quote:
+    def __init__(self, lines: List[dict], subtotal: int, discount: int, coupon: Optional[dict]):
+        self.lines = lines
+        self.subtotal = subtotal
+        self.discount = discount
+        self.total = subtotal - discount
+        self.coupon = coupon
+
+    def as_dict(self) -> dict:
+        return {
+            "items": [
+                {**{k: v for k, v in line.items() if k not in ("unitCents", "lineCents")},
+                 "price": from_cents(line["unitCents"]), "lineTotal": from_cents(line["lineCents"])}
+                for line in self.lines
+            ],
+            "subtotal": from_cents(self.subtotal),
+            "discount": from_cents(self.discount),
+            "total": from_cents(self.total),
+            "couponCode": self.coupon["code"] if self.coupon else None,
+        }
+
+    def order_items(self) -> List[dict]:
+        return [
+            {"productId": line["productId"], "name": line["name"], "price": from_cents(line["unitCents"]),
+             "quantity": line["quantity"]}
+            for line in self.lines
+        ]
+
+    def mismatches(self, subtotal, discount, total, items: Iterable[Tuple[str, float]] = ()) -> List[str]:
+        """Campos em que o valor enviado pelo cliente diverge do calculado."""
+        problems = []
+        for name, sent, ours in (("subtotal", subtotal, self.subtotal), ("discount", discount, self.discount),
+                                 ("total", total, self.total)):
+            if abs(to_cents(sent) - ours) > TOLERANCE_CENTS:
+                problems.append(f"{name}: enviado {sent:.2f}, esperado {from_cents(ours):.2f}")
+        prices = {line["productId"]: line["unitCents"] for line in self.lines}
+        for product_id, price in items:
+            if product_id in prices and abs(to_cents(price) - prices[product_id]) > TOLERANCE_CENTS:
+                problems.append(f"preço de {product_id}: enviado {price:.2f}, esperado {from_cents(prices[product_id]):.2f}")
+        return problems
+
+
+class PricingEngine:
+    def __init__(self, db, catalog, coupons):
+        self.db = db
+        self.catalog = catalog
+        self.coupons = coupons
+
+    async def resolve_products(self, product_ids: Iterable[str]) -> Dict[str, dict]:
+        ids = set(product_ids)
+        snap = self.catalog.snapshot
+        found = {pid: snap.by_id[pid] for pid in ids if snap and pid in snap.by_id}
+        missing = ids - found.keys()
+        if missing:
+            async for product in self.db.products.find({"id": {"$in": list(missing)}}, {"_id": 0}):
+                found[product["id"]] = product
+        return found
+
+    async def find_coupon(self, code: str) -> Optional[dict]:
+        return await self.coupons.find(code)
+
+    async def quote(self, items: Iterable[Tuple[str, int]], coupon_code: Optional[str] = None) -> Quote:
+        quantities: Dict[str, int] = {}
+        for product_id, quantity in items:
+            if quantity <= 0:
+                raise PricingError(f"Quantidade inválida para o produto {product_id}")
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+        products = await self.resolve_products(quantities)
+        lines, subtotal = [], 0
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if not product:
+                raise PricingError(f"Produto {product_id} não encontrado")
+            if not product.get("isAvailable", True):
+                raise PricingError(f"Produto {product['name']} indisponível")
+            unit = to_cents(product["price"])
+            lines.append({"productId": product_id, "name": product["name"], "quantity": quantity,
+                          "unitCents": unit, "lineCents": unit * quantity})
+            subtotal += unit * quantity
+
+        coupon, discount = None, 0
+        if coupon_code:
+            coupon = await self.find_coupon(coupon_code)
+            if not coupon:
+                raise PricingError("Cupom inválido")
+            rate = Decimal(str(coupon["discount"]))
+            discount = int((subtotal * rate).quantize(Decimal(1), ROUND_HALF_UP))
+            discount = min(discount, subtotal)
+        return Quote(lines, subtotal, discount, coupon)
@@ -0,0 +1,173 @@
+# Rate limiting (token bucket) e descarte de carga.
+# Cada regra tem um orçamento "N/S" (N requisições a cada S segundos, com
+# rajada de até N) e é aplicada por chave: IP, usuário, e-mail ou sessão.
+# O backend padrão fica em memória (por worker: com W workers o limite efetivo
+# por IP chega a W vezes o configurado); RATE_LIMIT_BACKEND=mongo usa um
+# bucket compartilhado em rate_limits, atualizado com um único
+# find_one_and_update atômico por requisição.
+# O LoadShedMiddleware recusa com 503 o que passar de MAX_IN_FLIGHT requisições
+# simultâneas no worker, antes que a fila derrube a latência de todo mundo.
+
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+import metrics
+from dates import utcnow
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 512))
+
+# Orçamentos padrão; cada um pode ser trocado por RATE_LIMIT_<NOME> (ex.: RATE_LIMIT_LOGIN_IP=20/60)
+DEFAULT_RULES = {
+    "login_ip": "20/60",
+    "login_account": "5/60",
+    "coupon_ip": "30/60",
+    "payment_ip": "20/60",
+    "payment_session": "5/60",
+}
+
+rate_limited = metrics.registry.counter("rate_limited_total", "Requisições recusadas por rate limit", ("rule",))
+shed_requests = metrics.registry.counter("load_shed_total", "Requisições descartadas por excesso de concorrência")
+
+
+def parse_budget(value: str) -> Tuple[float, float]:
+    """'20/60' -> (taxa por segundo, rajada)."""
+    count, _, seconds = value.partition("/")
+    count, seconds = float(count), float(seconds or 1)
+    return count / seconds, count
+
+
+class MemoryBackend:
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # chave -> (tokens, instante da última atualização); LRU para não crescer sem limite
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (cost - tokens) / rate
+
+
+class MongoBackend:
+    """Bucket compartilhado entre workers e pods (MongoDB 4.2+, update com pipeline)."""
+
+    def __init__(self, db):
+        self.col = db.rate_limits
+
+    async def ensure_indexes(self):
+        await self.col.create_index("expiresAt", expireAfterSeconds=0)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> Tuple[bool, float]:
+        now = utcnow()
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$ts", now]}]}, 1000]}
+        refilled = {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]}
+        try:
+            doc = await self.col.find_one_and_update(
+                {"_id": key},
+                [
+                    {"$set": {"tokens": refilled, "ts": now}},
+                    {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                    {"$set": {
+                        "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                        "expiresAt": now + timedelta(seconds=burst / rate),
+                    }},
+                ],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except PyMongoError as e:
+            # Limite indisponível não pode derrubar login e checkout: deixa passar
+            logger.warning(f"Rate limit no Mongo indisponível, liberando requisição: {e}")
+            return True, 0
+        if doc["allowed"]:
+            return True, 0
+        return False, (cost - doc["tokens"]) / rate
+
+
+class RateLimiter:
+    def __init__(self, backend, rules: Optional[Dict[str, str]] = None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.backend = backend
+        self.enabled = enabled
+        rules = rules or {
+            name: os.getenv(f"RATE_LIMIT_{name.upper()}", default) for name, default in DEFAULT_RULES.items()
+        }
+        self.rules = {name: parse_budget(budget) for name, budget in rules.items()}
+
+    async def check(self, rule: str, key: str, message: str = "Too many requests"):
+        """Consome um token de `rule` para `key`; 429 com Retry-After se o bucket estiver vazio."""
+        if not self.enabled or not key:
+            return
+        rate, burst = self.rules[rule]
+        allowed, retry_after = await self.backend.take(f"{rule}:{key}", rate, burst)
+        if not allowed:
+            rate_limited.inc(rule)
+            raise HTTPException(429, message, headers={"Retry-After": str(max(math.ceil(retry_after), 1))})
+
+    def by_ip(self, rule: str, message: str = "Too many requests"):
+        """Dependência FastAPI que limita a rota pelo IP do cliente."""
+        async def dependency(request: Request):
+            await self.check(rule, client_ip(request), message)
+        return dependency
+
+
+def client_ip(request: Request) -> str:
+    # Atrás do proxy o uvicorn (proxy_headers, ver run.py) já troca pelo X-Forwarded-For,
+    # mas só quando a conexão vem de FORWARDED_ALLOW_IPS
+    return request.client.host if request.client else ""
+
+
+class LoadShedMiddleware:
+    """Recusa com 503 quando o worker já tem `max_in_flight` requisições em andamento."""
+
+    # Probes e métricas precisam responder mesmo sob carga; SSE/long-poll ficam
+    # abertos por minutos e não representam trabalho do event loop
+    EXEMPT_PREFIXES = ("/api/health", "/metrics")
+    EXEMPT_SUFFIXES = ("/events", "/wait")
+
+    def __init__(self, app, max_in_flight: int = MAX_IN_FLIGHT):
+        self.app = app
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_in_flight <= 0:
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        if path.startswith(self.EXEMPT_PREFIXES) or path.endswith(self.EXEMPT_SUFFIXES):
+            return await self.app(scope, receive, send)
+        if self.in_flight >= self.max_in_flight:
+            shed_requests.inc()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [(b"content-type", b"application/json"), (b"retry-after", b"1")],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Server overloaded, try again"}'})
+            return
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,192 @@
+# Reconciliação de pedidos pendentes.
+# PIX e boleto ficam "pending" até o webhook chegar; se ele se perder, o pedido
+# fica pendente para sempre. Periodicamente buscamos pedidos pendentes sem
+# atualização há RECONCILE_STALE_AFTER segundos (índice status+updatedAt),
+# consultamos a busca de pagamentos do gateway por external_reference em lotes
+# com paralelismo limitado e aplicamos as mudanças com um bulk_write por lote.
+# PIX/boleto ainda pendentes depois de date_of_expiration viram "expired".
+# Só um processo reconcilia por vez (lease na coleção locks).
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from dates import to_utc, utcnow
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", 60))
+RECONCILE_STALE_AFTER = float(os.getenv("RECONCILE_STALE_AFTER", 600))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 100))
+RECONCILE_MAX_PER_RUN = int(os.getenv("RECONCILE_MAX_PER_RUN", 2000))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", 5))
+# Intervalo máximo entre ciclos depois de erros seguidos
+RECONCILE_MAX_BACKOFF = float(os.getenv("RECONCILE_MAX_BACKOFF", 900))
+
+EXPIRING_METHODS = ("pix", "boleto")
+
+
+class Reconciler:
+    def __init__(self, db, gateway_getter, updater):
+        self.db = db
+        self.orders = db.orders
+        # O gateway é criado no lifespan; recebemos uma função que o devolve
+        self.gateway_getter = gateway_getter
+        self.updater = updater
+        self.owner = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "runs": 0,
+            "lastRunAt": None,
+            "lastRunSeconds": None,
+            "lastRunChecked": 0,
+            "checked": 0,
+            "updated": 0,
+            "expired": 0,
+            "errors": 0,
+            "stalePending": None,
+            "oldestPendingAgeSeconds": None,
+        }
+
+    async def ensure_indexes(self):
+        await self.orders.create_index([("status", 1), ("updatedAt", 1)])
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.db.locks.delete_one({"_id": "reconciler", "owner": self.owner})
+        except PyMongoError as e:
+            # O lease expira sozinho; não impede o shutdown
+            logger.warning(f"Não foi possível liberar o lease da reconciliação: {e}")
+
+    async def _loop(self):
+        failures = 0
+        while True:
+            try:
+                if await self._acquire_lease():
+                    await self.run_once()
+                failures = 0
+            except PyMongoError as e:
+                failures += 1
+                self.stats["errors"] += 1
+                logger.error(f"Erro na reconciliação de pedidos: {e}")
+            except Exception:
+                # Pedido malformado, erro do gateway ou bug: registra e continua, com intervalo crescente
+                failures += 1
+                self.stats["errors"] += 1
+                logger.exception("Erro inesperado na reconciliação de pedidos")
+            await asyncio.sleep(min(RECONCILE_INTERVAL * 2 ** failures, RECONCILE_MAX_BACKOFF))
+
+    async def _acquire_lease(self) -> bool:
+        now = utcnow()
+        try:
+            await self.db.locks.find_one_and_update(
+                {"_id": "reconciler", "$or": [{"owner": self.owner}, {"until": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "until": now + timedelta(seconds=RECONCILE_INTERVAL * 2)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # Outro processo tem o lease válido
+            return False
+
+    async def run_once(self) -> dict:
+        started = time.monotonic()
+        now = utcnow()
+        cutoff = now - timedelta(seconds=RECONCILE_STALE_AFTER)
+        stale = {
+            "status": "pending",
+            "updatedAt": {"$lt": cutoff},
+            "$or": [{"reconciledAt": {"$exists": False}}, {"reconciledAt": {"$lt": cutoff}}],
+        }
+        checked = 0
+        while checked < RECONCILE_MAX_PER_RUN:
+            batch = await self.orders.find(
+                stale, {"_id": 0, "id": 1, "paymentMethod": 1, "paymentExpiresAt": 1}
+            ).sort("updatedAt", 1).limit(RECONCILE_BATCH_SIZE).to_list(RECONCILE_BATCH_SIZE)
+            if not batch:
+                break
+            breaker = self.gateway_getter().breaker
+            if breaker.state == "open":
+                # Sem gateway não há o que reconciliar; tenta de novo na próxima rodada
+                logger.warning(f"Reconciliação adiada: circuito do MercadoPago aberto por {breaker.retry_after():.0f}s")
+                break
+            await self._reconcile_batch(batch, now)
+            checked += len(batch)
+
+        await self._update_lag(now)
+        self.stats.update({
+            "runs": self.stats["runs"] + 1,
+            "lastRunAt": now.isoformat(),
+            "lastRunSeconds": round(time.monotonic() - started, 3),
+            "lastRunChecked": checked,
+        })
+        self.stats["checked"] += checked
+        if checked:
+            logger.info(f"🔄 Reconciliação: {checked} pedidos pendentes verificados")
+        return self.stats
+
+    async def _reconcile_batch(self, batch: list, now: datetime):
+        gateway = self.gateway_getter()
+        sem = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+        async def search(order_id):
+            async with sem:
+                res = await gateway.search_payments(
+                    external_reference=order_id, sort="date_created", criteria="desc"
+                )
+            if res["status"] != 200:
+                raise RuntimeError(f"busca retornou HTTP {res['status']}")
+            results = res["response"].get("results", [])
+            return results[0] if results else None
+
+        found = await asyncio.gather(*(search(o["id"]) for o in batch), return_exceptions=True)
+
+        payments, overrides = [], {}
+        for order, payment in zip(batch, found):
+            if isinstance(payment, BaseException):
+                self.stats["errors"] += 1
+                logger.warning(f"Falha ao buscar pagamento do pedido {order['id']}: {payment}")
+                continue
+            if payment is None:
+                continue
+            payments.append(payment)
+            expires_at = to_utc(payment.get("date_of_expiration") or order.get("paymentExpiresAt"))
+            if (order.get("paymentMethod") in EXPIRING_METHODS and payment.get("status") in ("pending", "in_process")
+                    and expires_at and expires_at < now):
+                overrides[order["id"]] = "expired"
+
+        changes = await self.updater.apply(payments, overrides) if payments else []
+        self.stats["updated"] += len(changes)
+        self.stats["expired"] += sum(1 for c in changes if c["status"] == "expired")
+        # Marca os que continuam pendentes para não consultá-los de novo antes do próximo ciclo
+        await self.orders.update_many(
+            {"id": {"$in": [o["id"] for o in batch]}, "status": "pending"},
+            {"$set": {"reconciledAt": now}},
+        )
+
+    async def _update_lag(self, now: datetime):
+        cutoff = now - timedelta(seconds=RECONCILE_STALE_AFTER)
+        self.stats["stalePending"] = await self.orders.count_documents(
+            {"status": "pending", "updatedAt": {"$lt": cutoff}}
+        )
+        oldest = await self.orders.find_one(
+            {"status": "pending"}, {"_id": 0, "updatedAt": 1}, sort=[("updatedAt", 1)]
+        )
+        oldest_at = to_utc(oldest.get("updatedAt")) if oldest else None
+        self.stats["oldestPendingAgeSeconds"] = round((now - oldest_at).total_seconds()) if oldest_at else 0
@@ -0,0 +1,263 @@
+# Relatórios de vendas pré-agregados.
+# Cada pedido criado ou com status alterado faz um $inc nos documentos da hora
+# e do dia em que foi criado (sales_rollups): pedidos e valor por status,
+# por método de pagamento e, para aprovados, receita por método e por produto.
+# Valores em centavos inteiros. Os relatórios do admin só leem esses
+# documentos (no máximo um por hora/dia do período), não importa o volume.
+# Uma compactação noturna (um worker por noite, marcado em locks) recalcula
+# os últimos dias fechados a partir de orders, lendo de secundário quando
+# houver, e corrige o que os incrementos perderam (queda entre o pedido e o
+# $inc, pedidos anteriores a este módulo).
+# Dias e horas seguem ROLLUP_TIMEZONE (padrão UTC).
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from pymongo import ReadPreference, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from dates import to_utc, utcnow
+from pricing import from_cents, to_cents
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_TIMEZONE = ZoneInfo(os.environ["ROLLUP_TIMEZONE"]) if os.getenv("ROLLUP_TIMEZONE") else timezone.utc
+# Hora local (ROLLUP_TIMEZONE) da compactação e quantos dias fechados ela refaz
+ROLLUP_COMPACT_HOUR = int(os.getenv("ROLLUP_COMPACT_HOUR", 3))
+ROLLUP_COMPACT_DAYS = int(os.getenv("ROLLUP_COMPACT_DAYS", 2))
+ROLLUP_MAX_BUCKETS = 1000
+
+ORDER_FIELDS = {"_id": 0, "id": 1, "createdAt": 1, "status": 1, "paymentMethod": 1, "total": 1,
+                "items.productId": 1, "items.price": 1, "items.quantity": 1}
+
+
+def buckets(created_at: datetime) -> List[Tuple[str, str, datetime]]:
+    """(período, _id, início em UTC) da hora e do dia locais de `created_at`."""
+    local = to_utc(created_at).astimezone(ROLLUP_TIMEZONE)
+    hour = local.replace(minute=0, second=0, microsecond=0)
+    day = datetime.combine(local.date(), time(), ROLLUP_TIMEZONE)
+    return [
+        ("hour", f"hour:{hour.isoformat()}", hour.astimezone(timezone.utc)),
+        ("day", f"day:{local.date().isoformat()}", day.astimezone(timezone.utc)),
+    ]
+
+
+def status_increments(order: dict, status: str, sign: int) -> dict:
+    total = to_cents(order.get("total", 0))
+    inc = {f"byStatus.{status}.count": sign, f"byStatus.{status}.amountCents": sign * total}
+    if status == "approved":
+        method = order.get("paymentMethod", "unknown")
+        inc["revenueCents"] = sign * total
+        inc[f"byMethod.{method}.approved"] = sign
+        inc[f"byMethod.{method}.revenueCents"] = sign * total
+        for item in order.get("items", []):
+            # Receita por produto é o valor de tabela (antes do cupom)
+            prefix = f"byProduct.{item['productId']}"
+            inc[f"{prefix}.quantity"] = inc.get(f"{prefix}.quantity", 0) + sign * item["quantity"]
+            inc[f"{prefix}.revenueCents"] = (
+                inc.get(f"{prefix}.revenueCents", 0) + sign * to_cents(item["price"]) * item["quantity"]
+            )
+    return inc
+
+
+def created_increments(order: dict) -> dict:
+    return merge_increments(
+        {"orders": 1, f"byMethod.{order.get('paymentMethod', 'unknown')}.count": 1},
+        status_increments(order, order["status"], 1),
+    )
+
+
+def merge_increments(*parts: dict) -> dict:
+    merged = defaultdict(int)
+    for part in parts:
+        for path, value in part.items():
+            merged[path] += value
+    return {path: value for path, value in merged.items() if value}
+
+
+def _add_path(doc: dict, path: str, value):
+    *parents, leaf = path.split(".")
+    for key in parents:
+        doc = doc.setdefault(key, {})
+    doc[leaf] = doc.get(leaf, 0) + value
+
+
+def add_totals(target: dict, source: dict):
+    """Soma os contadores de `source` em `target` (recursivo)."""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            add_totals(target.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            target[key] = target.get(key, 0) + value
+
+
+def present(doc: dict) -> dict:
+    """Centavos -> reais para a resposta (revenueCents -> revenue)."""
+    out = {}
+    for key, value in doc.items():
+        if isinstance(value, dict):
+            out[key] = present(value)
+        elif key.endswith("Cents"):
+            out[key[:-5]] = from_cents(value)
+        else:
+            out[key] = value
+    return out
+
+
+class SalesRollups:
+    def __init__(self, db):
+        self.db = db
+        self.col = db.sales_rollups
+        # Compactação lê muito: secundário quando existir, para não pesar no primário
+        self.orders = db.orders.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self):
+        await self.col.create_index([("period", 1), ("start", 1)])
+        await self.db.orders.create_index("createdAt")
+
+    def start(self):
+        self._task = asyncio.create_task(self._nightly())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ---------- incrementos ----------
+    async def _apply(self, created_at, inc: dict):
+        if not inc or not created_at:
+            return
+        await self.col.bulk_write([
+            UpdateOne({"_id": key}, {"$inc": inc, "$setOnInsert": {"period": period, "start": start}}, upsert=True)
+            for period, key, start in buckets(created_at)
+        ], ordered=False)
+
+    async def order_created(self, order: dict):
+        try:
+            await self._apply(order.get("createdAt"), created_increments(order))
+        except PyMongoError as e:
+            # A compactação noturna recalcula o dia
+            logger.error(f"Falha ao atualizar relatório de vendas do pedido {order.get('id')}: {e}")
+
+    async def on_status_changes(self, changes: list):
+        """Listener do OrderStatusUpdater."""
+        moved = {c["orderId"]: c for c in changes if c.get("previousStatus") and c["previousStatus"] != c["status"]}
+        if not moved:
+            return
+        try:
+            async for order in self.db.orders.find({"id": {"$in": list(moved)}}, ORDER_FIELDS):
+                change = moved[order["id"]]
+                await self._apply(order.get("createdAt"), merge_increments(
+                    status_increments(order, change["previousStatus"], -1),
+                    status_increments(order, change["status"], 1),
+                ))
+        except PyMongoError as e:
+            logger.error(f"Falha ao atualizar relatório de vendas: {e}")
+
+    # ---------- compactação ----------
+    async def compact_day(self, day: date) -> int:
+        """Recalcula as horas e o dia `day` (fuso dos relatórios) a partir de orders."""
+        start = datetime.combine(day, time(), ROLLUP_TIMEZONE).astimezone(timezone.utc)
+        end = datetime.combine(day + timedelta(days=1), time(), ROLLUP_TIMEZONE).astimezone(timezone.utc)
+        docs = {}
+        cursor = start
+        while cursor < end:
+            # Horas sem pedido também são gravadas (zeradas), substituindo incrementos errados
+            for period, key, bucket_start in buckets(cursor):
+                docs.setdefault(key, {"_id": key, "period": period, "start": bucket_start, "orders": 0})
+            cursor += timedelta(hours=1)
+
+        count = 0
+        async for order in self.orders.find({"createdAt": {"$gte": start, "$lt": end}}, ORDER_FIELDS):
+            count += 1
+            inc = created_increments(order)
+            for _, key, _ in buckets(order["createdAt"]):
+                for path, value in inc.items():
+                    _add_path(docs[key], path, value)
+
+        now = utcnow()
+        await self.col.bulk_write(
+            [ReplaceOne({"_id": key}, {**doc, "compactedAt": now}, upsert=True) for key, doc in docs.items()],
+            ordered=False,
+        )
+        return count
+
+    async def compact(self, days: int = ROLLUP_COMPACT_DAYS, include_today: bool = False) -> dict:
+        today = utcnow().astimezone(ROLLUP_TIMEZONE).date()
+        first = 0 if include_today else 1
+        summary = {}
+        for offset in range(first, first + days):
+            day = today - timedelta(days=offset)
+            summary[day.isoformat()] = await self.compact_day(day)
+        logger.info(f"📊 Relatórios de vendas compactados: {summary}")
+        return summary
+
+    async def _nightly(self):
+        while True:
+            now = utcnow().astimezone(ROLLUP_TIMEZONE)
+            run_at = datetime.combine(now.date(), time(ROLLUP_COMPACT_HOUR), ROLLUP_TIMEZONE)
+            if run_at <= now:
+                run_at += timedelta(days=1)
+            await asyncio.sleep((run_at - now).total_seconds())
+            try:
+                # Só um worker compacta cada noite
+                await self.db.locks.insert_one({"_id": f"rollups:{run_at.date().isoformat()}", "at": utcnow()})
+            except DuplicateKeyError:
+                continue
+            except Exception:
+                logger.exception("Erro ao agendar compactação dos relatórios")
+                continue
+            try:
+                await self.compact()
+            except Exception:
+                # Um pedido malformado não pode cancelar as próximas noites
+                logger.exception("Erro na compactação dos relatórios de vendas")
+
+    # ---------- leitura ----------
+    async def report(self, period: str, start: datetime, end: datetime) -> dict:
+        docs = await self.col.find(
+            {"period": period, "start": {"$gte": start, "$lt": end}}, {"_id": 0, "compactedAt": 0}
+        ).sort("start", 1).to_list(ROLLUP_MAX_BUCKETS)
+        totals = {}
+        for doc in docs:
+            add_totals(totals, {k: v for k, v in doc.items() if k not in ("period", "start")})
+        return {
+            "period": period,
+            "start": start,
+            "end": end,
+            "totals": present(totals),
+            "buckets": [present(doc) for doc in docs],
+        }
+
+    async def top_products(self, start: datetime, end: datetime, limit: int,
+                           products: Optional[Dict[str, dict]] = None) -> List[dict]:
+        totals = {}
+        async for doc in self.col.find(
+            {"period": "day", "start": {"$gte": start, "$lt": end}}, {"_id": 0, "byProduct": 1}
+        ).limit(ROLLUP_MAX_BUCKETS):
+            add_totals(totals, doc.get("byProduct", {}))
+        ranked = sorted(totals.items(), key=lambda item: -item[1].get("revenueCents", 0))[:limit]
+        return [
+            {"productId": product_id, "name": (products or {}).get(product_id, {}).get("name"), **present(values)}
+            for product_id, values in ranked
+        ]
+
+
+def period_range(period: str, start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """Período padrão: últimas 48 horas ou últimos 30 dias; limitado a ROLLUP_MAX_BUCKETS buckets."""
+    step = timedelta(hours=1) if period == "hour" else timedelta(days=1)
+    end = to_utc(end) or utcnow()
+    start = max(to_utc(start) or end - step * (48 if period == "hour" else 30), end - step * ROLLUP_MAX_BUCKETS)
+    # Começa no início da hora/dia que contém `start`
+    return {p: bucket_start for p, _, bucket_start in buckets(start)}[period], end
+
@@ -0,0 +1,54 @@
+# Entrada de produção: vários workers do uvicorn, cada um com seu event loop,
+# seu pool do Mongo e seu cliente do MercadoPago (criados no lifespan do
+# server.py, depois do fork). Importar o server.py não abre conexões, então
+# subir um worker novo é rápido durante um deploy gradual.
+# Execute com: python run.py
+#
+# Variáveis:
+#   WEB_CONCURRENCY       workers (padrão: núcleos disponíveis para o processo)
+#   PORT / HOST           endereço de escuta (padrão 0.0.0.0:10000)
+#   KEEPALIVE_TIMEOUT     segundos de keep-alive HTTP (padrão 5)
+#   GRACEFUL_TIMEOUT      segundos para drenar requisições no shutdown (padrão 30)
+#   ACCESS_LOG            1 para logar cada requisição (padrão desligado)
+#   FORWARDED_ALLOW_IPS   IPs/CIDRs do proxy cujo X-Forwarded-For é aceito (padrão 127.0.0.1);
+#                         use o endereço do load balancer, nunca "*" com a porta exposta
+#   HASH_WORKERS          processos de bcrypt por worker (padrão: núcleos / WEB_CONCURRENCY)
+#   MONGO_MAX_POOL_SIZE e demais MONGO_* ficam no server.py, valem por worker
+
+import os
+
+import uvicorn
+
+
+def default_workers() -> int:
+    try:
+        # Respeita o limite de CPUs do container/cgroup quando houver affinity
+        return max(len(os.sched_getaffinity(0)), 1)
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def main():
+    workers = int(os.getenv("WEB_CONCURRENCY") or default_workers())
+    # Os workers herdam o valor: o pool de bcrypt (hashing.py) se dimensiona por ele
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "server:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 10000)),
+        workers=workers,
+        # O server.py configura logging em JSON; sem log_config o uvicorn não instala os próprios handlers
+        log_config=None,
+        access_log=os.getenv("ACCESS_LOG", "0").lower() in ("1", "true", "yes"),
+        proxy_headers=True,
+        # Só o proxy confiável pode informar o IP do cliente; de qualquer outro par o
+        # X-Forwarded-For é ignorado (senão cada IP forjado ganha um bucket novo no rate limit)
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        timeout_keep_alive=int(os.getenv("KEEPALIVE_TIMEOUT", 5)),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", 30)),
+        backlog=int(os.getenv("BACKLOG", 2048)),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Busca de produtos em memória.
+# Índice invertido sobre name, description, platform e features, montado a
+# partir do snapshot do catálogo e atualizado por diferença a cada nova versão
+# (só produtos novos, alterados ou removidos são reindexados).
+# Termos são normalizados sem acento e em minúsculas ("Música" == "musica");
+# cada termo da busca casa por prefixo ("netf" acha "netflix"), o que atende o
+# autocomplete. O vocabulário fica ordenado para achar os prefixos com bisect.
+# Contagem por plataforma (facet) é feita sobre os resultados antes do filtro
+# de plataforma, para o front mostrar as outras opções.
+
+import bisect
+import heapq
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache import TTLCache
+
+# Peso de um termo por campo onde aparece (vale o maior)
+FIELD_WEIGHTS = (("name", 4), ("platform", 3), ("features", 2), ("description", 1))
+# Termo igual ao da busca vale mais que um termo que só começa com ele
+EXACT_BONUS = 1
+
+# Buscas repetidas (autocomplete) respondem do cache até a próxima versão do catálogo
+RESULT_CACHE_SIZE = 2_000
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    """Minúsculas e sem acento."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(fold(text))
+
+
+def product_terms(product: dict) -> Dict[str, int]:
+    terms: Dict[str, int] = {}
+    for field, weight in FIELD_WEIGHTS:
+        value = product.get(field)
+        if not value:
+            continue
+        text = " ".join(value) if isinstance(value, list) else str(value)
+        for token in tokenize(text):
+            if terms.get(token, 0) < weight:
+                terms[token] = weight
+    return terms
+
+
+class SearchIndex:
+    def __init__(self):
+        self.products: Dict[str, dict] = {}
+        self._terms: Dict[str, Dict[str, int]] = {}
+        # id -> (preço, plataforma normalizada, plataforma, nome): o que o filtro e a ordenação usam
+        self._meta: Dict[str, Tuple[float, str, str, str]] = {}
+        # termo -> {id do produto: peso}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._vocab: List[str] = []
+        self.version: Optional[str] = None
+        # Para a busca sem termos nem faixa de preço (a mais cara): contagem por plataforma e ordem por nome prontas
+        self._platform_counts: Dict[str, int] = defaultdict(int)
+        self._by_name: Optional[List[Tuple[str, str]]] = None
+        self._results = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=float("inf"))
+
+    # ---------- manutenção ----------
+    def on_catalog_change(self, old, new):
+        """Listener do Catalog: reindexa só o que mudou entre os snapshots."""
+        # Sem snapshot anterior (primeira carga) compara com o que já está indexado
+        previous = old.by_id if old else dict(self.products)
+        for product_id in previous.keys() - new.by_id.keys():
+            self.remove(product_id)
+        for product_id, product in new.by_id.items():
+            if previous.get(product_id) != product or product_id not in self.products:
+                self.add(product)
+        self.version = new.version
+        self._results.clear()
+        self._browse_order()
+
+    def add(self, product: dict):
+        product_id = product["id"]
+        if product_id in self.products:
+            self.remove(product_id)
+        terms = product_terms(product)
+        self.products[product_id] = product
+        self._terms[product_id] = terms
+        platform = product.get("platform", "")
+        self._meta[product_id] = (product.get("price", 0), fold(platform), platform, product.get("name", ""))
+        self._platform_counts[platform] += 1
+        self._by_name = None
+        for term, weight in terms.items():
+            postings = self._postings[term]
+            if not postings:
+                bisect.insort(self._vocab, term)
+            postings[product_id] = weight
+
+    def remove(self, product_id: str):
+        self.products.pop(product_id, None)
+        meta = self._meta.pop(product_id, None)
+        if meta:
+            self._platform_counts[meta[2]] -= 1
+            if not self._platform_counts[meta[2]]:
+                del self._platform_counts[meta[2]]
+            self._by_name = None
+        for term in self._terms.pop(product_id, {}):
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                i = bisect.bisect_left(self._vocab, term)
+                if i < len(self._vocab) and self._vocab[i] == term:
+                    del self._vocab[i]
+
+    # ---------- consulta ----------
+    def _expand(self, token: str) -> Dict[str, int]:
+        """Produtos com algum termo começando por `token` -> melhor peso."""
+        scores: Dict[str, int] = {}
+        i = bisect.bisect_left(self._vocab, token)
+        while i < len(self._vocab) and self._vocab[i].startswith(token):
+            term = self._vocab[i]
+            bonus = EXACT_BONUS if term == token else 0
+            for product_id, weight in self._postings[term].items():
+                score = weight + bonus
+                if scores.get(product_id, 0) < score:
+                    scores[product_id] = score
+            i += 1
+        return scores
+
+    def _match(self, tokens: Iterable[str]) -> Dict[str, int]:
+        scores: Optional[Dict[str, int]] = None
+        for token in sorted(set(tokens), key=len, reverse=True):
+            found = self._expand(token)
+            if scores is None:
+                scores = found
+            else:
+                # Todos os termos precisam casar (E); soma os pesos
+                scores = {pid: s + found[pid] for pid, s in scores.items() if pid in found}
+            if not scores:
+                return {}
+        return scores if scores is not None else {pid: 0 for pid in self.products}
+
+    def search(self, q: str = "", platform: Optional[str] = None, min_price: Optional[float] = None,
+               max_price: Optional[float] = None, limit: int = 20) -> dict:
+        key = (q, platform, min_price, max_price, limit)
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached
+
+        tokens = tokenize(q or "")
+        wanted_platform = fold(platform) if platform else None
+        if not tokens and min_price is None and max_price is None:
+            result = self._browse(wanted_platform, limit)
+            self._results.set(key, result)
+            return result
+
+        scores = self._match(tokens)
+        low = float("-inf") if min_price is None else min_price
+        high = float("inf") if max_price is None else max_price
+        meta = self._meta
+        facets: Dict[str, int] = defaultdict(int)
+        hits = []
+        for product_id, score in scores.items():
+            price, folded, name_platform, name = meta[product_id]
+            if price < low or price > high:
+                continue
+            facets[name_platform] += 1
+            if wanted_platform and folded != wanted_platform:
+                continue
+            hits.append((-score, name, product_id))
+        top = heapq.nsmallest(limit, hits)
+        result = {
+            "items": [self.products[product_id] for _, _, product_id in top],
+            "total": len(hits),
+            "facets": {"platform": _sorted_facets(facets)},
+        }
+        self._results.set(key, result)
+        return result
+
+    def _browse_order(self) -> List[Tuple[str, str]]:
+        if self._by_name is None:
+            self._by_name = sorted((meta[3], product_id) for product_id, meta in self._meta.items())
+        return self._by_name
+
+    def _browse(self, wanted_platform: Optional[str], limit: int) -> dict:
+        items = []
+        for _, product_id in self._browse_order():
+            if len(items) == limit:
+                break
+            if not wanted_platform or self._meta[product_id][1] == wanted_platform:
+                items.append(self.products[product_id])
+        total = sum(n for p, n in self._platform_counts.items() if not wanted_platform or fold(p) == wanted_platform)
+        return {"items": items, "total": total, "facets": {"platform": _sorted_facets(self._platform_counts)}}
+
+
+def _sorted_facets(facets: Dict[str, int]) -> Dict[str, int]:
+    return dict(sorted(facets.items(), key=lambda f: (-f[1], f[0])))
@@ -1,32 +1,69 @@
 # SALVE ESTE ARQUIVO COMO: server.py
-# Execute com: python server.py
+# Execute com: python server.py (desenvolvimento) ou python run.py (produção, vários workers)
 
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, BackgroundTasks, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, Header, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-import os, logging, uuid, json, jwt, uvicorn
+import os, logging, uuid, json, jwt, uvicorn, time, secrets, asyncio
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
-from datetime import datetime, timezone, timedelta
-import mercadopago
+from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
-from passlib.context import CryptContext
+from mp_gateway import MercadoPagoGateway, GatewayError, GatewayTimeout, CircuitOpen
+from hashing import PasswordHasher
+from cache import TTLCache
+from catalog import Catalog, make_etag
+from pagination import paginate
+from carts import CartStore, CartNotOwned
+from pricing import PricingEngine, PricingError, from_cents
+from idempotency import IdempotencyStore, MarkCharged, fingerprint
+from order_status import OrderStatusUpdater, order_status
+from webhook_queue import WebhookQueue
+from reconciler import Reconciler
+from order_events import OrderEvents, TERMINAL_STATUSES
+from health import Readiness
+from stock import StockManager, OutOfStock
+from coupons import CouponStore, CouponError
+from search import SearchIndex
+from rollups import SalesRollups, period_range
+from dates import CODEC_OPTIONS, utcnow, to_utc
+from rate_limit import RateLimiter, MemoryBackend, MongoBackend, LoadShedMiddleware, RATE_LIMIT_BACKEND, client_ip
+from payment_artifacts import PaymentArtifacts, CONTENT_TYPES as ARTIFACT_TYPES
+from logging_setup import setup_logging, log_payload, mask_email, RequestIdMiddleware
+import metrics
+from pymongo.errors import PyMongoError
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # Config
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+DB_NAME = os.environ['DB_NAME']
+# Pool por worker: o total de conexões no Mongo é WEB_CONCURRENCY x MONGO_MAX_POOL_SIZE
+MONGO_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 5)),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60_000)),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2_000)),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5_000)),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5_000)),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 20_000)),
+    "readPreference": os.getenv("MONGO_READ_PREFERENCE", "primary"),
+    "retryWrites": True,
+    "appname": os.getenv("MONGO_APP_NAME", "streamshop-api"),
+    # Datas voltam do banco como datetime em UTC (ver dates.py)
+    **CODEC_OPTIONS,
+}
 
 MERCADOPAGO_ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN")
 MERCADOPAGO_PUBLIC_KEY = os.getenv("MERCADOPAGO_PUBLIC_KEY")
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = "HS256"
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
 
 if not MERCADOPAGO_ACCESS_TOKEN:
     raise RuntimeError("MERCADOPAGO_ACCESS_TOKEN NÃO DEFINIDO")
@@ -34,14 +71,36 @@ if not MERCADOPAGO_ACCESS_TOKEN:
 if not MERCADOPAGO_PUBLIC_KEY:
     raise RuntimeError("MERCADOPAGO_PUBLIC_KEY NÃO DEFINIDO")
 
-print("🔑 MP ACCESS TOKEN:", MERCADOPAGO_ACCESS_TOKEN[:10] if MERCADOPAGO_ACCESS_TOKEN else None)
-print("🔑 MP PUBLIC KEY:", MERCADOPAGO_PUBLIC_KEY[:10] if MERCADOPAGO_PUBLIC_KEY else None)
-
-mp = mercadopago.SDK(MERCADOPAGO_ACCESS_TOKEN)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Cliente do Mongo, gateway e serviços são criados por worker no lifespan (init_services)
+client: Optional[AsyncIOMotorClient] = None
+db = None
+gateway: Optional[MercadoPagoGateway] = None
+catalog: Optional[Catalog] = None
+carts: Optional[CartStore] = None
+pricing: Optional[PricingEngine] = None
+idempotency: Optional[IdempotencyStore] = None
+order_updates: Optional[OrderStatusUpdater] = None
+reconciler: Optional[Reconciler] = None
+order_events: Optional[OrderEvents] = None
+artifacts: Optional[PaymentArtifacts] = None
+webhooks: Optional[WebhookQueue] = None
+readiness: Optional[Readiness] = None
+stock: Optional[StockManager] = None
+coupons: Optional[CouponStore] = None
+rollups: Optional[SalesRollups] = None
+hasher = PasswordHasher()
+# Busca de produtos: índice em memória atualizado a cada versão do catálogo
+search_index = SearchIndex()
+# Em memória até o lifespan; com RATE_LIMIT_BACKEND=mongo o bucket passa a ser compartilhado
+rate_limiter = RateLimiter(MemoryBackend())
+# Usuários autenticados e JWTs já decodificados (por processo)
+user_cache = TTLCache(maxsize=int(os.getenv("USER_CACHE_SIZE", 10_000)), ttl=float(os.getenv("USER_CACHE_TTL", 60)))
+token_cache = TTLCache(maxsize=int(os.getenv("TOKEN_CACHE_SIZE", 20_000)), ttl=float(os.getenv("TOKEN_CACHE_TTL", 300)))
+# Status de pagamento consultado no gateway: polling do checkout não vira uma chamada ao MP por request
+payment_status_cache = TTLCache(maxsize=50_000, ttl=float(os.getenv("PAYMENT_STATUS_TTL", 5)))
 security = HTTPBearer()
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # ========== VALORES MÍNIMOS POR MÉTODO ==========
@@ -51,19 +110,124 @@ MIN_AMOUNTS = {
     "credit_card": 0.50,
 }
 
+# ========== PAGINAÇÃO ==========
+# Cada combinação de filtros de igualdade + ordenação tem um índice composto
+# (igualdade, ordenação, id), criado no lifespan
+PRODUCT_SORTS = {
+    "price": [("price", 1), ("id", 1)],
+    "-price": [("price", -1), ("id", -1)],
+    "name": [("name", 1), ("id", 1)],
+}
+PRODUCT_FILTER_FIELDS = [[], ["platform"], ["isAvailable"], ["platform", "isAvailable"]]
+ORDER_SORT = [("createdAt", -1), ("id", -1)]
+
+# Projeções explícitas de pedidos: blobs (QR code/boleto de pedidos antigos) nunca saem
+ORDER_FIELDS = (
+    "id", "userId", "sessionId", "items", "subtotal", "discount", "total", "customer", "paymentMethod",
+    "mercadopagoPaymentId", "mercadopagoStatus", "status", "paymentExpiresAt", "pixQrCode", "createdAt", "updatedAt",
+)
+ORDER_LIST_FIELDS = ("id", "items", "subtotal", "discount", "total", "paymentMethod", "status", "createdAt", "updatedAt")
+
+INDEXED_COLLECTIONS = ("users", "products", "orders", "carts", "idempotency_keys", "webhook_events", "payment_artifacts",
+                       "stock_shards", "stock_reservations", "coupons", "coupon_redemptions", "sales_rollups")
+
+async def create_indexes():
+    await db.users.create_index("email", unique=True)
+    await db.users.create_index("id", unique=True)
+    await db.products.create_index("id", unique=True)
+    await db.orders.create_index("id", unique=True)
+    for fields in PRODUCT_FILTER_FIELDS:
+        for sort_field in ("price", "name"):
+            await db.products.create_index([(f, 1) for f in fields] + [(sort_field, 1), ("id", 1)])
+    await db.orders.create_index([("userId", 1), *ORDER_SORT])
+    await db.orders.create_index([("userId", 1), ("status", 1), *ORDER_SORT])
+    await carts.ensure_indexes()
+    await idempotency.ensure_indexes()
+    await webhooks.ensure_indexes()
+    await reconciler.ensure_indexes()
+    await artifacts.ensure_indexes()
+    await stock.ensure_indexes()
+    await coupons.ensure_indexes()
+    await rollups.ensure_indexes()
+    if isinstance(rate_limiter.backend, MongoBackend):
+        await rate_limiter.backend.ensure_indexes()
+    await readiness.record_indexes(INDEXED_COLLECTIONS)
+    logger.info("✅ Database indexes created")
+
+async def retry_indexes(interval: float = 15):
+    # O pod fica fora do balanceador (readiness) até os índices existirem
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await create_indexes()
+            return
+        except Exception as e:
+            logger.error(f"Error creating indexes: {str(e)}")
+
+def init_services():
+    global client, db, gateway, catalog, carts, pricing, idempotency, order_updates, reconciler, \
+        order_events, artifacts, webhooks, readiness, stock, coupons, rollups
+    # Criado dentro do event loop do worker; nada de conexão aberta antes do fork
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[metrics.MongoCommandMetrics()], **MONGO_OPTIONS)
+    db = client[DB_NAME]
+    gateway = MercadoPagoGateway(MERCADOPAGO_ACCESS_TOKEN)
+    gateway.on_call = metrics.observe_gateway
+    catalog = Catalog(db)
+    catalog.listeners.append(search_index.on_catalog_change)
+    carts = CartStore(db)
+    coupons = CouponStore(db)
+    pricing = PricingEngine(db, catalog, coupons)
+    idempotency = IdempotencyStore(db)
+    order_updates = OrderStatusUpdater(db)
+    reconciler = Reconciler(db, lambda: gateway, order_updates)
+    order_events = OrderEvents(db)
+    artifacts = PaymentArtifacts(db)
+    webhooks = WebhookQueue(db, fetch_payment, order_updates.apply)
+    readiness = Readiness(db, catalog, lambda: gateway.breaker if gateway else None)
+    stock = StockManager(db, catalog)
+    rollups = SalesRollups(db)
+    if RATE_LIMIT_BACKEND == "mongo":
+        rate_limiter.backend = MongoBackend(db)
+    order_updates.listeners.append(order_events.on_status_changes)
+    order_updates.listeners.append(invalidate_payment_status)
+    order_updates.listeners.append(stock.on_status_changes)
+    order_updates.listeners.append(coupons.on_status_changes)
+    order_updates.listeners.append(rollups.on_status_changes)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    init_services()
+    index_task = None
     try:
-        await db.users.create_index("email", unique=True)
-        await db.products.create_index("id", unique=True)
-        await db.orders.create_index("id", unique=True)
-        logger.info("✅ Database indexes created")
+        await create_indexes()
     except Exception as e:
         logger.error(f"Error creating indexes: {str(e)}")
+        index_task = asyncio.create_task(retry_indexes())
+    hasher.start()
+    await catalog.start()
+    webhooks.start()
+    reconciler.start()
+    order_events.start()
+    stock.start()
+    rollups.start()
+    metric_tasks = [asyncio.create_task(metrics.monitor_loop_lag()), asyncio.create_task(collect_queue_metrics())]
+    readiness.invalidate()
     yield
+    for task in metric_tasks:
+        task.cancel()
+    if index_task:
+        index_task.cancel()
+    await rollups.stop()
+    await stock.stop()
+    await order_events.stop()
+    await reconciler.stop()
+    await webhooks.stop()
+    await catalog.stop()
+    hasher.shutdown()
+    await gateway.aclose()
     client.close()
 
-app = FastAPI(title="StreamShop API", lifespan=lifespan)
+app = FastAPI(title="StreamShop API", lifespan=lifespan, default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # ========== MODELS ==========
@@ -73,7 +237,7 @@ class User(BaseModel):
     firstName: str
     lastName: str
     phone: Optional[str] = None
-    createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    createdAt: datetime = Field(default_factory=utcnow)
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -81,10 +245,12 @@ class UserCreate(BaseModel):
     firstName: str
     lastName: str
     phone: Optional[str] = None
+    sessionId: Optional[str] = None
 
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
+    sessionId: Optional[str] = None
 
 class TokenResponse(BaseModel):
     token: str
@@ -105,6 +271,9 @@ class CartItem(BaseModel):
     productId: str
     quantity: int
 
+class CartQuantity(BaseModel):
+    quantity: int
+
 class Coupon(BaseModel):
     code: str
     discount: float
@@ -171,14 +340,52 @@ class PaymentResponse(BaseModel):
     pix: Optional[PixData] = None
     boleto: Optional[BoletoData] = None
 
+# ========== RESPOSTAS ==========
+# Dados que já saem validados (modelos construídos aqui, documentos do nosso
+# próprio banco) vão direto para o orjson: retornar um Response faz o FastAPI
+# pular jsonable_encoder e a revalidação do response_model (que continua
+# declarado só para a documentação).
+def fast_json(content, headers: Optional[dict] = None) -> Response:
+    return ORJSONResponse(content, headers=headers)
+
+def model_response(model: BaseModel) -> Response:
+    return ORJSONResponse(model.model_dump())
+
 # ========== AUTH ==========
 def create_token(user_id: str) -> str:
-    return jwt.encode({"user_id": user_id, "exp": datetime.now(timezone.utc) + timedelta(days=7)}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return jwt.encode({"user_id": user_id, "exp": utcnow() + timedelta(days=7)}, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def decode_token(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        # Nunca manter no cache além da expiração do próprio token
+        token_cache.set(token, payload, ttl=min(token_cache.ttl, payload.get("exp", 0) - time.time()))
+    return payload
+
+async def load_user(user_id: Optional[str]) -> Optional[dict]:
+    if not user_id:
+        return None
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        if user:
+            user_cache.set(user_id, user)
+    return dict(user) if user else None
+
+def invalidate_user(user_id: str):
+    user_cache.pop(user_id)
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    if not ADMIN_API_KEY:
+        raise HTTPException(403, "Admin API disabled")
+    if not x_admin_key or not secrets.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(403, "Forbidden")
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return await db.users.find_one({"id": payload.get("user_id")}, {"_id": 0})
+        payload = decode_token(credentials.credentials)
+        return await load_user(payload.get("user_id"))
     except:
         return None
 
@@ -186,8 +393,8 @@ async def get_optional_user(authorization: Optional[str] = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
         return None
     try:
-        payload = jwt.decode(authorization.split(" ")[1], JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return await db.users.find_one({"id": payload.get("user_id")}, {"_id": 0})
+        payload = decode_token(authorization.split(" ")[1])
+        return await load_user(payload.get("user_id"))
     except:
         return None
 
@@ -197,92 +404,353 @@ async def register(user_data: UserCreate):
         raise HTTPException(400, "Email already registered")
     user_dict = user_data.model_dump()
     password = user_dict.pop("password")
+    session_id = user_dict.pop("sessionId")
     user = User(**user_dict)
     doc = user.model_dump()
-    doc["password"] = pwd_context.hash(password)
-    doc["createdAt"] = doc["createdAt"].isoformat()
+    doc["password"] = await hasher.hash(password)
     await db.users.insert_one(doc)
-    return TokenResponse(token=create_token(user.id), user=user)
+    if session_id:
+        await carts.merge(session_id, user.id)
+    return model_response(TokenResponse(token=create_token(user.id), user=user))
 
-@api_router.post("/auth/login", response_model=TokenResponse)
+@api_router.post("/auth/login", response_model=TokenResponse, dependencies=[Depends(rate_limiter.by_ip("login_ip"))])
 async def login(creds: UserLogin):
+    # Por conta também: credential stuffing distribuído em vários IPs
+    await rate_limiter.check("login_account", creds.email.lower(), "Too many login attempts, try again later")
     user_doc = await db.users.find_one({"email": creds.email})
-    if not user_doc or not pwd_context.verify(creds.password, user_doc.get("password", "")):
+    if not user_doc:
+        raise HTTPException(401, "Invalid credentials")
+    ok, new_hash = await hasher.verify(creds.password, user_doc.get("password", ""))
+    if not ok:
         raise HTTPException(401, "Invalid credentials")
-    user_doc["createdAt"] = datetime.fromisoformat(user_doc["createdAt"]) if isinstance(user_doc["createdAt"], str) else user_doc["createdAt"]
+    if new_hash:
+        await db.users.update_one({"id": user_doc["id"]}, {"$set": {"password": new_hash}})
+        invalidate_user(user_doc["id"])
+    # Usuários ainda não migrados (migrate_datetimes.py) têm createdAt em string
+    user_doc["createdAt"] = to_utc(user_doc.get("createdAt")) or utcnow()
     user = User(**{k: v for k, v in user_doc.items() if k not in ["password", "_id"]})
-    return TokenResponse(token=create_token(user.id), user=user)
+    if creds.sessionId:
+        await carts.merge(creds.sessionId, user.id)
+    return model_response(TokenResponse(token=create_token(user.id), user=user))
 
 @api_router.get("/auth/me", response_model=User)
 async def get_me(current_user: dict = Depends(get_current_user)):
     if not current_user:
         raise HTTPException(401, "Not authenticated")
-    return User(**current_user)
+    return model_response(User(**current_user))
 
 # ========== PRODUCTS ==========
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+def cached_bytes(request: Request, body: bytes, etag: str, media_type: str, cache_control: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+def cached_json(request: Request, body: bytes, etag: str) -> Response:
+    return cached_bytes(request, body, etag, "application/json", "public, max-age=0, must-revalidate")
+
+def page_response(docs: list, next_cursor: Optional[str]) -> Response:
+    return fast_json(docs, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+
 @api_router.get("/products")
-async def get_products():
-    return await db.products.find({}, {"_id": 0}).to_list(100)
+async def get_products(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
+    platform: Optional[str] = None,
+    isAvailable: Optional[bool] = None,
+    minPrice: Optional[float] = Query(None, ge=0),
+    maxPrice: Optional[float] = Query(None, ge=0),
+    sort: Optional[str] = Query(None, pattern="^(price|-price|name)$"),
+):
+    # Sem paginação/filtros/ordenação: catálogo inteiro direto do snapshot em memória (ordem por id)
+    if limit is None and cursor is None and platform is None and isAvailable is None \
+            and minPrice is None and maxPrice is None and sort is None:
+        snap = await catalog.get()
+        return cached_json(request, snap.list_body, snap.etag)
+
+    query = {}
+    if platform is not None:
+        query["platform"] = platform
+    if isAvailable is not None:
+        query["isAvailable"] = isAvailable
+    if minPrice is not None or maxPrice is not None:
+        query["price"] = {k: v for k, v in (("$gte", minPrice), ("$lte", maxPrice)) if v is not None}
+    docs, next_cursor = await paginate(db.products, query, PRODUCT_SORTS[sort or "price"], limit or 20, cursor, {"_id": 0})
+    return page_response(docs, next_cursor)
+
+# Declarada antes de /products/{product_id} para "search" não ser lido como id
+@api_router.get("/products/search")
+async def search_products(
+    q: str = Query("", max_length=100),
+    platform: Optional[str] = None,
+    minPrice: Optional[float] = Query(None, ge=0),
+    maxPrice: Optional[float] = Query(None, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    await catalog.get()
+    return fast_json(search_index.search(q, platform, minPrice, maxPrice, limit))
 
 @api_router.get("/products/{product_id}")
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if not product:
+async def get_product(product_id: str, request: Request):
+    snap = await catalog.get()
+    if product_id not in snap.item_bodies:
         raise HTTPException(404, "Product not found")
-    return product
+    return cached_json(request, snap.item_bodies[product_id], snap.item_etags[product_id])
 
 # ========== CART ==========
 @api_router.get("/cart/{session_id}")
 async def get_cart(session_id: str, user: Optional[dict] = Depends(get_optional_user)):
-    query = {"sessionId": session_id}
-    if user:
-        query = {"$or": [{"sessionId": session_id}, {"userId": user["id"]}]}
-    cart = await db.carts.find_one(query, {"_id": 0})
-    return cart if cart else {"items": []}
+    cart = await carts.get(session_id, user["id"] if user else None)
+    return fast_json(cart if cart else {"items": []})
 
 @api_router.post("/cart/{session_id}")
 async def update_cart(session_id: str, items: List[CartItem], user: Optional[dict] = Depends(get_optional_user)):
-    cart_data = {"sessionId": session_id, "items": [item.model_dump() for item in items], "updatedAt": datetime.now(timezone.utc).isoformat()}
-    if user:
-        cart_data["userId"] = user["id"]
-    await db.carts.update_one({"sessionId": session_id}, {"$set": cart_data}, upsert=True)
+    try:
+        await carts.replace(session_id, [item.model_dump() for item in items], user["id"] if user else None)
+    except CartNotOwned:
+        # O carrinho da sessão pertence a outro usuário
+        raise HTTPException(403, "Not allowed to change this cart")
+    return {"success": True}
+
+@api_router.post("/cart/{session_id}/add")
+async def add_cart_item(session_id: str, item: CartItem, user: Optional[dict] = Depends(get_optional_user)):
+    try:
+        await carts.add_item(session_id, item.productId, item.quantity, user["id"] if user else None)
+    except CartNotOwned:
+        # O carrinho da sessão pertence a outro usuário
+        raise HTTPException(403, "Not allowed to change this cart")
+    return {"success": True}
+
+@api_router.patch("/cart/{session_id}/item/{product_id}")
+async def update_cart_item(session_id: str, product_id: str, body: CartQuantity, user: Optional[dict] = Depends(get_optional_user)):
+    try:
+        await carts.set_quantity(session_id, product_id, body.quantity, user["id"] if user else None)
+    except CartNotOwned:
+        # O carrinho da sessão pertence a outro usuário
+        raise HTTPException(403, "Not allowed to change this cart")
+    return {"success": True}
+
+@api_router.delete("/cart/{session_id}/item/{product_id}")
+async def remove_cart_item(session_id: str, product_id: str, user: Optional[dict] = Depends(get_optional_user)):
+    try:
+        await carts.remove_item(session_id, product_id, user["id"] if user else None)
+    except CartNotOwned:
+        # O carrinho da sessão pertence a outro usuário
+        raise HTTPException(403, "Not allowed to change this cart")
+    return {"success": True}
+
+@api_router.get("/cart/{session_id}/quote")
+async def quote_cart(session_id: str, couponCode: Optional[str] = None, user: Optional[dict] = Depends(get_optional_user)):
+    cart = await carts.get(session_id, user["id"] if user else None)
+    items = [(i["productId"], i["quantity"]) for i in (cart or {}).get("items", [])]
+    try:
+        quote = await pricing.quote(items, couponCode)
+    except PricingError as e:
+        raise HTTPException(400, str(e))
+    return fast_json(quote.as_dict())
+
+@api_router.delete("/cart/{session_id}")
+async def clear_cart(session_id: str, user: Optional[dict] = Depends(get_optional_user)):
+    try:
+        await carts.clear(session_id, user["id"] if user else None)
+    except CartNotOwned:
+        # O carrinho da sessão pertence a outro usuário
+        raise HTTPException(403, "Not allowed to change this cart")
     return {"success": True}
 
 # ========== COUPONS ==========
-@api_router.get("/coupons/validate/{code}")
+@api_router.get("/coupons/validate/{code}", response_model=Coupon,
+                dependencies=[Depends(rate_limiter.by_ip("coupon_ip"))])
 async def validate_coupon(code: str):
-    coupon = await db.coupons.find_one({"code": code.upper(), "isActive": True}, {"_id": 0})
+    coupon = await coupons.find(code)
     if not coupon:
         raise HTTPException(404, "Invalid coupon code")
-    return coupon
+    # Só os campos públicos: limites e contagem de usos ficam no servidor
+    return model_response(Coupon(**{f: coupon[f] for f in Coupon.model_fields if f in coupon}))
 
 # ========== ORDERS ==========
+def order_projection(fields: Optional[str], default: tuple, required: tuple = ()) -> dict:
+    """Projeção a partir de `fields=a,b,c` (sparse fieldset), restrita a ORDER_FIELDS."""
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(default)
+    unknown = [f for f in names if f not in ORDER_FIELDS]
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}")
+    return {"_id": 0, **{f: 1 for f in [*names, *required]}}
+
 @api_router.get("/orders")
-async def get_orders(current_user: dict = Depends(get_current_user)):
+async def get_orders(
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    createdFrom: Optional[datetime] = None,
+    createdTo: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
     if not current_user:
         raise HTTPException(401, "Not authenticated")
-    return await db.orders.find({"userId": current_user["id"]}, {"_id": 0}).sort("createdAt", -1).to_list(100)
+    query = {"userId": current_user["id"]}
+    if status:
+        query["status"] = status
+    if createdFrom or createdTo:
+        query["createdAt"] = {}
+        if createdFrom:
+            query["createdAt"]["$gte"] = to_utc(createdFrom)
+        if createdTo:
+            query["createdAt"]["$lt"] = to_utc(createdTo)
+    projection = order_projection(fields, ORDER_LIST_FIELDS, required=("id", "createdAt"))
+    docs, next_cursor = await paginate(db.orders, query, ORDER_SORT, limit, cursor, projection)
+    return page_response(docs, next_cursor)
 
 @api_router.get("/orders/{order_id}")
-async def get_order(order_id: str):
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+async def get_order(order_id: str, fields: Optional[str] = None):
+    order = await db.orders.find_one({"id": order_id}, order_projection(fields, ORDER_FIELDS))
     if not order:
         raise HTTPException(404, "Order not found")
-    return order
+    return fast_json(order)
+
+@api_router.get("/orders/{order_id}/artifacts/{kind}")
+async def get_payment_artifact(order_id: str, kind: str, request: Request):
+    if kind not in ARTIFACT_TYPES:
+        raise HTTPException(404, "Artifact not found")
+    found = await artifacts.load(order_id, kind)
+    if not found:
+        raise HTTPException(404, "Artifact not found")
+    data, content_type = found
+    # O conteúdo de um artefato nunca muda depois de criado
+    return cached_bytes(request, data, make_etag(data), content_type, "public, max-age=31536000, immutable")
+
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", 15))
+SSE_MAX_SECONDS = float(os.getenv("SSE_MAX_SECONDS", 600))
+
+def sse(event: dict) -> str:
+    return f"event: status\ndata: {json.dumps(event)}\n\n"
+
+def status_changed(a: dict, b: dict) -> bool:
+    return a.get("status") != b.get("status") or a.get("mercadopagoStatus") != b.get("mercadopagoStatus")
+
+@api_router.get("/orders/{order_id}/events")
+async def order_events_stream(order_id: str, request: Request):
+    # Assina antes de ler o estado atual para não perder uma mudança no meio
+    queue = order_events.subscribe(order_id)
+    order = await order_events.current(order_id)
+    if not order:
+        order_events.unsubscribe(order_id, queue)
+        raise HTTPException(404, "Order not found")
+
+    async def stream():
+        last = order
+        try:
+            yield sse(order)
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            while last["status"] not in TERMINAL_STATUSES and time.monotonic() < deadline:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Sem change stream, mudanças de outros workers só aparecem relendo o pedido
+                    event = last if order_events.cross_worker else (await order_events.current(order_id) or last)
+                if status_changed(event, last):
+                    last = event
+                    yield sse(event)
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            order_events.unsubscribe(order_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api_router.get("/orders/{order_id}/wait")
+async def order_wait(order_id: str, status: Optional[str] = None, timeout: float = Query(25, ge=0, le=60)):
+    """Long-poll: responde assim que o status do pedido for diferente de `status`."""
+    queue = order_events.subscribe(order_id)
+    try:
+        order = await order_events.current(order_id)
+        if not order:
+            raise HTTPException(404, "Order not found")
+        if status is None or order["status"] != status:
+            return order
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                event = await asyncio.wait_for(queue.get(), remaining if order_events.cross_worker else min(remaining, 5))
+            except asyncio.TimeoutError:
+                if order_events.cross_worker:
+                    break
+                event = await order_events.current(order_id) or order
+            if event["status"] != status:
+                return event
+        return order
+    finally:
+        order_events.unsubscribe(order_id, queue)
 
 # ========== PAYMENTS ==========
-@api_router.post("/payments/process", response_model=PaymentResponse)
-async def process_payment(req: PaymentRequest):
+PAYMENT_RATE_MESSAGE = "Muitas tentativas de pagamento, aguarde alguns instantes"
+
+@api_router.post("/payments/process", response_model=PaymentResponse,
+                 dependencies=[Depends(rate_limiter.by_ip("payment_ip", PAYMENT_RATE_MESSAGE))])
+async def process_payment(
+    req: PaymentRequest,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: Optional[dict] = Depends(get_optional_user),
+):
+    # Chave que o cliente não escolhe: usuário autenticado ou, sem login, o IP
+    await rate_limiter.check(
+        "payment_session", f"user:{user['id']}" if user else client_ip(request), PAYMENT_RATE_MESSAGE
+    )
+    if not idempotency_key:
+        return model_response(await _process_payment(req, user=user))
+    # Retries com a mesma chave recebem a resposta gravada, sem novo pedido nem nova cobrança
+    async def run(mark_charged):
+        return (await _process_payment(req, idempotency_key, user, mark_charged)).model_dump()
+    return fast_json(await idempotency.run(idempotency_key, fingerprint(req.model_dump_json()), run))
+
+def coupon_customer(user: Optional[dict], doc_number: str) -> Optional[str]:
+    """Chave do limite de cupom por cliente: usuário autenticado ou CPF/CNPJ (só dígitos), nunca campos livres do corpo."""
+    if user:
+        return f"user:{user['id']}"
+    digits = "".join(c for c in doc_number if c.isdigit())
+    return f"doc:{digits}" if digits else None
+
+async def _process_payment(
+    req: PaymentRequest,
+    idempotency_key: Optional[str] = None,
+    user: Optional[dict] = None,
+    mark_charged: Optional[MarkCharged] = None,
+) -> PaymentResponse:
+    reserved = redeemed = settled = False
     try:
-        logger.info(f"💳 Processando {req.paymentMethod} para {req.customerInfo.email} | Total: R$ {req.total:.2f}")
+        logger.info(f"💳 Processando {req.paymentMethod} para {mask_email(req.customerInfo.email)} | Total: R$ {req.total:.2f}")
         order_id = str(uuid.uuid4())
 
+        # Preços e totais calculados no servidor; o que o cliente mandou só é conferido
+        try:
+            quote = await pricing.quote([(i.productId, i.quantity) for i in req.items], req.couponCode)
+        except PricingError as e:
+            raise HTTPException(400, str(e))
+        problems = quote.mismatches(req.subtotal, req.discount, req.total, [(i.productId, i.price) for i in req.items])
+        if problems:
+            logger.warning(f"⚠️ Valores divergentes no checkout: {'; '.join(problems)}")
+            raise HTTPException(400, "Os valores do carrinho mudaram, revise o pedido")
+        total = from_cents(quote.total)
+
         # CORREÇÃO: validar valor mínimo por método de pagamento
         min_val = MIN_AMOUNTS.get(req.paymentMethod, 0.50)
-        if req.total < min_val:
+        if total < min_val:
             raise HTTPException(
                 400,
-                f"Valor mínimo para {req.paymentMethod} é R$ {min_val:.2f}. Valor atual: R$ {req.total:.2f}"
+                f"Valor mínimo para {req.paymentMethod} é R$ {min_val:.2f}. Valor atual: R$ {total:.2f}"
             )
 
         # CORREÇÃO: obter documento de identificação de forma unificada
@@ -316,7 +784,7 @@ async def process_payment(req: PaymentRequest):
                 raise HTTPException(400, "Token do cartão é obrigatório")
 
             body = {
-                "transaction_amount": float(req.total),
+                "transaction_amount": total,
                 "token": req.paymentData.token,
                 "description": f"Order {order_id[:8]}",
                 "payment_method_id": req.paymentData.paymentMethodId,
@@ -339,7 +807,7 @@ async def process_payment(req: PaymentRequest):
         # ---- PIX ----
         elif req.paymentMethod == "pix":
             body = {
-                "transaction_amount": float(req.total),
+                "transaction_amount": total,
                 "description": f"Order {order_id[:8]}",
                 "payment_method_id": "pix",
                 "payer": payer,
@@ -350,7 +818,7 @@ async def process_payment(req: PaymentRequest):
         elif req.paymentMethod == "boleto":
             # CORREÇÃO: boleto exige endereço e identificação completos
             body = {
-                "transaction_amount": float(req.total),
+                "transaction_amount": total,
                 "description": f"Order {order_id[:8]}",
                 "payment_method_id": "bolbradesco",
                 "payer": {
@@ -369,10 +837,27 @@ async def process_payment(req: PaymentRequest):
         else:
             raise HTTPException(400, f"Método de pagamento '{req.paymentMethod}' não suportado")
 
-        logger.info(f"📤 Enviando para o MercadoPago:\n{json.dumps(body, indent=2, ensure_ascii=False)}")
-        res = mp.payment().create(body)
+        # Uso do cupom e estoque contados antes de cobrar; se o pedido não chegar a ser salvo, o finally devolve
+        if quote.coupon:
+            try:
+                await coupons.redeem(quote.coupon["code"], order_id, coupon_customer(user, doc_number))
+            except CouponError as e:
+                raise HTTPException(400, str(e))
+            redeemed = True
+        try:
+            reserved = await stock.reserve(order_id, quote.order_items())
+        except OutOfStock as e:
+            raise HTTPException(409, str(e))
+
+        res = await gateway.create_payment(body, idempotency_key)
+        if mark_charged:
+            # Daqui em diante um retry com a mesma chave não pode refazer o pagamento
+            await mark_charged(paymentId=res.get("response", {}).get("id"), orderId=order_id)
         logger.info(f"📥 MP Status HTTP: {res['status']}")
-        logger.info(f"📥 MP Response:\n{json.dumps(res.get('response', {}), indent=2, ensure_ascii=False)}")
+        # Payload completo só em DEBUG, em falha ou por amostragem, sempre mascarado
+        log_payload(logger, "💳 Pagamento MercadoPago", {
+            "request": body, "httpStatus": res["status"], "response": res.get("response", {}),
+        }, failed=res["status"] not in [200, 201])
 
         # CORREÇÃO: log detalhado do erro para facilitar debug
         if res["status"] not in [200, 201]:
@@ -386,21 +871,23 @@ async def process_payment(req: PaymentRequest):
         pay_status = pay.get("status", "failed")
 
         # Montar documento do pedido no banco
+        now = utcnow()
         order_doc = {
             "id": order_id,
             "userId": req.userId,
             "sessionId": req.sessionId,
-            "items": [i.model_dump() for i in req.items],
-            "subtotal": req.subtotal,
-            "discount": req.discount,
-            "total": req.total,
+            "items": quote.order_items(),
+            "subtotal": from_cents(quote.subtotal),
+            "discount": from_cents(quote.discount),
+            "total": total,
             "customer": req.customerInfo.model_dump(),
             "paymentMethod": req.paymentMethod,
             "mercadopagoPaymentId": pay.get("id"),
             "mercadopagoStatus": pay_status,
-            "status": "approved" if pay_status == "approved" else "pending" if pay_status in ["pending", "in_process"] else "failed",
-            "createdAt": datetime.now(timezone.utc).isoformat(),
-            "updatedAt": datetime.now(timezone.utc).isoformat(),
+            "status": order_status(pay_status),
+            "paymentExpiresAt": to_utc(pay.get("date_of_expiration")),
+            "createdAt": now,
+            "updatedAt": now,
         }
 
         # Dados do PIX
@@ -410,7 +897,6 @@ async def process_payment(req: PaymentRequest):
             qr_code = td.get("qr_code")
             if qr_code:
                 order_doc["pixQrCode"] = qr_code
-                order_doc["pixQrCodeBase64"] = td.get("qr_code_base64", "")
                 pix_data = PixData(
                     qrCode=qr_code,
                     qrCodeBase64=td.get("qr_code_base64", ""),
@@ -426,8 +912,6 @@ async def process_payment(req: PaymentRequest):
             td = pay["transaction_details"]
             boleto_url = td.get("external_resource_url")
             if boleto_url:
-                order_doc["boletoUrl"] = boleto_url
-                order_doc["boletoBarcode"] = td.get("digitable_line", "")
                 boleto_data = BoletoData(
                     boletoUrl=boleto_url,
                     barcode=td.get("digitable_line", ""),
@@ -438,7 +922,26 @@ async def process_payment(req: PaymentRequest):
                 logger.warning("⚠️ Boleto criado mas sem URL na resposta")
 
         await db.orders.insert_one(order_doc)
+        settled = True
         logger.info(f"✅ Pedido {order_id} salvo no banco | Status: {order_doc['status']}")
+        if reserved:
+            try:
+                await stock.settle(order_id, order_doc["status"], order_doc["paymentExpiresAt"])
+            except PyMongoError as e:
+                # A reserva continua ativa até vencer; o listener de status também confirma/devolve
+                logger.error(f"Falha ao atualizar reserva de estoque do pedido {order_id}: {str(e)}")
+        if redeemed and order_doc["status"] == "failed":
+            await coupons.release(order_id)
+        await rollups.order_created(order_doc)
+
+        # QR code e boleto ficam fora do pedido; o cliente já recebe tudo nesta resposta
+        try:
+            if pix_data and pix_data.qrCodeBase64:
+                await artifacts.save_pix_qr(order_id, pix_data.qrCodeBase64)
+            if boleto_data:
+                await artifacts.save_boleto(order_id, boleto_data.boletoUrl, boleto_data.barcode)
+        except PyMongoError as e:
+            logger.error(f"Falha ao salvar artefatos do pedido {order_id}: {str(e)}")
 
         return PaymentResponse(
             status=order_doc["status"],
@@ -452,76 +955,206 @@ async def process_payment(req: PaymentRequest):
 
     except HTTPException:
         raise
+    except CircuitOpen as e:
+        logger.warning(f"⚡ {e}")
+        raise gateway_unavailable(e)
+    except GatewayTimeout as e:
+        logger.error(f"⏱️ {e}")
+        raise HTTPException(504, "MercadoPago não respondeu a tempo, tente novamente")
+    except GatewayError as e:
+        logger.error(f"❌ {e}")
+        raise HTTPException(502, "Falha de comunicação com o MercadoPago")
     except Exception as e:
         logger.error(f"❌ Erro inesperado no pagamento: {str(e)}", exc_info=True)
         raise HTTPException(500, f"Erro interno ao processar pagamento: {str(e)}")
+    finally:
+        if reserved and not settled:
+            await stock.release(order_id)
+        if redeemed and not settled:
+            await coupons.release(order_id)
 
 
 @api_router.get("/payments/config")
 async def get_config():
     return {"publicKey": MERCADOPAGO_PUBLIC_KEY}
 
-@api_router.get("/payments/status/{payment_id}")
-async def get_status(payment_id: str):
-    res = mp.payment().get(payment_id)
+_status_inflight: dict = {}
+
+def gateway_unavailable(e: CircuitOpen) -> HTTPException:
+    # Falha rápida com o circuito aberto: o cliente sabe quando tentar de novo
+    return HTTPException(503, "MercadoPago indisponível no momento, tente novamente em instantes",
+                         headers={"Retry-After": str(int(e.retry_after + 0.5))})
+
+async def _fetch_status(payment_id: str) -> dict:
+    try:
+        res = await gateway.get_payment(payment_id)
+    except CircuitOpen as e:
+        raise gateway_unavailable(e)
+    except GatewayTimeout:
+        raise HTTPException(504, "MercadoPago não respondeu a tempo")
+    except GatewayError:
+        raise HTTPException(502, "Falha de comunicação com o MercadoPago")
     if res["status"] != 200:
         raise HTTPException(404, "Payment not found")
     p = res["response"]
-    return {
+    status = {
         "status": p.get("status"),
         "statusDetail": p.get("status_detail"),
         "paymentMethod": p.get("payment_method_id"),
     }
+    payment_status_cache.set(payment_id, status)
+    return status
+
+@api_router.get("/payments/status/{payment_id}")
+async def get_status(payment_id: str):
+    cached = payment_status_cache.get(payment_id)
+    if cached is not None:
+        return fast_json(cached)
+    # Requisições simultâneas para o mesmo pagamento compartilham uma única chamada ao gateway
+    fut = _status_inflight.get(payment_id)
+    if fut is None:
+        fut = asyncio.ensure_future(_fetch_status(payment_id))
+        _status_inflight[payment_id] = fut
+        fut.add_done_callback(lambda _: _status_inflight.pop(payment_id, None))
+    return fast_json(await asyncio.shield(fut))
+
+async def invalidate_payment_status(changes: list):
+    for change in changes:
+        payment_status_cache.pop(str(change["payment"].get("id")))
 
 @api_router.get("/payments/order/{order_id}")
 async def get_payment_by_order(order_id: str):
-    order = await db.orders.find_one({"id": order_id}, {"_id": 0})
+    order = await db.orders.find_one({"id": order_id}, order_projection(None, ORDER_FIELDS))
     if not order:
         raise HTTPException(404, "Order not found")
     resp = {"success": True, "order": order}
     if order.get("paymentMethod") == "pix" and order.get("pixQrCode"):
         resp["order"]["pix"] = {
             "qrCode": order["pixQrCode"],
-            "qrCodeBase64": order.get("pixQrCodeBase64"),
-            "expirationDate": None,
-        }
-    if order.get("paymentMethod") == "boleto" and order.get("boletoUrl"):
-        resp["order"]["boleto"] = {
-            "boletoUrl": order["boletoUrl"],
-            "barcode": order.get("boletoBarcode"),
-            "expirationDate": None,
+            "qrCodeUrl": f"/api/orders/{order_id}/artifacts/pix_qr",
+            "expirationDate": order.get("paymentExpiresAt"),
         }
-    return resp
+    if order.get("paymentMethod") == "boleto":
+        found = await artifacts.load(order_id, "boleto")
+        if found:
+            resp["order"]["boleto"] = {**json.loads(found[0]), "expirationDate": order.get("paymentExpiresAt")}
+    return fast_json(resp)
 
 # ========== WEBHOOK ==========
+async def fetch_payment(pid: str) -> Optional[dict]:
+    res = await gateway.get_payment(pid)
+    if res["status"] == 200:
+        return res["response"]
+    if res["status"] == 404:
+        logger.warning(f"Pagamento {pid} do webhook não existe no MercadoPago")
+        return None
+    raise GatewayError(f"MercadoPago respondeu HTTP {res['status']} para o pagamento {pid}")
+
 @api_router.post("/webhooks/mercadopago")
-async def webhook(req: Request, bg: BackgroundTasks):
+async def webhook(req: Request):
     try:
         payload = json.loads(await req.body())
-        if payload.get("type") == "payment":
-            bg.add_task(update_status, payload.get("data", {}).get("id"))
-        return {"status": "received"}
     except Exception as e:
         logger.error(f"Webhook error: {str(e)}")
         return {"status": "error"}
+    if payload.get("type") == "payment" and payload.get("data", {}).get("id"):
+        try:
+            await webhooks.enqueue(payload["data"]["id"])
+        except PyMongoError as e:
+            # Sem 2xx o MercadoPago reenvia a notificação mais tarde
+            logger.error(f"Webhook não persistido: {str(e)}")
+            raise HTTPException(503, "Webhook not persisted")
+    return {"status": "received"}
+
+# ========== ADMIN ==========
+@api_router.get("/admin/reconciler", dependencies=[Depends(require_admin)])
+async def reconciler_stats():
+    return reconciler.stats
+
+class StockUpdate(BaseModel):
+    available: int = Field(ge=0)
+    # Mais shards = mais checkouts simultâneos do mesmo produto sem disputar o mesmo documento
+    shards: Optional[int] = Field(None, ge=1, le=64)
+
+@api_router.put("/admin/stock/{product_id}", dependencies=[Depends(require_admin)])
+async def set_stock(product_id: str, update: StockUpdate):
+    snap = await catalog.get()
+    if product_id not in snap.by_id:
+        raise HTTPException(404, "Product not found")
+    return await stock.set_stock(product_id, update.available, update.shards)
 
-async def update_status(pid: str):
-    try:
-        res = mp.payment().get(pid)
-        if res["status"] == 200:
-            p = res["response"]
-            new_status = "approved" if p.get("status") == "approved" else "pending" if p.get("status") in ["pending", "in_process"] else "failed"
-            await db.orders.update_one(
-                {"id": p.get("external_reference")},
-                {"$set": {
-                    "mercadopagoStatus": p.get("status"),
-                    "status": new_status,
-                    "updatedAt": datetime.now(timezone.utc).isoformat(),
-                }},
-            )
-            logger.info(f"Pedido {p.get('external_reference')} atualizado para {new_status}")
-    except Exception as e:
-        logger.error(f"Erro ao atualizar status: {str(e)}")
+@api_router.get("/admin/stock/{product_id}", dependencies=[Depends(require_admin)])
+async def get_stock(product_id: str):
+    snap = await catalog.get()
+    if product_id not in snap.by_id:
+        raise HTTPException(404, "Product not found")
+    return {"productId": product_id, "available": await stock.available(product_id)}
+
+class CouponUpdate(BaseModel):
+    discount: float = Field(gt=0, le=1)
+    isActive: bool = True
+    startsAt: Optional[datetime] = None
+    endsAt: Optional[datetime] = None
+    maxUses: Optional[int] = Field(None, ge=0)
+    perUserLimit: Optional[int] = Field(None, ge=1)
+
+@api_router.put("/admin/coupons/{code}", dependencies=[Depends(require_admin)])
+async def save_coupon(code: str, update: CouponUpdate):
+    fields = update.model_dump()
+    fields["startsAt"], fields["endsAt"] = to_utc(update.startsAt), to_utc(update.endsAt)
+    return await coupons.save(code, fields)
+
+@api_router.get("/admin/reports/sales", dependencies=[Depends(require_admin)])
+async def sales_report(
+    period: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    # Só lê os rollups: um documento por hora/dia do período
+    start, end = period_range(period, start, end)
+    return fast_json(await rollups.report(period, start, end))
+
+@api_router.get("/admin/reports/products", dependencies=[Depends(require_admin)])
+async def products_report(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=200),
+):
+    start, end = period_range("day", start, end)
+    snap = await catalog.get()
+    return fast_json(await rollups.top_products(start, end, limit, snap.by_id))
+
+@api_router.post("/admin/reports/compact", dependencies=[Depends(require_admin)])
+async def compact_reports(days: int = Query(1, ge=1, le=90), includeToday: bool = False):
+    # Backfill manual (ex.: pedidos anteriores aos rollups); a compactação noturna cobre os últimos dias
+    return await rollups.compact(days, includeToday)
+
+# ========== METRICS ==========
+metrics.registry.gauge("password_hash_pending", "Hashes de senha na fila do pool", lambda: hasher.pending)
+metrics.registry.gauge("gateway_in_flight", "Chamadas ao MercadoPago em andamento", lambda: gateway.in_flight if gateway else 0)
+metrics.registry.gauge("gateway_circuit_open", "1 se o circuito do MercadoPago está aberto",
+                       lambda: int(gateway is not None and gateway.breaker.state == "open"))
+metrics.registry.gauge("gateway_hedged_requests", "Consultas duplicadas por hedging", lambda: gateway.hedged if gateway else 0)
+metrics.registry.gauge("order_event_subscribers", "Clientes SSE/long-poll conectados",
+                       lambda: order_events.subscribers if order_events else 0)
+metrics.registry.gauge("reconciler_stale_pending_orders", "Pedidos pendentes parados",
+                       lambda: (reconciler.stats["stalePending"] or 0) if reconciler else 0)
+metrics.registry.gauge("reconciler_oldest_pending_age_seconds", "Idade do pedido pendente mais antigo",
+                       lambda: (reconciler.stats["oldestPendingAgeSeconds"] or 0) if reconciler else 0)
+webhook_depth = metrics.registry.gauge("webhook_queue_depth", "Eventos de webhook pendentes ou em processamento")
+
+async def collect_queue_metrics(interval: float = 15):
+    # Contagens no Mongo não podem rodar durante o scrape (que é síncrono); atualiza em background
+    while True:
+        try:
+            webhook_depth.set(await webhooks.depth())
+        except PyMongoError:
+            pass
+        await asyncio.sleep(interval)
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # ========== SEED ==========
 @api_router.post("/seed")
@@ -538,6 +1171,7 @@ async def seed():
         {"code": "BEMVINDO10", "discount": 0.10, "isActive": True},
         {"code": "STREAM20", "discount": 0.20, "isActive": True},
     ])
+    await catalog.load()
     return {"message": "Seeded", "products": len(seed_products)}
 
 # ========== HEALTH ==========
@@ -551,16 +1185,33 @@ async def bia():
 
 @api_router.get("/health")
 async def health():
-    return {"status": "healthy"}
+    breaker = gateway.breaker.snapshot() if gateway else {"state": "closed"}
+    # Circuito aberto: a API continua servindo catálogo e carrinho, mas pagamentos falham rápido
+    return {"status": "healthy" if breaker["state"] == "closed" else "degraded", "gateway": breaker}
+
+@api_router.get("/health/live")
+async def liveness():
+    # Só o processo e o event loop; dependências externas não entram aqui
+    return {"status": "alive"}
+
+@api_router.get("/health/ready")
+async def readiness_probe():
+    result = await readiness.check()
+    return fast_json(result) if result["ready"] else ORJSONResponse(result, status_code=503)
 
 app.include_router(api_router)
+app.add_middleware(LoadShedMiddleware)
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Request-ID"],
 )
 
 if __name__ == "__main__":
+    # Um processo só, para desenvolvimento; em produção use run.py
     uvicorn.run("server:app", host="0.0.0.0", port=int(os.environ.get("PORT", 10000)), reload=False)
\ No newline at end of file
@@ -0,0 +1,238 @@
+# Estoque e reservas.
+# Só produtos com estoque controlado (com documentos em stock_shards, criados
+# pelo endpoint admin) são verificados; os demais continuam ilimitados. O
+# controle é lido de stock_shards a cada reserva, não do snapshot do catálogo,
+# então vale em todos os workers assim que o admin define o saldo.
+# O saldo de cada produto é dividido em vários documentos em
+# stock_shards; uma reserva decrementa um shard sorteado com $inc condicional
+# ({available: {$gte: qtd}}), então checkouts simultâneos do mesmo produto
+# quente não disputam o mesmo documento. Se nenhum shard sozinho tem a
+# quantidade, junta saldo de vários e devolve tudo se não fechar.
+# Cada pedido tem uma reserva (stock_reservations) com os shards usados e um
+# prazo: aprovado -> committed; failed/expired -> released (saldo volta);
+# reservas vencidas são liberadas por uma varredura periódica.
+
+import asyncio
+import logging
+import os
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from dates import utcnow
+
+logger = logging.getLogger(__name__)
+
+STOCK_SHARDS = int(os.getenv("STOCK_SHARDS", 8))
+STOCK_RESERVATION_TTL = float(os.getenv("STOCK_RESERVATION_TTL", 900))
+# Folga depois do vencimento do PIX/boleto antes de devolver o estoque
+STOCK_RESERVATION_GRACE = float(os.getenv("STOCK_RESERVATION_GRACE", 600))
+STOCK_SWEEP_INTERVAL = float(os.getenv("STOCK_SWEEP_INTERVAL", 60))
+# Tentativas em shards sorteados antes de ler todos e juntar saldo
+STOCK_DIRECT_ATTEMPTS = 2
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id: str, name: Optional[str] = None):
+        super().__init__(f"Produto sem estoque suficiente: {name or product_id}")
+        self.product_id = product_id
+
+
+class StockManager:
+    def __init__(self, db, catalog):
+        self.shards = db.stock_shards
+        self.reservations = db.stock_reservations
+        self.catalog = catalog
+        self._task: Optional[asyncio.Task] = None
+
+    async def ensure_indexes(self):
+        await self.shards.create_index([("productId", 1), ("shard", 1)], unique=True)
+        await self.reservations.create_index("orderId", unique=True)
+        await self.reservations.create_index([("status", 1), ("expiresAt", 1)])
+
+    def start(self):
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ---------- saldo ----------
+    async def set_stock(self, product_id: str, available: int, shards: Optional[int] = None) -> dict:
+        """Define o saldo disponível (fora das reservas ativas), o que liga o controle de estoque do produto."""
+        shards = max(shards or STOCK_SHARDS, 1)
+        base, extra = divmod(available, shards)
+        await self.shards.delete_many({"productId": product_id, "shard": {"$gte": shards}})
+        for shard in range(shards):
+            await self.shards.update_one(
+                {"productId": product_id, "shard": shard},
+                {"$set": {"available": base + (1 if shard < extra else 0)}},
+                upsert=True,
+            )
+        return {"productId": product_id, "available": available, "shards": shards}
+
+    async def available(self, product_id: str) -> Optional[int]:
+        """Saldo somado dos shards; None se o produto não tem estoque controlado."""
+        shards = [s["available"] async for s in self.shards.find({"productId": product_id}, {"available": 1})]
+        return sum(shards) if shards else None
+
+    async def _shard_count(self, product_id: str) -> int:
+        """Quantidade de shards do produto; 0 = estoque não controlado."""
+        return await self.shards.count_documents({"productId": product_id})
+
+    async def _name(self, product_id: str) -> Optional[str]:
+        snap = await self.catalog.get()
+        return snap.by_id.get(product_id, {}).get("name")
+
+    async def _take(self, product_id: str, quantity: int, shards: int) -> List[Tuple[int, int]]:
+        order = random.sample(range(shards), shards)
+        for shard in order[:STOCK_DIRECT_ATTEMPTS]:
+            doc = await self.shards.find_one_and_update(
+                {"productId": product_id, "shard": shard, "available": {"$gte": quantity}},
+                {"$inc": {"available": -quantity}},
+                projection={"_id": 1},
+            )
+            if doc:
+                return [(shard, quantity)]
+
+        # Saldo espalhado (ou acabando): lê todos os shards e junta o que faltar
+        parts, need = [], quantity
+        async for doc in self.shards.find({"productId": product_id, "available": {"$gt": 0}}, {"shard": 1, "available": 1}):
+            take = min(doc["available"], need)
+            taken = await self.shards.find_one_and_update(
+                {"productId": product_id, "shard": doc["shard"], "available": {"$gte": take}},
+                {"$inc": {"available": -take}},
+                projection={"_id": 1},
+            )
+            if taken:
+                parts.append((doc["shard"], take))
+                need -= take
+                if need == 0:
+                    return parts
+        await self._give_back(product_id, parts)
+        raise OutOfStock(product_id)
+
+    async def _give_back(self, product_id: str, parts: Iterable):
+        shards = None
+        for shard, quantity in parts:
+            res = await self.shards.update_one({"productId": product_id, "shard": shard}, {"$inc": {"available": quantity}})
+            if res.matched_count:
+                continue
+            # Shard apagado por um set_stock com menos shards depois da reserva: devolve num dos que restaram
+            shards = shards or await self._shard_count(product_id)
+            if shards:
+                await self.shards.update_one(
+                    {"productId": product_id, "shard": shard % shards}, {"$inc": {"available": quantity}}
+                )
+
+    # ---------- reservas ----------
+    async def reserve(self, order_id: str, items: Iterable[dict], expires_at: Optional[datetime] = None) -> bool:
+        """Reserva os itens do pedido; OutOfStock se algum faltar. False se nenhum item tem estoque controlado."""
+        wanted = defaultdict(int)
+        for item in items:
+            wanted[item["productId"]] += item["quantity"]
+
+        taken = []
+        try:
+            for product_id, quantity in wanted.items():
+                shards = await self._shard_count(product_id)
+                if not shards:
+                    continue
+                try:
+                    parts = await self._take(product_id, quantity, shards)
+                except OutOfStock:
+                    raise OutOfStock(product_id, await self._name(product_id))
+                taken.append({"productId": product_id, "quantity": quantity, "shards": parts})
+            if not taken:
+                return False
+
+            now = utcnow()
+            # Uma queda do processo entre o $inc e este insert perde a reserva (saldo fica baixo até o ajuste admin)
+            await self.reservations.insert_one({
+                "orderId": order_id,
+                "items": taken,
+                "status": "active",
+                "expiresAt": expires_at or now + timedelta(seconds=STOCK_RESERVATION_TTL),
+                "createdAt": now,
+            })
+        except BaseException:
+            for item in taken:
+                await self._give_back(item["productId"], item["shards"])
+            raise
+        return True
+
+    async def _finish(self, order_id: str, status: str, **query) -> Optional[dict]:
+        # Transição atômica a partir de "active": só quem vence a troca devolve o saldo
+        return await self.reservations.find_one_and_update(
+            {"orderId": order_id, "status": "active", **query},
+            {"$set": {"status": status, "finishedAt": utcnow()}},
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    async def release(self, order_id: str, **query) -> bool:
+        try:
+            reservation = await self._finish(order_id, "released", **query)
+            if not reservation:
+                return False
+            for item in reservation["items"]:
+                await self._give_back(item["productId"], item["shards"])
+        except PyMongoError as e:
+            # A varredura tenta de novo quando a reserva vencer
+            logger.error(f"Falha ao liberar reserva de estoque do pedido {order_id}: {e}")
+            return False
+        logger.info(f"📦 Estoque do pedido {order_id} devolvido")
+        return True
+
+    async def commit(self, order_id: str):
+        if not await self._finish(order_id, "committed"):
+            released = await self.reservations.find_one({"orderId": order_id, "status": "released"}, {"_id": 1})
+            if released:
+                logger.warning(f"⚠️ Pedido {order_id} aprovado depois de a reserva de estoque ter sido liberada")
+
+    async def settle(self, order_id: str, status: str, expires_at: Optional[datetime] = None):
+        """Depois de criar o pagamento: confirma, devolve ou estende a reserva conforme o status do pedido."""
+        if status == "approved":
+            await self.commit(order_id)
+        elif status in ("failed", "expired"):
+            await self.release(order_id)
+        elif expires_at:
+            await self.reservations.update_one(
+                {"orderId": order_id, "status": "active"},
+                {"$set": {"expiresAt": expires_at + timedelta(seconds=STOCK_RESERVATION_GRACE)}},
+            )
+
+    async def on_status_changes(self, changes: list):
+        """Listener do OrderStatusUpdater."""
+        for change in changes:
+            if change["status"] in ("approved", "failed", "expired"):
+                await self.settle(change["orderId"], change["status"])
+
+    async def release_expired(self) -> int:
+        released = 0
+        now = utcnow()
+        async for reservation in self.reservations.find(
+            {"status": "active", "expiresAt": {"$lt": now}}, {"orderId": 1}
+        ).limit(500):
+            if await self.release(reservation["orderId"], expiresAt={"$lt": now}):
+                released += 1
+        return released
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(STOCK_SWEEP_INTERVAL)
+            try:
+                released = await self.release_expired()
+                if released:
+                    logger.info(f"📦 {released} reservas de estoque vencidas liberadas")
+            except Exception:
+                # Um erro numa varredura não pode parar a devolução das próximas reservas vencidas
+                logger.exception("Erro na varredura de reservas de estoque")
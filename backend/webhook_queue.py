@@ -0,0 +1,185 @@
+# Fila durável de notificações do MercadoPago (coleção webhook_events).
+# O endpoint só grava o evento e responde; um worker em background:
+#   - deduplica: no máximo um evento pendente por pagamento (índice único
+#     parcial), e cada evento espera WEBHOOK_DEDUPE_WINDOW segundos antes de
+#     ser processado, então rajadas de notificações viram uma consulta só;
+#   - consulta o gateway com paralelismo limitado;
+#   - aplica os status com um bulk_write por lote;
+#   - refaz falhas com backoff exponencial até WEBHOOK_MAX_ATTEMPTS.
+# Eventos presos em "processing" (processo morreu no meio) podem ser pegos de
+# novo quando o lease expira.
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from dates import utcnow
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_DEDUPE_WINDOW = float(os.getenv("WEBHOOK_DEDUPE_WINDOW", 2))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", 100))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", 10))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 8))
+WEBHOOK_BACKOFF_BASE = float(os.getenv("WEBHOOK_BACKOFF_BASE", 2))
+WEBHOOK_BACKOFF_MAX = float(os.getenv("WEBHOOK_BACKOFF_MAX", 600))
+WEBHOOK_LEASE_SECONDS = float(os.getenv("WEBHOOK_LEASE_SECONDS", 120))
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", 1))
+WEBHOOK_RETENTION_DAYS = int(os.getenv("WEBHOOK_RETENTION_DAYS", 7))
+
+
+class WebhookQueue:
+    def __init__(
+        self,
+        db,
+        fetch: Callable[[str], Awaitable[Optional[dict]]],
+        apply: Callable[[List[dict]], Awaitable[object]],
+    ):
+        self.col = db.webhook_events
+        # fetch(payment_id) -> pagamento do gateway, ou None se não existe (sem retry)
+        self.fetch = fetch
+        # apply([pagamentos]) -> grava os status nos pedidos
+        self.apply = apply
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.processed = 0
+        self.failed = 0
+
+    async def ensure_indexes(self):
+        await self.col.create_index(
+            "paymentId", unique=True, partialFilterExpression={"status": "pending"}, name="one_pending_per_payment"
+        )
+        await self.col.create_index([("status", 1), ("nextAttemptAt", 1)])
+        await self.col.create_index([("status", 1), ("leaseUntil", 1)])
+        await self.col.create_index("claim", sparse=True)
+        await self.col.create_index("createdAt", expireAfterSeconds=WEBHOOK_RETENTION_DAYS * 86400)
+
+    async def enqueue(self, payment_id: str) -> bool:
+        """Grava a notificação; retorna False se já havia um evento pendente para o pagamento."""
+        now = utcnow()
+        try:
+            res = await self.col.update_one(
+                {"paymentId": str(payment_id), "status": "pending"},
+                {"$setOnInsert": {
+                    "attempts": 0,
+                    "nextAttemptAt": now + timedelta(seconds=WEBHOOK_DEDUPE_WINDOW),
+                    "createdAt": now,
+                }},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        if res.upserted_id is not None:
+            self._wakeup.set()
+            return True
+        return False
+
+    async def depth(self) -> int:
+        return await self.col.count_documents({"status": {"$in": ["pending", "processing"]}})
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                handled = await self.process_batch()
+            except Exception:
+                # Qualquer erro num lote não pode derrubar o worker; CancelledError (stop) passa direto
+                logger.exception("Erro no worker de webhooks")
+                handled = 0
+            if handled < WEBHOOK_BATCH_SIZE:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), WEBHOOK_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _claim(self) -> List[dict]:
+        now = utcnow()
+        # Prontos para rodar, ou com lease vencido (o processo que pegou não terminou)
+        ready = {"$or": [
+            {"status": "pending", "nextAttemptAt": {"$lte": now}},
+            {"status": "processing", "leaseUntil": {"$lt": now}},
+        ]}
+        ids = [e["_id"] async for e in self.col.find(ready, {"_id": 1}).limit(WEBHOOK_BATCH_SIZE)]
+        if not ids:
+            return []
+        claim = uuid.uuid4().hex
+        await self.col.update_many(
+            {"_id": {"$in": ids}, **ready},
+            {"$set": {"status": "processing", "claim": claim,
+                      "leaseUntil": now + timedelta(seconds=WEBHOOK_LEASE_SECONDS)}},
+        )
+        return await self.col.find({"claim": claim}).to_list(None)
+
+    async def process_batch(self) -> int:
+        events = await self._claim()
+        if not events:
+            return 0
+
+        sem = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+
+        async def fetch(event):
+            async with sem:
+                return await self.fetch(event["paymentId"])
+
+        results = await asyncio.gather(*(fetch(e) for e in events), return_exceptions=True)
+        payments = [r for r in results if isinstance(r, dict)]
+        try:
+            if payments:
+                await self.apply(payments)
+        except PyMongoError as e:
+            # Nada foi confirmado: todo o lote volta para retry
+            logger.error(f"Falha ao aplicar lote de webhooks: {e}")
+            results = [e] * len(events)
+
+        now = utcnow()
+        ops = []
+        for event, result in zip(events, results):
+            if not isinstance(result, BaseException):
+                ops.append(UpdateOne({"_id": event["_id"]}, {
+                    "$set": {"status": "done", "processedAt": now}, "$unset": {"claim": "", "leaseUntil": ""},
+                }))
+                self.processed += 1
+                continue
+            attempts = event.get("attempts", 0) + 1
+            self.failed += 1
+            if attempts >= WEBHOOK_MAX_ATTEMPTS:
+                logger.error(f"❌ Webhook do pagamento {event['paymentId']} descartado após {attempts} tentativas: {result}")
+                update = {"status": "dead", "attempts": attempts, "lastError": str(result)}
+            else:
+                delay = min(WEBHOOK_BACKOFF_BASE ** attempts, WEBHOOK_BACKOFF_MAX)
+                logger.warning(f"⚠️ Webhook do pagamento {event['paymentId']} falhou ({result}); nova tentativa em {delay:.0f}s")
+                update = {"status": "pending", "attempts": attempts, "lastError": str(result),
+                          "nextAttemptAt": now + timedelta(seconds=delay)}
+            ops.append(UpdateOne({"_id": event["_id"]}, {"$set": update, "$unset": {"claim": "", "leaseUntil": ""}}))
+
+        try:
+            await self.col.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err["code"] != 11000 for err in errors):
+                raise
+            # Chegou notificação nova enquanto este evento era processado: ela já
+            # está pendente e vai consultar o gateway, então o retry pode ser fechado
+            await self.col.update_many(
+                {"_id": {"$in": [events[err["index"]]["_id"] for err in errors]}},
+                {"$set": {"status": "done", "processedAt": now}, "$unset": {"claim": "", "leaseUntil": ""}},
+            )
+        return len(events)
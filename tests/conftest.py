@@ -0,0 +1,41 @@
+# Os módulos do backend importam uns aos outros pelo nome (from cache import ...),
+# como quando o server.py roda de dentro de backend/.
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+TEST_ENV = {
+    "MONGO_URL": "mongodb://localhost:27017",
+    "DB_NAME": "test",
+    "JWT_SECRET": "test-secret",
+    "MERCADOPAGO_ACCESS_TOKEN": "TEST-TOKEN",
+    "MERCADOPAGO_PUBLIC_KEY": "TEST-KEY",
+    "MERCADOPAGO_API_URL": "http://127.0.0.1:9",
+    "ADMIN_API_KEY": "test-admin",
+    "RATE_LIMIT_ENABLED": "false",
+    "LOG_LEVEL": "CRITICAL",
+}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """TestClient do server.py com o Mongo trocado pelo mongomock (lifespan completo)."""
+    from fastapi.testclient import TestClient
+    from mongomock_motor import AsyncMongoMockClient
+
+    for name, value in TEST_ENV.items():
+        monkeypatch.setenv(name, value)
+    import server
+
+    monkeypatch.setattr(server, "AsyncIOMotorClient", lambda *args, **kwargs: AsyncMongoMockClient())
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def call(api):
+    """Roda uma corrotina no event loop do app (acesso direto ao banco nos testes)."""
+    return api.portal.call
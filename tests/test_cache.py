@@ -0,0 +1,65 @@
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_get_returns_value_until_ttl_expires(clock):
+    c = TTLCache(maxsize=10, ttl=5)
+    c.set("a", 1)
+    clock[0] += 4.9
+    assert c.get("a") == 1
+    clock[0] += 0.1
+    assert c.get("a") is None
+    assert len(c) == 0
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test_per_key_ttl_overrides_default(clock):
+    c = TTLCache(maxsize=10, ttl=60)
+    c.set("short", 1, ttl=1)
+    c.set("long", 2)
+    clock[0] += 2
+    assert "short" not in c
+    assert c.get("long") == 2
+
+
+def test_non_positive_ttl_is_not_stored(clock):
+    c = TTLCache(maxsize=10, ttl=0)
+    c.set("a", 1)
+    assert "a" not in c
+
+
+def test_evicts_least_recently_used(clock):
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert "b" not in c
+    assert c.get("a") == 1 and c.get("c") == 3
+
+
+def test_falsy_values_are_cached(clock):
+    # Cache negativo (ex.: cupom inexistente) guarda {} e precisa distinguir de "não está no cache"
+    c = TTLCache(maxsize=10, ttl=60)
+    c.set("missing", {})
+    assert c.get("missing") == {}
+    assert "missing" in c
+
+
+def test_pop_and_clear(clock):
+    c = TTLCache(maxsize=10, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.pop("a") == 1
+    assert c.pop("a", "default") == "default"
+    c.clear()
+    assert len(c) == 0
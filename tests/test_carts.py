@@ -0,0 +1,50 @@
+import server
+
+
+def register(api, email, session_id=None):
+    res = api.post("/api/auth/register", json={
+        "email": email, "password": "secret123", "firstName": "Ana", "lastName": "Silva", "sessionId": session_id,
+    })
+    assert res.status_code == 200, res.text
+    body = res.json()
+    return {"Authorization": f"Bearer {body['token']}"}, body["user"]["id"]
+
+
+def stored(call, session_id):
+    return call(server.db.carts.find_one, {"sessionId": session_id}, {"_id": 0, "items": 1, "userId": 1})
+
+
+def test_guest_cart_mutations(api, call):
+    assert api.post("/api/cart/g1/add", json={"productId": "a", "quantity": 2}).status_code == 200
+    assert api.patch("/api/cart/g1/item/b", json={"quantity": 3}).status_code == 200
+    assert api.delete("/api/cart/g1/item/a").status_code == 200
+    assert stored(call, "g1")["items"] == [{"productId": "b", "quantity": 3}]
+    assert api.delete("/api/cart/g1").status_code == 200
+    assert stored(call, "g1") is None
+
+
+def test_other_user_cannot_change_or_take_over_a_cart(api, call):
+    owner, owner_id = register(api, "ana@example.com")
+    other, _ = register(api, "bia@example.com")
+    assert api.post("/api/cart/s1/add", json={"productId": "a", "quantity": 2}, headers=owner).status_code == 200
+
+    attempts = [
+        api.post("/api/cart/s1", json=[{"productId": "x", "quantity": 1}], headers=other),
+        api.post("/api/cart/s1/add", json={"productId": "a", "quantity": 5}, headers=other),
+        api.post("/api/cart/s1/add", json={"productId": "x", "quantity": 1}, headers=other),
+        api.patch("/api/cart/s1/item/a", json={"quantity": 9}, headers=other),
+        api.patch("/api/cart/s1/item/a", json={"quantity": 0}, headers=other),
+        api.delete("/api/cart/s1/item/a", headers=other),
+        api.delete("/api/cart/s1", headers=other),
+        api.delete("/api/cart/s1/item/a"),
+    ]
+    assert [r.status_code for r in attempts] == [403] * len(attempts)
+
+    # Login com o sessionId de outro usuário também não absorve o carrinho
+    assert api.post("/api/auth/login", json={
+        "email": "bia@example.com", "password": "secret123", "sessionId": "s1",
+    }).status_code == 200
+    assert stored(call, "s1") == {"items": [{"productId": "a", "quantity": 2}], "userId": owner_id}
+
+    assert api.patch("/api/cart/s1/item/a", json={"quantity": 4}, headers=owner).status_code == 200
+    assert stored(call, "s1")["items"] == [{"productId": "a", "quantity": 4}]
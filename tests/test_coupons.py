@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from coupons import CouponError, CouponStore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def store():
+    return CouponStore(AsyncMongoMockClient()["test"])
+
+
+def test_max_uses_is_enforced_by_the_database_even_with_a_stale_cache(store):
+    async def scenario():
+        await store.save("promo", {"discount": 0.1, "isActive": True, "startsAt": None, "endsAt": None,
+                                   "maxUses": None, "perUserLimit": None})
+        await store.redeem("PROMO", "o1", "user:a")
+        # Outro worker limita o cupom; o cache deste ainda tem a versão sem maxUses
+        await store.coupons.update_one({"code": "PROMO"}, {"$set": {"maxUses": 1}})
+        assert (await store.find("promo"))["maxUses"] is None
+        with pytest.raises(CouponError):
+            await store.redeem("PROMO", "o2", "user:b")
+        assert (await store.coupons.find_one({"code": "PROMO"}))["uses"] == 1
+    run(scenario())
+
+
+def test_per_customer_limit_and_release(store):
+    async def scenario():
+        await store.save("once", {"discount": 0.5, "isActive": True, "startsAt": None, "endsAt": None,
+                                  "maxUses": 10, "perUserLimit": 1})
+        await store.redeem("ONCE", "o1", "doc:123")
+        with pytest.raises(CouponError):
+            await store.redeem("ONCE", "o2", "doc:123")
+        with pytest.raises(CouponError):
+            await store.redeem("ONCE", "o3", None)
+        assert await store.release("o1")
+        await store.redeem("ONCE", "o4", "doc:123")
+        assert (await store.coupons.find_one({"code": "ONCE"}))["uses"] == 1
+    run(scenario())
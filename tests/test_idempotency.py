@@ -0,0 +1,106 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+import idempotency
+from dates import utcnow
+from idempotency import IdempotencyStore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def store():
+    store = IdempotencyStore(AsyncMongoMockClient()["test"])
+    run(store.ensure_indexes())
+    return store
+
+
+class Payment:
+    """Operação de pagamento falsa: conta execuções e pode falhar antes ou depois da cobrança."""
+
+    def __init__(self, fail_before=None, fail_after=None):
+        self.calls = 0
+        self.fail_before = fail_before
+        self.fail_after = fail_after
+
+    async def __call__(self, mark_charged):
+        self.calls += 1
+        if self.fail_before:
+            raise self.fail_before
+        await mark_charged(paymentId=123, orderId="o1")
+        if self.fail_after:
+            raise self.fail_after
+        return {"orderId": "o1", "calls": self.calls}
+
+
+def test_replay_returns_the_stored_response(store):
+    async def scenario():
+        payment = Payment()
+        first = await store.run("k", "h", payment)
+        assert await store.run("k", "h", payment) == first
+        assert payment.calls == 1
+        with pytest.raises(HTTPException) as exc:
+            await store.run("k", "other", payment)
+        assert exc.value.status_code == 422
+    run(scenario())
+
+
+def test_failure_before_the_charge_releases_the_key(store):
+    async def scenario():
+        failing = Payment(fail_before=HTTPException(400, "Token do cartão é obrigatório"))
+        with pytest.raises(HTTPException):
+            await store.run("k", "h", failing)
+        assert await store.col.find_one({"key": "k"}) is None
+        assert (await store.run("k", "h", Payment()))["calls"] == 1
+    run(scenario())
+
+
+@pytest.mark.parametrize("error", [HTTPException(400, "Erro MercadoPago: recusado"), RuntimeError("settle"),
+                                   asyncio.CancelledError()])
+def test_failure_after_the_charge_is_replayed_without_charging_again(store, error):
+    async def scenario():
+        payment = Payment(fail_after=error)
+        with pytest.raises(type(error)):
+            await store.run("k", "h", payment)
+        for _ in range(2):
+            with pytest.raises(HTTPException) as exc:
+                await store.run("k", "h", payment)
+            expected = error.status_code if isinstance(error, HTTPException) else 500
+            assert exc.value.status_code == expected
+        assert payment.calls == 1
+        doc = await store.col.find_one({"key": "k"})
+        assert doc["status"] == "failed"
+        assert doc["charged"] == {"paymentId": 123, "orderId": "o1"}
+    run(scenario())
+
+
+def test_expired_lease_is_taken_over_only_before_the_charge(store, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_TIMEOUT", 0.3)
+
+    async def scenario():
+        expired = utcnow() - timedelta(seconds=1)
+        await store.col.insert_one({"key": "crashed", "requestHash": "h", "status": "in_progress",
+                                    "owner": "dead", "inProgressUntil": expired, "createdAt": expired})
+        assert (await store.run("crashed", "h", Payment()))["calls"] == 1
+
+        await store.col.insert_one({"key": "charged", "requestHash": "h", "status": "in_progress", "owner": "dead",
+                                    "inProgressUntil": expired, "charged": {"paymentId": 9}, "createdAt": expired})
+        payment = Payment()
+        with pytest.raises(HTTPException) as exc:
+            await store.run("charged", "h", payment)
+        assert exc.value.status_code == 500
+        assert payment.calls == 0
+
+        live = utcnow() + timedelta(seconds=60)
+        await store.col.insert_one({"key": "busy", "requestHash": "h", "status": "in_progress",
+                                    "owner": "other", "inProgressUntil": live, "createdAt": utcnow()})
+        with pytest.raises(HTTPException) as exc:
+            await store.run("busy", "h", payment)
+        assert exc.value.status_code == 409
+    run(scenario())
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import decode_cursor, encode_cursor, keyset_filter
+
+SORT = [("createdAt", -1), ("id", 1)]
+
+
+def matches(doc: dict, query: dict) -> bool:
+    """Avalia o subconjunto de operadores que keyset_filter gera ($or, $gt, $lt, igualdade)."""
+    if "$or" in query:
+        return any(matches(doc, clause) for clause in query["$or"])
+    for field, cond in query.items():
+        if isinstance(cond, dict):
+            op, value = next(iter(cond.items()))
+            if not (doc[field] > value if op == "$gt" else doc[field] < value):
+                return False
+        elif doc[field] != cond:
+            return False
+    return True
+
+
+def test_cursor_round_trip_keeps_datetimes():
+    created = datetime(2026, 5, 1, 12, 30, tzinfo=timezone.utc)
+    cursor = encode_cursor(SORT, {"createdAt": created, "id": "b", "other": 1})
+    assert "=" not in cursor
+    assert decode_cursor(SORT, cursor) == [created, "b"]
+
+
+def test_cursor_for_another_sort_is_rejected():
+    cursor = encode_cursor(SORT, {"createdAt": datetime(2026, 5, 1, tzinfo=timezone.utc), "id": "b"})
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor([("createdAt", 1), ("id", 1)], cursor)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "e30", "bm90IGpzb24"])
+def test_garbage_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(SORT, cursor)
+    assert exc.value.status_code == 400
+
+
+def test_keyset_filter_shape():
+    assert keyset_filter(SORT, ["2026", "b"]) == {"$or": [
+        {"createdAt": {"$lt": "2026"}},
+        {"createdAt": "2026", "id": {"$gt": "b"}},
+    ]}
+
+
+def test_keyset_filter_selects_exactly_the_rest_of_the_order():
+    docs = [{"createdAt": day, "id": i} for day in (3, 2, 1) for i in ("a", "b", "c")]
+    # Já na ordem SORT: createdAt desc, id asc
+    for position, last in enumerate(docs):
+        query = keyset_filter(SORT, [last["createdAt"], last["id"]])
+        assert [d for d in docs if matches(d, query)] == docs[position + 1:]
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from catalog import Catalog
+from coupons import CouponStore
+from pricing import TOLERANCE_CENTS, PricingEngine, PricingError, Quote, from_cents, to_cents
+
+PRODUCTS = [
+    {"id": "p1", "name": "Netflix", "price": 19.9, "isAvailable": True},
+    {"id": "p2", "name": "Spotify", "price": 21.9, "isAvailable": True},
+    {"id": "off", "name": "Disney+", "price": 27.9, "isAvailable": False},
+]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def engine():
+    db = AsyncMongoMockClient()["test"]
+    return PricingEngine(db, Catalog(db), CouponStore(db))
+
+
+async def seed(engine, coupons=()):
+    await engine.db.products.insert_many([dict(p) for p in PRODUCTS])
+    for code, discount in coupons:
+        await engine.coupons.save(code, {"discount": discount, "isActive": True})
+
+
+def make_quote(coupon=None) -> Quote:
+    lines = [
+        {"productId": "p1", "name": "Netflix", "quantity": 2, "unitCents": 1990, "lineCents": 3980},
+        {"productId": "p2", "name": "Spotify", "quantity": 1, "unitCents": 2190, "lineCents": 2190},
+    ]
+    return Quote(lines, subtotal=6170, discount=617 if coupon else 0, coupon=coupon)
+
+
+def test_cents_conversion_rounds_half_up():
+    assert to_cents(19.9) == 1990
+    assert to_cents("0.005") == 1
+    assert to_cents(0.1 + 0.2) == 30
+    assert from_cents(6170) == 61.7
+
+
+def test_matching_values_have_no_mismatches():
+    quote = make_quote({"code": "DEZ"})
+    assert quote.mismatches(61.70, 6.17, 55.53, [("p1", 19.90), ("p2", 21.90)]) == []
+
+
+def test_js_rounding_within_tolerance_is_accepted():
+    quote = make_quote()
+    off = TOLERANCE_CENTS / 100
+    assert quote.mismatches(61.70 + off, 0, 61.70 - off) == []
+
+
+def test_reports_each_diverging_total():
+    quote = make_quote({"code": "DEZ"})
+    problems = quote.mismatches(61.70, 0, 61.70)
+    assert [p.split(":")[0] for p in problems] == ["discount", "total"]
+    assert "esperado 6.17" in problems[0]
+
+
+def test_reports_tampered_item_price_and_ignores_unknown_items():
+    quote = make_quote()
+    problems = quote.mismatches(61.70, 0, 61.70, [("p1", 0.01), ("p2", 21.90), ("unknown", 1.0)])
+    assert problems == ["preço de p1: enviado 0.01, esperado 19.90"]
+
+
+def test_quote_rounds_the_coupon_discount_to_cents(engine):
+    async def scenario():
+        await seed(engine, [("QUINZE", 0.15)])
+        quote = await engine.quote([("p1", 3)], "quinze")
+        # 59,70 * 15% = 8,955 -> 8,96
+        assert (quote.subtotal, quote.discount, quote.total) == (5970, 896, 5074)
+        assert quote.as_dict()["couponCode"] == "QUINZE"
+    run(scenario())
+
+
+def test_quote_caps_the_discount_at_the_subtotal(engine):
+    async def scenario():
+        # Cupom antigo gravado antes da validação do admin (discount <= 1)
+        await seed(engine, [("TUDO", 1.5)])
+        quote = await engine.quote([("p1", 1), ("p2", 1)], "TUDO")
+        assert (quote.subtotal, quote.discount, quote.total) == (4180, 4180, 0)
+    run(scenario())
+
+
+@pytest.mark.parametrize("items, coupon", [
+    ([("p1", 0)], None),
+    ([("p1", 2), ("p2", -1)], None),
+    ([("nope", 1)], None),
+    ([("p1", 1), ("off", 1)], None),
+    ([("p1", 1)], "NAOEXISTE"),
+])
+def test_quote_rejects_invalid_carts(engine, items, coupon):
+    async def scenario():
+        await seed(engine)
+        with pytest.raises(PricingError):
+            await engine.quote(items, coupon)
+    run(scenario())
+
+
+def test_quote_merges_duplicate_lines(engine):
+    async def scenario():
+        await seed(engine)
+        await engine.catalog.load()
+        quote = await engine.quote([("p1", 1), ("p2", 1), ("p1", 2)])
+        assert [(line["productId"], line["quantity"], line["lineCents"]) for line in quote.lines] == \
+            [("p1", 3, 5970), ("p2", 1, 2190)]
+        assert quote.subtotal == 8160
+    run(scenario())
+
+
+def test_tampered_price_is_rejected_before_the_gateway(api, call, monkeypatch):
+    async def insert():
+        await server.db.products.insert_many([dict(p) for p in PRODUCTS])
+        await server.catalog.load()
+    call(insert)
+    charges = []
+
+    async def create_payment(*args, **kwargs):
+        charges.append(args)
+        raise AssertionError("gateway chamado")
+    monkeypatch.setattr(server.gateway, "create_payment", create_payment)
+
+    res = api.post("/api/payments/process", json={
+        "paymentData": {"paymentMethodId": "pix", "transactionAmount": 0.5},
+        "customerInfo": {"email": "ana@example.com", "firstName": "Ana", "lastName": "Silva", "phone": "11999999999",
+                         "address": "Rua A, 1", "city": "São Paulo", "postalCode": "01000-000", "country": "BR",
+                         "documentNumber": "12345678909"},
+        "items": [{"productId": "p1", "name": "Netflix", "price": 0.25, "quantity": 2}],
+        "subtotal": 0.5, "discount": 0, "total": 0.5, "sessionId": "s1", "paymentMethod": "pix",
+    })
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Os valores do carrinho mudaram, revise o pedido"
+    assert charges == []
+    assert call(server.db.orders.count_documents, {}) == 0
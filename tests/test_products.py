@@ -0,0 +1,38 @@
+import server
+
+PRODUCTS = [
+    {"id": "a", "name": "Netflix Premium", "platform": "Netflix", "price": 29.9, "isAvailable": True},
+    {"id": "b", "name": "Spotify Premium", "platform": "Spotify", "price": 19.9, "isAvailable": True},
+    {"id": "c", "name": "Disney+", "platform": "Disney+", "price": 27.9, "isAvailable": False},
+]
+
+
+def seed(call):
+    async def insert():
+        await server.db.products.insert_many([dict(p) for p in PRODUCTS])
+        await server.catalog.load()
+    call(insert)
+
+
+def test_unfiltered_list_comes_from_the_snapshot(api, call):
+    seed(call)
+    res = api.get("/api/products")
+    assert [p["id"] for p in res.json()] == ["a", "b", "c"]
+    assert res.headers["etag"] == server.catalog.snapshot.etag
+
+
+def test_sort_alone_is_applied(api, call):
+    seed(call)
+    assert [p["price"] for p in api.get("/api/products", params={"sort": "-price"}).json()] == [29.9, 27.9, 19.9]
+    assert [p["name"] for p in api.get("/api/products", params={"sort": "name"}).json()] == \
+        ["Disney+", "Netflix Premium", "Spotify Premium"]
+
+
+def test_filters_and_cursor_pagination(api, call):
+    seed(call)
+    first = api.get("/api/products", params={"limit": 1, "sort": "price"})
+    assert [p["id"] for p in first.json()] == ["b"]
+    rest = api.get("/api/products", params={"limit": 5, "sort": "price", "cursor": first.headers["x-next-cursor"]})
+    assert [p["id"] for p in rest.json()] == ["c", "a"]
+    assert "x-next-cursor" not in rest.headers
+    assert [p["id"] for p in api.get("/api/products", params={"isAvailable": "true"}).json()] == ["b", "a"]
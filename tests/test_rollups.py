@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import rollups
+from rollups import add_totals, buckets, created_increments, merge_increments, present, status_increments
+
+ORDER = {
+    "id": "o1",
+    "createdAt": datetime(2026, 3, 10, 2, 15, tzinfo=timezone.utc),
+    "status": "pending",
+    "paymentMethod": "pix",
+    "total": 45.0,
+    "items": [
+        {"productId": "p1", "price": 19.9, "quantity": 2},
+        {"productId": "p2", "price": 9.9, "quantity": 1},
+    ],
+}
+
+
+def test_pending_status_only_counts_orders_by_status():
+    assert status_increments(ORDER, "pending", 1) == {"byStatus.pending.count": 1, "byStatus.pending.amountCents": 4500}
+
+
+def test_approved_status_adds_revenue_by_method_and_product():
+    inc = status_increments(ORDER, "approved", 1)
+    assert inc["revenueCents"] == 4500
+    assert inc["byMethod.pix.approved"] == 1
+    assert inc["byMethod.pix.revenueCents"] == 4500
+    # Por produto: preço de tabela x quantidade, antes do cupom
+    assert inc["byProduct.p1.quantity"] == 2
+    assert inc["byProduct.p1.revenueCents"] == 3980
+    assert inc["byProduct.p2.revenueCents"] == 990
+
+
+def test_status_change_moves_counters_and_drops_zeros():
+    inc = merge_increments(status_increments(ORDER, "pending", -1), status_increments(ORDER, "approved", 1))
+    assert inc["byStatus.pending.count"] == -1
+    assert inc["byStatus.approved.count"] == 1
+    # Ida e volta se anulam: nada para gravar
+    assert merge_increments(status_increments(ORDER, "approved", 1), status_increments(ORDER, "approved", -1)) == {}
+
+
+def test_created_increments_count_the_order_once():
+    inc = created_increments(ORDER)
+    assert inc["orders"] == 1
+    assert inc["byMethod.pix.count"] == 1
+    assert inc["byStatus.pending.count"] == 1
+
+
+def test_buckets_follow_the_report_timezone(monkeypatch):
+    assert [key for _, key, _ in buckets(ORDER["createdAt"])] == ["hour:2026-03-10T02:00:00+00:00", "day:2026-03-10"]
+    monkeypatch.setattr(rollups, "ROLLUP_TIMEZONE", ZoneInfo("America/Sao_Paulo"))
+    (_, hour, hour_start), (_, day, day_start) = buckets(ORDER["createdAt"])
+    # 02:15 UTC ainda é 9 de março em São Paulo (UTC-3)
+    assert hour == "hour:2026-03-09T23:00:00-03:00"
+    assert day == "day:2026-03-09"
+    assert day_start == datetime(2026, 3, 9, 3, tzinfo=timezone.utc)
+    assert hour_start == datetime(2026, 3, 10, 2, tzinfo=timezone.utc)
+
+
+def test_totals_and_presentation_in_reais():
+    totals = {}
+    add_totals(totals, {"orders": 2, "revenueCents": 1990, "byMethod": {"pix": {"revenueCents": 1990}}, "period": "day"})
+    add_totals(totals, {"orders": 1, "revenueCents": 10, "byMethod": {"card": {"revenueCents": 10}}})
+    assert present(totals) == {"orders": 3, "revenue": 20.0, "byMethod": {"pix": {"revenue": 19.9}, "card": {"revenue": 0.1}}}
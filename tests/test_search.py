@@ -0,0 +1,80 @@
+from catalog import CatalogSnapshot
+from search import SearchIndex, fold, tokenize
+
+PRODUCTS = [
+    {"id": "1", "name": "Netflix Premium", "platform": "Netflix", "price": 55.9,
+     "description": "Filmes e séries em 4 telas", "features": ["Ultra HD"]},
+    {"id": "2", "name": "Spotify Família", "platform": "Spotify", "price": 34.9,
+     "description": "Música sem anúncios", "features": ["Offline"]},
+    {"id": "3", "name": "Netflix Básico", "platform": "Netflix", "price": 25.9,
+     "description": "Filmes e séries", "features": []},
+    {"id": "4", "name": "Deezer Premium", "platform": "Deezer", "price": 22.9,
+     "description": "Música em alta qualidade", "features": ["Netflix de música"]},
+]
+
+
+def make_index(products=PRODUCTS):
+    index = SearchIndex()
+    snapshot = CatalogSnapshot([dict(p) for p in products])
+    index.on_catalog_change(None, snapshot)
+    return index, snapshot
+
+
+def ids(result):
+    return [p["id"] for p in result["items"]]
+
+
+def test_fold_and_tokenize_ignore_accents_and_case():
+    assert fold("Música FAMÍLIA") == "musica familia"
+    assert tokenize("Disney+ / HBO-Max 4K") == ["disney", "hbo", "max", "4k"]
+
+
+def test_accent_insensitive_match():
+    index, _ = make_index()
+    assert ids(index.search("musica")) == ids(index.search("MÚSICA")) == ["4", "2"]
+
+
+def test_prefix_match_and_field_weight():
+    index, _ = make_index()
+    # Nome vale mais que features: os dois Netflix antes do Deezer
+    assert ids(index.search("netf")) == ["3", "1", "4"]
+
+
+def test_all_terms_must_match():
+    index, _ = make_index()
+    assert ids(index.search("netflix premium")) == ["1", "4"]
+    assert index.search("netflix zzz")["total"] == 0
+
+
+def test_platform_filter_keeps_facets_of_other_platforms():
+    index, _ = make_index()
+    result = index.search("premium", platform="netflix")
+    assert ids(result) == ["1"]
+    assert result["total"] == 1
+    assert result["facets"]["platform"] == {"Deezer": 1, "Netflix": 1}
+
+
+def test_price_range_and_limit():
+    index, _ = make_index()
+    result = index.search("", min_price=20, max_price=30, limit=1)
+    assert result["total"] == 2
+    assert len(result["items"]) == 1
+
+
+def test_browse_without_terms_orders_by_name():
+    index, _ = make_index()
+    result = index.search("", platform="Netflix")
+    assert ids(result) == ["3", "1"]
+    assert result["total"] == 2
+    assert result["facets"]["platform"] == {"Netflix": 2, "Deezer": 1, "Spotify": 1}
+
+
+def test_catalog_change_reindexes_and_invalidates_cache():
+    index, old = make_index()
+    assert ids(index.search("spotify")) == ["2"]
+    changed = [p for p in PRODUCTS if p["id"] != "2"] + [{**PRODUCTS[0], "id": "5", "name": "Globoplay Premium",
+                                                          "platform": "Globoplay"}]
+    index.on_catalog_change(old, CatalogSnapshot(changed))
+    assert index.search("spotify")["total"] == 0
+    assert ids(index.search("globo")) == ["5"]
+    assert "spotify" not in index._vocab
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from catalog import Catalog
+from stock import OutOfStock, StockManager
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def manager():
+    db = AsyncMongoMockClient()["test"]
+    return StockManager(db, Catalog(db))
+
+
+def test_untracked_products_are_not_reserved(manager):
+    async def scenario():
+        assert await manager.reserve("o1", [{"productId": "p1", "quantity": 5}]) is False
+        assert await manager.available("p1") is None
+    run(scenario())
+
+
+def test_reserve_combines_shards_and_release_gives_back(manager):
+    async def scenario():
+        await manager.set_stock("p1", 8, shards=4)
+        # Nenhum shard sozinho tem 8: junta todos
+        assert await manager.reserve("o1", [{"productId": "p1", "quantity": 8}])
+        assert await manager.available("p1") == 0
+        with pytest.raises(OutOfStock):
+            await manager.reserve("o2", [{"productId": "p1", "quantity": 1}])
+        assert await manager.release("o1")
+        assert await manager.available("p1") == 8
+        # Liberar de novo não devolve duas vezes
+        assert not await manager.release("o1")
+        assert await manager.available("p1") == 8
+    run(scenario())
+
+
+def test_release_after_lowering_the_shard_count_keeps_the_units(manager):
+    async def scenario():
+        await manager.set_stock("p1", 8, shards=4)
+        assert await manager.reserve("o1", [{"productId": "p1", "quantity": 8}])
+        # Os shards 1-3 usados pela reserva deixam de existir
+        await manager.set_stock("p1", 2, shards=1)
+        assert await manager.release("o1")
+        assert await manager.available("p1") == 10
+        assert [s["shard"] async for s in manager.shards.find({"productId": "p1"})] == [0]
+    run(scenario())
+
+
+def test_failed_reservation_gives_back_earlier_items(manager):
+    async def scenario():
+        await manager.set_stock("p1", 3, shards=2)
+        await manager.set_stock("p2", 1, shards=1)
+        with pytest.raises(OutOfStock):
+            await manager.reserve("o1", [{"productId": "p1", "quantity": 2}, {"productId": "p2", "quantity": 2}])
+        assert await manager.available("p1") == 3
+        assert await manager.available("p2") == 1
+    run(scenario())